@@ -152,6 +152,8 @@ LANGUAGE_DICT = {
 
 MESSAGE_PADDING = 16
 MESSAGE_MAXIMUM_HEIGHT = 800
+# The height of the message which is being streamed is adjusted at most once in this milliseconds
+MESSAGE_HEIGHT_UPDATE_INTERVAL_MS = 50
 MESSAGE_MAXIMUM_HEIGHT_RANGE = 300, 1000
 
 CONTEXT_DELIMITER = "\n" * 2
@@ -304,6 +306,9 @@ IMAGE_FILE_EXT_LIST = [".png", ".jpg", ".jpeg", ".gif", ".bmp"]
 IMAGE_FILE_EXT_LIST_STR = "Image File (*.png *.jpg *.jpeg *.gif *.bmp)"
 TEXT_FILE_EXT_LIST_STR = "Text File (*.txt)"
 JSON_FILE_EXT_LIST_STR = "JSON File (*.json)"
+JSONL_FILE_EXT_LIST_STR = "JSON Lines File (*.jsonl)"
+# The number of threads rendered at the same time when exporting the threads as txt/html files in ZIP
+ZIP_EXPORT_MAX_WORKERS = 4
 CSV_FILE_EXT_LIST_STR = "CSV File (*.csv)"
 READ_FILE_EXT_LIST_STR = f"{TEXT_FILE_EXT_LIST_STR};;{IMAGE_FILE_EXT_LIST_STR}"
 
@@ -318,11 +323,40 @@ NOTIFIER_MAX_CHAR = 100
 # DB
 DB_NAME_REGEX = "[a-zA-Z0-9]{1,20}"
 
+# The maximum number of writes the writer thread commits in one transaction (WAL mode)
+DB_WRITER_BATCH_SIZE = 256
+# The number of threads inserted in one transaction when importing
+DB_IMPORT_BATCH_SIZE = 100
+
+# Content-addressed store of the image data, which is in the config directory
+IMAGE_BLOB_STORE_DIR_NAME = "image_blobs"
+# The number of images moved into the store in one transaction
+IMAGE_BLOB_MIGRATION_BATCH_SIZE = 20
+
+# Previews of the images in the history, which are in the separate table
+IMAGE_THUMBNAIL_TABLE_NAME = "image_thumbnail_tb"
+# Maximum width and height of the preview in the history list and the one shown when the row is clicked
+IMAGE_THUMBNAIL_SIZES = 48, 512
+IMAGE_THUMBNAIL_QUALITY = 80
+# The number of images whose previews are made in one transaction
+IMAGE_THUMBNAIL_BATCH_SIZE = 10
+
 THREAD_TABLE_NAME_OLD = "conv_tb"
 THREAD_TRIGGER_NAME_OLD = "conv_tr"
 MESSAGE_TABLE_NAME_OLD = "conv_unit_tb"
 
+# Files attached to the messages (e.g. images pasted into the prompt), saved only once by the hash of their content
 CHAT_FILE_TABLE_NAME = "chat_file_tb"
+# Links of the files to the messages, in the order they are attached
+CHAT_FILE_MESSAGE_TABLE_NAME = "chat_file_message_tb"
+CHAT_FILE_MESSAGE_THREAD_ID_INDEX_NAME = "chat_file_message_thread_id_idx"
+CHAT_FILE_MESSAGE_FILE_ID_INDEX_NAME = "chat_file_message_file_id_idx"
+# Removes the file when no message is linked to it anymore
+CHAT_FILE_MESSAGE_DELETED_TR_NAME = "chat_file_message_deleted_tr"
+# The image types which are sent as they are, the others are converted to PNG once when attached
+CHAT_FILE_MIME_TYPES = ["image/png", "image/jpeg", "image/gif", "image/webp"]
+# The number of the encoded attachments (data URLs) kept in memory to send the history again
+CHAT_FILE_URL_CACHE_SIZE = 32
 
 THREAD_TABLE_NAME = "thread_tb"
 THREAD_TRIGGER_NAME = "thread_tr"
@@ -338,8 +372,77 @@ THREAD_MESSAGE_INSERTED_TR_NAME = "thread_message_inserted_tr"
 THREAD_MESSAGE_UPDATED_TR_NAME = "thread_message_updated_tr"
 THREAD_MESSAGE_DELETED_TR_NAME = "thread_message_deleted_tr"
 
+# The names of the triggers suspended in the current transaction (e.g. while importing the threads)
+# The triggers are never dropped at runtime, they check this table instead
+TRIGGER_GUARD_TABLE_NAME = "trigger_guard_tb"
+
 THREAD_ORDERBY = "update_dt"
 
+# Index for reading the messages of the thread page by page
+MESSAGE_THREAD_ID_INDEX_NAME = "message_thread_id_idx"
+# Indexes for the order of the thread and image lists and the selection of the favorite messages
+THREAD_UPDATE_DT_INDEX_NAME = "thread_update_dt_idx"
+THREAD_INSERT_DT_INDEX_NAME = "thread_insert_dt_idx"
+MESSAGE_FAVORITE_INDEX_NAME = "message_favorite_idx"
+IMAGE_INSERT_DT_INDEX_NAME = "image_insert_dt_idx"
+# Index of the messages whose tokens are not counted yet
+MESSAGE_TOKEN_COUNT_INDEX_NAME = "message_token_count_idx"
+# The number of messages loaded at once in the chat browser
+MESSAGE_PAGE_SIZE = 50
+
+# Full-text index of the message content
+MESSAGE_FTS_TABLE_NAME = "message_fts"
+
+MESSAGE_FTS_INSERTED_TR_NAME = "message_fts_inserted_tr"
+MESSAGE_FTS_UPDATED_TR_NAME = "message_fts_updated_tr"
+MESSAGE_FTS_DELETED_TR_NAME = "message_fts_deleted_tr"
+
+# The trigram tokenizer can't match the text shorter than 3 characters
+MESSAGE_FTS_MIN_QUERY_LENGTH = 3
+MESSAGE_SEARCH_SNIPPET_LENGTH = 32
+# The content search of the chat list runs when the typing pauses for this milliseconds, and finds this many threads at most
+THREAD_CONTENT_SEARCH_DELAY_MS = 300
+THREAD_CONTENT_SEARCH_LIMIT = 500
+
+# Statistics of each thread, kept up to date by the triggers on the message table
+THREAD_STATS_TABLE_NAME = "thread_stats_tb"
+
+THREAD_STATS_INSERTED_TR_NAME = "thread_stats_message_inserted_tr"
+THREAD_STATS_UPDATED_TR_NAME = "thread_stats_message_updated_tr"
+THREAD_STATS_DELETED_TR_NAME = "thread_stats_message_deleted_tr"
+
+# Columns of the statistics which can be shown in the chat list
+THREAD_STATS_COLUMNS = ["message_count", "total_tokens", "last_model", "last_message"]
+# The length of the preview of the last message
+THREAD_STATS_PREVIEW_LENGTH = 100
+
+# Archive of the messages of the threads which haven't been updated for long
+# It is the separate database file next to the main one (e.g. conv_archive.db), attached to each connection
+THREAD_ARCHIVE_DB_SUFFIX = "_archive"
+THREAD_ARCHIVE_SCHEMA_NAME = "archive"
+MESSAGE_ARCHIVE_TABLE_NAME = "message_archive_tb"
+MESSAGE_ARCHIVE_THREAD_ID_INDEX_NAME = "message_archive_thread_id_idx"
+# The number of threads archived in one transaction
+THREAD_ARCHIVE_BATCH_SIZE = 20
+THREAD_ARCHIVE_DAYS_RANGE = 1, 3650
+
+# Snapshots of the database taken with the online backup API, which are in the config directory
+DB_BACKUP_DIR_NAME = "backups"
+# The number of pages copied in one step of the backup, so the writes of the app wait only for a step
+DB_BACKUP_PAGES_PER_STEP = 1024
+# How often to check whether the scheduled snapshot is due
+DB_BACKUP_CHECK_INTERVAL_MS = 10 * 60 * 1000
+DB_BACKUP_INTERVAL_HOURS_RANGE = 1, 24 * 30
+DB_BACKUP_KEEP_COUNT_RANGE = 1, 100
+
+# Responses of the deterministic requests (temperature 0), which are reused when the same request is sent again
+RESPONSE_CACHE_TABLE_NAME = "response_cache_tb"
+RESPONSE_CACHE_ACCESS_DT_INDEX_NAME = "response_cache_access_dt_idx"
+# The cached response is used only for the days after it's saved
+RESPONSE_CACHE_TTL_DAYS = 30
+# The least recently used responses are removed when the cache gets bigger than this
+RESPONSE_CACHE_MAX_SIZE = 32 * 1024 * 1024
+
 PROPERTY_PROMPT_GROUP_TABLE_NAME_OLD = "prop_prompt_grp_tb"
 PROPERTY_PROMPT_UNIT_TABLE_NAME_OLD = "prop_prompt_unit_tb"
 TEMPLATE_PROMPT_GROUP_TABLE_NAME_OLD = "template_prompt_grp_tb"
@@ -406,6 +509,40 @@ OPENAI_DEFAULT_IMAGE_MODEL = "dall-e-3"
 
 DEFAULT_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+# The chat engine runs the requests in one asyncio event loop thread
+# The number of the requests which are sent at the same time, the others wait for their turn
+CHAT_ENGINE_MAX_CONCURRENT_REQUESTS = 8
+# The number of the chunks of each stream which are sent to the UI but not shown yet, the stream is paused when it's reached
+CHAT_ENGINE_MAX_PENDING_CHUNKS = 64
+
+# The chunks of the stream are sent to the UI together at most once in this seconds (a display frame)
+CHUNK_FLUSH_INTERVAL_SECONDS = 1 / 60
+# or earlier if the collected chunks are this long
+CHUNK_FLUSH_MAX_CHARS = 2048
+
+# The HTTP connections shared by the app (See util/http_client.py)
+# The hosts whose connections are kept by the session of requests
+HTTP_POOL_HOSTS = 10
+# The connections kept alive for each host (requests) or in total (httpx)
+HTTP_POOL_MAXSIZE = 20
+# The idle connections are closed after this
+HTTP_KEEPALIVE_SECONDS = 60
+HTTP_CONNECT_TIMEOUT_SECONDS = 10
+# For the downloads (e.g. the images and the release notes)
+HTTP_READ_TIMEOUT_SECONDS = 60
+# For the LLMs, which may take long to answer (same as the default of OpenAI)
+HTTP_LLM_READ_TIMEOUT_SECONDS = 600
+# The APIs which are connected in advance when their model is selected, by the display name of the API
+HTTP_PREWARM_URLS = {
+    "OpenAI": "https://api.openai.com",
+    "Gemini": "https://generativelanguage.googleapis.com",
+    "Anthropic": "https://api.anthropic.com",
+    "Mistral AI": "https://api.mistral.ai",
+    "Codestral": "https://codestral.mistral.ai",
+    "Cohere": "https://api.cohere.ai",
+    "OpenRouter": "https://openrouter.ai",
+}
+
 # This has to be managed separately since some of the arguments are different with usual models
 O1_MODELS = ["o1-preview", "o1-mini"]
 
@@ -900,10 +1037,50 @@ G4F_USE_CHAT_HISTORY = True
 
 G4F_DEFAULT_IMAGE_MODEL = "flux"
 
+# Health of each G4F provider for each model, which orders the providers tried when the provider is Auto
+PROVIDER_HEALTH_TABLE_NAME = "provider_health_tb"
+# The weight of the latest run in the moving averages
+PROVIDER_HEALTH_ALPHA = 0.3
+# The older runs lose half of their weight every this hours, so the recovered providers get tried again
+PROVIDER_HEALTH_HALF_LIFE_HOURS = 6
+# Seconds added to the time to first token for the error rate of 1 when the providers are ordered
+PROVIDER_HEALTH_ERROR_PENALTY_SECONDS = 30
+# The number of the providers tried for one request when the provider is Auto
+G4F_AUTO_MAX_ATTEMPTS = 5
+
+# Rate limit of each provider (See ProviderRateLimiter)
+# The times the request is sent again after 429 before the error is shown
+RATE_LIMIT_MAX_RETRIES = 5
+# Seconds to wait after the first 429 without Retry-After, doubled for each 429 in a row
+RATE_LIMIT_BACKOFF_BASE_SECONDS = 1
+RATE_LIMIT_BACKOFF_MAX_SECONDS = 60
+
 # Constants related to the number of messages LLM will store
 MAXIMUM_MESSAGES_IN_PARAMETER = 40
 MAXIMUM_MESSAGES_IN_PARAMETER_RANGE = 2, 1000
 
+# Constants related to the token budget of the messages LLM will get
+# The tokenizer of the models which tiktoken doesn't know
+CONTEXT_DEFAULT_ENCODING = "cl100k_base"
+# The context window of the models which LiteLLM doesn't know (e.g. G4F models)
+CONTEXT_DEFAULT_WINDOW_TOKENS = 8192
+# Tokens left for the reply if max_tokens is not used
+CONTEXT_REPLY_RESERVED_TOKENS = 4096
+# Tokens of the role and the separators of each message
+CONTEXT_MESSAGE_OVERHEAD_TOKENS = 4
+# Tokens of each image (1024x1024 image in high detail)
+CONTEXT_IMAGE_TOKENS = 765
+# The number of the messages saved before the token count is kept, whose tokens are counted in one transaction
+CONTEXT_TOKEN_COUNT_BATCH_SIZE = 500
+
+# Headless batch runner (pyqt-openai-batch)
+BATCH_DEFAULT_CONCURRENCY = 4
+# The file of the ids of the finished requests next to the input file, to resume the interrupted run
+BATCH_CHECKPOINT_SUFFIX = ".checkpoint"
+
+# The tag of the replies of the compare mode, which sends one prompt to several models at once
+COMPARE_MESSAGE_TAG = "compare"
+
 # llamaIndex
 LLAMA_INDEX_DEFAULT_SUPPORTED_FORMATS_LIST = [".txt"]
 LLAMA_INDEX_DEFAULT_ALL_SUPPORTED_FORMATS_LIST = [".txt", ".docx", ".hwp", ".ipynb", ".csv", ".jpeg", ".jpg", ".mbox", ".md", ".mp3", ".mp4", ".pdf", ".png", ".ppt", ".pptx", ".pptm"]
@@ -1101,6 +1278,14 @@ CONFIG_DATA = {
         "lang": "English",
         # DB
         "db": "conv",
+        "db_wal_mode": False,
+        "image_blob_store": False,
+        "archive_threads": False,
+        "archive_thread_days": 365,
+        "db_backup": False,
+        "db_backup_interval_hours": 24,
+        "db_backup_keep_count": 7,
+        "response_cache": False,
         # GUI & Application settings
         "TAB_IDX": 0,
         "show_chat_list": True,
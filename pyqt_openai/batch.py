@@ -0,0 +1,250 @@
+"""Headless batch runner, which sends the requests in the JSONL file without the window.
+
+Each line of the input is a JSON object of one request. Only "prompt" is required, the others default to the settings of the application:
+
+    {"id": "1", "prompt": "Hello", "model": "gpt-4o", "system": "...", "temperature": 0, "is_g4f": false, "provider": "Auto", "thread": "name"}
+
+If --template is given, the prompt is made from it with the fields of each line instead (e.g. "Translate {text} to {lang}").
+The ids of the finished requests are saved in the checkpoint file, so running it again with the same input resumes where it stopped.
+The failed requests are not saved in the checkpoint, so they are tried again.
+The lines which can't be read (malformed JSON or the fields missing in the template) are failed requests, not the end of the run.
+
+The requests to each provider are kept under --rate-limit and --token-limit, and the ones which get 429 wait and are sent again (See ProviderRateLimiter).
+
+Usage: pyqt-openai-batch requests.jsonl --output results.jsonl --concurrency 8 --rate-limit OpenAI=60 --token-limit OpenAI=30000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from pyqt_openai import (
+    BATCH_CHECKPOINT_SUFFIX,
+    BATCH_DEFAULT_CONCURRENCY,
+    DEFAULT_API_CONFIGS,
+)
+from pyqt_openai.config_loader import CONFIG_MANAGER
+from pyqt_openai.globals import DB, RATE_LIMITER
+from pyqt_openai.models import ChatMessageContainer
+from pyqt_openai.util.common import get_argument, get_response, set_api_key
+
+
+def load_api_keys():
+    """Set the API keys of the settings, but not over the ones which are already in the environment."""
+    for config in DEFAULT_API_CONFIGS:
+        api_key = CONFIG_MANAGER.get_general_property(config["env_var_name"])
+        if api_key and not os.environ.get(config["env_var_name"]):
+            set_api_key(config["env_var_name"], api_key)
+
+
+def read_requests(filename, template=None):
+    """Yield the requests in the JSONL file with their ids (the line number if there is no "id").
+    The request of the line which can't be read has "error" instead of being sent.
+    """
+    with open(filename, encoding="utf-8") as f:
+        for i, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("The line is not a JSON object")
+            except ValueError as e:
+                yield {"id": str(i), "error": f"Line {i}: {e}"}
+                continue
+            request["id"] = str(request.get("id", i))
+            if template is not None:
+                try:
+                    request["prompt"] = template.format_map(request)
+                except (KeyError, IndexError, ValueError) as e:
+                    request["error"] = f"Line {i}: The template can't be filled: {e!r}"
+            yield request
+
+
+def read_checkpoint(filename) -> set[str]:
+    if not os.path.exists(filename):
+        return set()
+    with open(filename, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def run_request(request) -> ChatMessageContainer:
+    """Send the request and return the reply. This runs in the thread of the pool."""
+    is_g4f = bool(request.get("is_g4f", False))
+    model = request.get("model") or CONFIG_MANAGER.get_general_property("g4f_model" if is_g4f else "model")
+    provider = request.get("provider") or CONFIG_MANAGER.get_general_property("provider")
+
+    def get_setting(key):
+        return request.get(key, CONFIG_MANAGER.get_general_property(key))
+
+    args = get_argument(
+        model,
+        get_setting("system"),
+        list(request.get("messages", [])),
+        request["prompt"],
+        get_setting("temperature"),
+        get_setting("top_p"),
+        get_setting("frequency_penalty"),
+        get_setting("presence_penalty"),
+        False,
+        get_setting("use_max_tokens"),
+        get_setting("max_tokens"),
+        [],
+        is_g4f=is_g4f,
+    )
+    response = get_response(args, is_g4f, provider=provider)
+
+    reply = ChatMessageContainer(role="assistant", model=model, is_g4f=int(is_g4f), finish_reason="stop")
+    if isinstance(response, str):
+        reply.content = response
+    else:
+        # G4F returns the whole response
+        reply.content = response.choices[0].message.content or ""
+        reply.model = response.model or model
+        reply.provider = response.provider
+    return reply
+
+
+def save_to_db(request, reply: ChatMessageContainer) -> list[Future]:
+    """Save the request and the reply as a new thread, and return the Futures of the messages which are being saved."""
+    thread_id = DB.insertThread(request.get("thread") or request["prompt"][:50])
+    reply.thread_id = thread_id
+    return [
+        DB.insertMessage(ChatMessageContainer(thread_id=thread_id, role="user", content=request["prompt"], model=reply.model), wait=False),
+        DB.insertMessage(reply, wait=False),
+    ]
+
+
+def run(
+    input_filename, output_filename=None, save_db=False, concurrency=BATCH_DEFAULT_CONCURRENCY,
+    rate_limits=None, checkpoint_filename=None, template=None, token_limits=None,
+):
+    """Run the requests of the input file and return the number of the failed ones.
+
+    :param rate_limits: Requests per minute of each provider
+    :param token_limits: Tokens per minute of each provider
+    """
+    checkpoint_filename = checkpoint_filename or input_filename + BATCH_CHECKPOINT_SUFFIX
+    done_ids = read_checkpoint(checkpoint_filename)
+    rate_limits = rate_limits or {}
+    token_limits = token_limits or {}
+    for provider in set(rate_limits) | set(token_limits):
+        RATE_LIMITER.set_limit(provider, rate_limits.get(provider), token_limits.get(provider))
+
+    requests = (request for request in read_requests(input_filename, template) if request["id"] not in done_ids)
+    output_file = open(output_filename, "a", encoding="utf-8") if output_filename else None
+    checkpoint_file = open(checkpoint_filename, "a", encoding="utf-8")
+    finished_count = failed_count = 0
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            running = {}
+            while True:
+                # Only a few more than the workers are queued, not to read the whole file at once
+                for request in requests:
+                    if "error" in request:
+                        # Failed without being sent
+                        future = Future()
+                        future.set_exception(ValueError(request["error"]))
+                    else:
+                        future = executor.submit(run_request, request)
+                    running[future] = request
+                    if len(running) >= concurrency * 2:
+                        break
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                # The results are written in this thread only
+                for future in finished:
+                    request = running.pop(future)
+                    result = {"id": request["id"], "prompt": request.get("prompt")}
+                    try:
+                        reply = future.result()
+                        result.update(model=reply.model, provider=reply.provider, content=reply.content)
+                        if save_db:
+                            # The request is saved in the checkpoint only after it's in the database
+                            for saved in save_to_db(request, reply):
+                                saved.result()
+                    except Exception as e:
+                        failed_count += 1
+                        result["error"] = str(e)
+                    if output_file:
+                        output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+                        output_file.flush()
+                    if "error" not in result:
+                        # After the result is written, so the finished request is never lost (but may be written twice)
+                        checkpoint_file.write(request["id"] + "\n")
+                        checkpoint_file.flush()
+                    finished_count += 1
+                    print(
+                        f"{finished_count} done ({failed_count} failed, {len(done_ids)} skipped): {request['id']}"
+                        + (f" - {result['error']}" if "error" in result else ""),
+                        file=sys.stderr,
+                    )
+    finally:
+        if output_file:
+            output_file.close()
+        checkpoint_file.close()
+        DB.close()
+    return failed_count
+
+
+def parse_rate_limits(values, unit="REQUESTS_PER_MINUTE") -> dict[str, float]:
+    rate_limits = {}
+    for value in values or []:
+        provider, _, per_minute = value.rpartition("=")
+        if not provider:
+            raise ValueError(f"Rate limit must be PROVIDER={unit}: {value}")
+        rate_limits[provider] = float(per_minute)
+    return rate_limits
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="pyqt-openai-batch",
+        description="Send the requests in the JSONL file with the settings of pyqt-openai, without the window.",
+    )
+    parser.add_argument("input", help="JSONL file of the requests")
+    parser.add_argument("-o", "--output", help="JSONL file to append the results to")
+    parser.add_argument("--db", action="store_true", help="Save each request and its reply as a new thread in the database")
+    parser.add_argument("-c", "--concurrency", type=int, default=BATCH_DEFAULT_CONCURRENCY, help="Number of the requests sent at the same time")
+    parser.add_argument(
+        "-r", "--rate-limit", action="append", metavar="PROVIDER=RPM",
+        help='Requests per minute of the provider (e.g. OpenAI=60, G4F=10). The provider is "display_name" of the API or the name of the G4F provider',
+    )
+    parser.add_argument(
+        "--token-limit", action="append", metavar="PROVIDER=TPM",
+        help="Tokens per minute of the provider, counted from the messages of each request (e.g. OpenAI=30000)",
+    )
+    parser.add_argument("--checkpoint", help=f"File of the finished request ids (default: the input file + {BATCH_CHECKPOINT_SUFFIX})")
+    parser.add_argument("-t", "--template", help="Prompt template filled with the fields of each request (e.g. \"Summarize: {text}\")")
+    args = parser.parse_args()
+
+    if not args.output and not args.db:
+        parser.error("Set --output or --db (or both) to save the results")
+
+    try:
+        rate_limits = parse_rate_limits(args.rate_limit)
+        token_limits = parse_rate_limits(args.token_limit, "TOKENS_PER_MINUTE")
+    except ValueError as e:
+        parser.error(str(e))
+
+    load_api_keys()
+    failed_count = run(
+        args.input,
+        output_filename=args.output,
+        save_db=args.db,
+        concurrency=max(args.concurrency, 1),
+        rate_limits=rate_limits,
+        checkpoint_filename=args.checkpoint,
+        template=args.template,
+        token_limits=token_limits,
+    )
+    sys.exit(1 if failed_count else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -86,6 +86,8 @@ class AIChatUnit(ChatUnit):
 
     def afterResponse(self, arg):
         self.toggleGUI(True)
+        # The message can be the favorite after it's saved (See setResponseId)
+        self.__favoriteBtn.setEnabled(bool(arg.id))
         self.__result_info = arg
         self._nameLbl.setText(arg.model)
         self.__favorite(True if arg.favorite else False, insert_f=False)
@@ -96,6 +98,10 @@ class AIChatUnit(ChatUnit):
             self.getLbl().setMarkdown(arg.content)
         self.getLbl().adjustBrowserHeight()
 
+    def setResponseId(self, id):
+        self.__result_info.id = id
+        self.__favoriteBtn.setEnabled(True)
+
     def toggleGUI(self, f: bool):
         self.__favoriteBtn.setEnabled(f)
         self._copyBtn.setEnabled(f)
@@ -150,5 +156,9 @@ class AIChatUnit(ChatUnit):
         self._lbl.adjustBrowserHeight()
 
     def addText(self, text: str):
-        self._lbl.setText(self._lbl.toPlainText() + text)
-        self._lbl.adjustBrowserHeight()
+        # Only the end of the reply is rendered for each chunk, the whole reply is rendered again after it's done (See afterResponse)
+        if self.__show_as_markdown:
+            self._lbl.addMarkdown(text)
+        else:
+            self._lbl.addPlainText(text)
+        self._lbl.adjustBrowserHeightLater()
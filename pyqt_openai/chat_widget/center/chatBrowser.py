@@ -4,23 +4,27 @@ import re
 
 from qtpy.QtCore import Qt, Signal
 from qtpy.QtGui import QColor, QTextCharFormat, QTextCursor
-from qtpy.QtWidgets import QLabel, QScrollArea, QVBoxLayout, QWidget
+from qtpy.QtWidgets import QLabel, QMessageBox, QScrollArea, QVBoxLayout, QWidget
 
 from pyqt_openai import (
     DEFAULT_FOUND_TEXT_BG_COLOR,
     DEFAULT_FOUND_TEXT_COLOR,
     MAXIMUM_MESSAGES_IN_PARAMETER,
+    MESSAGE_PAGE_SIZE,
 )
 from pyqt_openai.chat_widget.center.aiChatUnit import AIChatUnit
 from pyqt_openai.chat_widget.center.userChatUnit import UserChatUnit
 from pyqt_openai.globals import DB
+from pyqt_openai.lang.translations import LangClass
 from pyqt_openai.models import ChatMessageContainer
-from pyqt_openai.util.common import is_valid_regex
+from pyqt_openai.util.common import get_chat_file_url, is_valid_regex
 
 
 class ChatBrowser(QScrollArea):
     messageUpdated = Signal(ChatMessageContainer)
     onReplacedCurrentPage = Signal(int)
+    # The message, its unit and the future of the insertion, which is sent from the writer of the database when it's done
+    messageInserted = Signal(ChatMessageContainer, object, object)
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -29,6 +33,13 @@ class ChatBrowser(QScrollArea):
 
     def __initVal(self):
         self.__cur_id = 0
+        # Future of the last message insertion, which may be still queued in WAL mode
+        self.__last_insert = None
+        # The id of the oldest message shown, to load the previous page when scrolled to the top
+        self.__oldest_id = None
+        self.__has_older_messages = False
+        # The distance from the bottom to keep after the previous page is inserted
+        self.__scroll_from_bottom = None
         self.__user_image = ""
         self.__ai_image = ""
 
@@ -44,12 +55,17 @@ class ChatBrowser(QScrollArea):
         self.setWidget(self.__chatWidget)
         self.setWidgetResizable(True)
 
-    def showLabel(self, text, stream_f, arg: ChatMessageContainer):
+        self.messageInserted.connect(self.__messageInserted)
+
+        self.verticalScrollBar().valueChanged.connect(self.__scrollValueChanged)
+        self.verticalScrollBar().rangeChanged.connect(self.__scrollRangeChanged)
+
+    def showLabel(self, text, stream_f, arg: ChatMessageContainer, files=None):
         arg.thread_id = arg.thread_id if arg.thread_id else self.__cur_id
         unit = self.__setLabel(text, stream_f, arg.role)
         if not stream_f:
-            arg.id = DB.insertMessage(arg)
             self.__setResponseInfo(unit, arg)
+            self.__insertMessage(arg, unit, files)
 
     def getLayout(self):
         return self.widget().layout()
@@ -70,11 +86,27 @@ class ChatBrowser(QScrollArea):
 
     def streamFinished(self, arg: ChatMessageContainer):
         unit = self.__getLastUnit()
-        arg.content = self.getLastResponse()
-        arg.id = DB.insertMessage(arg)
+        # The reply as it's streamed, not the text of the rendered markdown
+        arg.content = unit.getLbl().getSourceText() if isinstance(unit, AIChatUnit) else ""
         self.__setResponseInfo(unit, arg)
+        self.__insertMessage(arg, unit)
+
+    def __insertMessage(self, arg: ChatMessageContainer, unit, files=None):
+        # Don't wait for the commit, the id is sent to the UI thread when it's done (right away if it's not queued)
+        self.__last_insert = DB.insertMessage(arg, wait=False, files=files)
+        self.__last_insert.add_done_callback(lambda future: self.messageInserted.emit(arg, unit, future))
+
+    def __messageInserted(self, arg: ChatMessageContainer, unit, future):
+        e = future.exception()
+        if e:
+            QMessageBox.critical(self, LangClass.TRANSLATIONS["Error"], str(e))
+            return
+        arg.id = future.result()
+        # The unit is deleted if the other thread is shown
+        if unit in self.__getLabelsByType(AIChatUnit):
+            unit.setResponseId(arg.id)
 
-    def __setLabel(self, text, stream_f, role):
+    def __setLabel(self, text, stream_f, role, index=None):
         chatUnit = QLabel()
         if role == "user":
             chatUnit = UserChatUnit()
@@ -94,9 +126,39 @@ class ChatBrowser(QScrollArea):
                     return None
             chatUnit.setText(text)
 
-        self.getLayout().addWidget(chatUnit)
+        if index is None:
+            self.getLayout().addWidget(chatUnit)
+        else:
+            self.getLayout().insertWidget(index, chatUnit)
         return chatUnit
 
+    def __scrollValueChanged(self, value):
+        if value == self.verticalScrollBar().minimum() and self.__has_older_messages:
+            self.__loadOlderMessages()
+
+    def __scrollRangeChanged(self, minimum, maximum):
+        if self.__scroll_from_bottom is not None:
+            self.verticalScrollBar().setValue(maximum - self.__scroll_from_bottom)
+            self.__scroll_from_bottom = None
+        elif minimum == maximum and self.__has_older_messages:
+            # The messages don't fill the browser, so it can't be scrolled up to load more
+            self.__loadOlderMessages()
+
+    def __loadOlderMessages(self):
+        """Insert the previous page of the current thread's messages at the top."""
+        args = DB.selectMessagesPage(self.__cur_id, before_id=self.__oldest_id)
+        self.__has_older_messages = len(args) >= MESSAGE_PAGE_SIZE
+        if not args:
+            return
+        self.__oldest_id = args[0].id
+
+        # Keep the messages on the screen where they are
+        scrollBar = self.verticalScrollBar()
+        self.__scroll_from_bottom = scrollBar.maximum() - scrollBar.value()
+        for i, arg in enumerate(args):
+            unit = self.__setLabel(arg.content, False, arg.role, index=i)
+            self.__setResponseInfo(unit, arg)
+
     def event(self, event):
         if event.type() == 43:
             self.verticalScrollBar().setSliderPosition(
@@ -104,12 +166,32 @@ class ChatBrowser(QScrollArea):
             )
         return super().event(event)
 
-    def getMessages(self, limit=MAXIMUM_MESSAGES_IN_PARAMETER):
-        messages = DB.selectCertainThreadMessages(self.__cur_id)
-        all_text_lst = [
-            {"role": message.role, "content": message.content} for message in messages
-        ]
-        all_text_lst = all_text_lst[-limit:]
+    def getMessages(self, limit=MAXIMUM_MESSAGES_IN_PARAMETER, with_files=False, token_budget=None):
+        """Return the latest messages of the thread for the request.
+
+        :param with_files: Include the images attached to the user messages, which are read from the database instead of being encoded again
+        :param token_budget: The maximum number of the tokens of the messages (See get_context_token_budget). If None, only the limit is used.
+        """
+        # Writes are committed in order, so the messages inserted before are all committed after the last one is
+        if self.__last_insert is not None:
+            self.__last_insert.result()
+        if token_budget is None:
+            messages = DB.selectMessagesPage(self.__cur_id, limit=limit)
+        else:
+            messages = DB.selectContextMessages(self.__cur_id, token_budget, limit=limit)
+        files = {}
+        if with_files:
+            files = DB.selectChatFilesOfMessages([message.id for message in messages if message.role == "user"])
+        all_text_lst = []
+        for message in messages:
+            urls = [url for url in map(get_chat_file_url, files.get(message.id, [])) if url]
+            if urls:
+                content = [{"type": "text", "text": message.content}] + [
+                    {"type": "image_url", "image_url": {"url": url}} for url in urls
+                ]
+                all_text_lst.append({"role": message.role, "content": content})
+            else:
+                all_text_lst.append({"role": message.role, "content": message.content})
 
         return all_text_lst
 
@@ -131,6 +213,8 @@ class ChatBrowser(QScrollArea):
                 item = lay.itemAt(i)
                 if item and item.widget():
                     item.widget().deleteLater()
+        self.__oldest_id = None
+        self.__has_older_messages = False
         self.onReplacedCurrentPage.emit(0)
 
     def setCurId(self, id):
@@ -273,7 +357,9 @@ class ChatBrowser(QScrollArea):
         return selections
 
     def replaceThread(self, args: list[ChatMessageContainer], id):
-        """For showing messages from the thread."""
+        """For showing messages from the thread.
+        args is the latest page of the messages (See selectMessagesPage), and the older ones are loaded when scrolled to the top.
+        """
         self.clear()
         self.setCurId(id)
         self.onReplacedCurrentPage.emit(1)
@@ -282,6 +368,8 @@ class ChatBrowser(QScrollArea):
             # stream is False no matter what
             unit = self.__setLabel(arg.content, False, arg.role)
             self.__setResponseInfo(unit, arg)
+        self.__oldest_id = args[0].id if args else None
+        self.__has_older_messages = len(args) >= MESSAGE_PAGE_SIZE
 
     def replaceThreadForFavorite(self, args: list[ChatMessageContainer]):
         """For showing favorite messages."""
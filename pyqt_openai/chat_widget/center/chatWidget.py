@@ -13,8 +13,10 @@ from qtpy.QtWidgets import (
     QWidget,
 )
 
+from pyqt_openai import COMPARE_MESSAGE_TAG
 from pyqt_openai.chat_widget.center.chatBrowser import ChatBrowser
 from pyqt_openai.chat_widget.center.chatHome import ChatHome
+from pyqt_openai.chat_widget.center.compareDialog import CompareDialog
 from pyqt_openai.chat_widget.center.menuWidget import MenuWidget
 from pyqt_openai.chat_widget.center.prompt import Prompt
 from pyqt_openai.chat_widget.llamaIndexThread import LlamaIndexThread
@@ -22,7 +24,8 @@ from pyqt_openai.config_loader import CONFIG_MANAGER
 from pyqt_openai.globals import DB, LLAMAINDEX_WRAPPER
 from pyqt_openai.lang.translations import LangClass
 from pyqt_openai.models import ChatMessageContainer
-from pyqt_openai.util.common import ChatThread, get_argument
+from pyqt_openai.util.common import ChatRequest, get_argument
+from pyqt_openai.util.token_counter import count_message_tokens, count_tokens, get_context_token_budget
 from pyqt_openai.widgets.notifier import NotifierWidget
 
 
@@ -39,6 +42,10 @@ class ChatWidget(QWidget):
         self.__cur_id = 0
         self.__notify_finish = CONFIG_MANAGER.get_general_property("notify_finish")
         self.__is_g4f = False
+        # The running request of each thread by the id of the thread
+        self.__requests = {}
+        # The reply of each thread which is streamed so far, to be shown again when the thread is shown
+        self.__stream_replies = {}
 
     def __initUi(self):
         # Main widget
@@ -69,6 +76,7 @@ class ChatWidget(QWidget):
         self.__prompt = Prompt(self)
         self.__prompt.onRecording.connect(self.__toggleWidgetWhileRecording)
         self.__prompt.onStoppedClicked.connect(self.__stopResponse)
+        self.__prompt.onCompareClicked.connect(self.__compare)
         self.__mainPrompt = self.__prompt.getMainPromptInput()
 
         lay = QHBoxLayout()
@@ -163,17 +171,27 @@ class ChatWidget(QWidget):
             # Get image files
             images = self.__prompt.getImageBuffers()
 
+            cur_text = self.__prompt.getContent()
+
+            json_content = self.__prompt.getJSONContent()
+
             maximum_messages_in_parameter = CONFIG_MANAGER.get_general_property(
                 "maximum_messages_in_parameter",
             )
-            messages = self.__browser.getMessages(maximum_messages_in_parameter)
+            # The previous messages get what is left in the context window after the system message, the current message and the reply
+            prompt_tokens = count_tokens(system, model) + count_message_tokens(
+                f"{cur_text} JSON {json_content}" if is_json_response_available else cur_text, model, len(images),
+            )
+            token_budget = get_context_token_budget(
+                model, prompt_tokens, max_tokens if use_max_tokens else None,
+            )
+            # The images attached before are sent again along with the history, except to G4F which takes them separately
+            messages = self.__browser.getMessages(
+                maximum_messages_in_parameter, with_files=not self.__is_g4f, token_budget=token_budget,
+            )
             if self.__is_g4f and not g4f_use_chat_history:
                 messages = []
 
-            cur_text = self.__prompt.getContent()
-
-            json_content = self.__prompt.getJSONContent()
-
             is_llama_available = False
             if use_llama_index:
                 # Check llamaindex is available
@@ -257,27 +275,34 @@ class ChatWidget(QWidget):
                 if k in ChatMessageContainer.get_keys()
             }
 
-            # Create a container for the user's input and output from the chatbot
+            # Create a container for the user's input
             container = ChatMessageContainer(**container_param)
 
             query_text = self.__prompt.getContent()
-            self.__browser.showLabel(query_text, False, container)
+            # The images are saved along with the message, to be sent again in the history
+            self.__browser.showLabel(query_text, False, container, images)
+
+            # The reply is another message of the thread, in which the id is set when it's saved
+            reply_container = ChatMessageContainer(**{**container_param, "content": ""})
+            # The thread is set when the user's input is shown
+            reply_container.thread_id = container.thread_id
 
             # Run a different thread based on whether the llama-index is enabled or not.
             if is_llama_available:
-                self.__t = LlamaIndexThread(
-                    param, container, LLAMAINDEX_WRAPPER, query_text,
+                t = LlamaIndexThread(
+                    param, reply_container, LLAMAINDEX_WRAPPER, query_text,
                 )
             else:
-                self.__t = ChatThread(
-                    param, info=container, is_g4f=self.__is_g4f, provider=provider,
+                t = ChatRequest(
+                    param, info=reply_container, is_g4f=self.__is_g4f, provider=provider,
                 )
+            self.__requests[reply_container.thread_id] = t
 
-            self.__t.started.connect(self.__beforeGenerated)
-            self.__t.replyGenerated.connect(self.__browser.showLabel)
-            self.__t.streamFinished.connect(self.__browser.streamFinished)
-            self.__t.start()
-            self.__t.finished.connect(self.__afterGenerated)
+            t.started.connect(self.__beforeGenerated)
+            t.replyGenerated.connect(self.__showReply)
+            t.streamFinished.connect(self.__finishStream)
+            t.start()
+            t.finished.connect(self.__afterGenerated)
 
             # Remove image files widget from the window
             self.__prompt.resetUploadImageFileWidget()
@@ -299,7 +324,98 @@ class ChatWidget(QWidget):
             )
 
     def __stopResponse(self):
-        self.__t.stop()
+        t = self.__requests.get(self.__cur_id)
+        if t:
+            t.stop()
+
+    def __showReply(self, text, stream_f, arg: ChatMessageContainer):
+        if stream_f:
+            self.__stream_replies[arg.thread_id] = self.__stream_replies.get(arg.thread_id, "") + text
+        if arg.thread_id == self.__cur_id:
+            self.__browser.showLabel(text, stream_f, arg)
+        elif not stream_f:
+            # The other thread is shown now
+            DB.insertMessage(arg, wait=False)
+
+    def __finishStream(self, arg: ChatMessageContainer):
+        reply = self.__stream_replies.pop(arg.thread_id, "")
+        if arg.thread_id == self.__cur_id:
+            self.__browser.streamFinished(arg)
+        else:
+            # The other thread is shown now
+            arg.content = reply
+            DB.insertMessage(arg, wait=False)
+
+    def __compare(self):
+        if not self.__prompt.getContent():
+            QMessageBox.warning(
+                self,
+                LangClass.TRANSLATIONS["Warning"],
+                LangClass.TRANSLATIONS["Please write something before sending."],
+            )
+            return
+        self.__compareDialog = CompareDialog(
+            self.__prompt.getContent(), self.__getCompareArgument, parent=self,
+        )
+        self.__compareDialog.runStarted.connect(self.__compareStarted)
+        self.__compareDialog.replyFinished.connect(self.__compareReplyFinished)
+        self.__compareDialog.show()
+
+    def __getCompareArgument(self, model, is_g4f, cur_text):
+        """Return the argument of the request to the model in the compare mode, with the current settings and history like __chat.
+        The images, the JSON content and the llama-index are not used in the compare mode.
+        """
+        system = CONFIG_MANAGER.get_general_property("system")
+        max_tokens = CONFIG_MANAGER.get_general_property("max_tokens")
+        use_max_tokens = CONFIG_MANAGER.get_general_property("use_max_tokens")
+
+        token_budget = get_context_token_budget(
+            model,
+            count_tokens(system, model) + count_message_tokens(cur_text, model),
+            max_tokens if use_max_tokens else None,
+        )
+        messages = self.__browser.getMessages(
+            CONFIG_MANAGER.get_general_property("maximum_messages_in_parameter"),
+            with_files=not is_g4f,
+            token_budget=token_budget,
+        )
+        if is_g4f and not CONFIG_MANAGER.get_general_property("g4f_use_chat_history"):
+            messages = []
+
+        return get_argument(
+            model,
+            system,
+            messages,
+            cur_text,
+            CONFIG_MANAGER.get_general_property("temperature"),
+            CONFIG_MANAGER.get_general_property("top_p"),
+            CONFIG_MANAGER.get_general_property("frequency_penalty"),
+            CONFIG_MANAGER.get_general_property("presence_penalty"),
+            CONFIG_MANAGER.get_general_property("stream"),
+            use_max_tokens,
+            max_tokens,
+            [],
+            is_g4f=is_g4f,
+        )
+
+    def __compareStarted(self, text):
+        # If there is no current conversation selected on the list to the left, make a new one.
+        if self.__mainWidget.currentIndex() == 0:
+            self.addThread.emit()
+        self.__compare_thread_id = self.__cur_id
+        container = ChatMessageContainer(
+            role="user", content=text, tag=COMPARE_MESSAGE_TAG,
+        )
+        self.__browser.showLabel(text, False, container)
+        self.__mainPrompt.clear()
+
+    def __compareReplyFinished(self, arg: ChatMessageContainer):
+        arg.thread_id = self.__compare_thread_id
+        if self.__cur_id == self.__compare_thread_id:
+            self.__browser.showLabel(arg.content, False, arg)
+        else:
+            # The other thread is shown now
+            DB.insertMessage(arg, wait=False)
 
     def __toggleWidgetWhileRecording(self, f):
         self.__mainPrompt.setExecuteEnabled(not f)
@@ -310,18 +426,30 @@ class ChatWidget(QWidget):
         self.__prompt.showWidgetInPromptDuringResponse(not f)
         self.__prompt.sendEnabled(f)
 
+    def __toggleWidgetOfCurrentThread(self):
+        # The prompt is disabled only while the request of the thread shown is running
+        self.__toggleWidgetWhileChatting(self.__cur_id not in self.__requests)
+
     def __beforeGenerated(self):
-        self.__toggleWidgetWhileChatting(False)
+        self.__toggleWidgetOfCurrentThread()
         self.__mainPrompt.clear()
 
     def __afterGenerated(self):
-        self.__toggleWidgetWhileChatting(True)
-        self.__mainPrompt.setFocus()
+        t = self.sender()
+        thread_id = t.getInfo().thread_id
+        if self.__requests.get(thread_id) is t:
+            del self.__requests[thread_id]
+            # The stream is not finished if it failed
+            self.__stream_replies.pop(thread_id, None)
+        is_current = thread_id == self.__cur_id
+        if is_current:
+            self.__toggleWidgetOfCurrentThread()
+            self.__mainPrompt.setFocus()
         if not self.isVisible() or not self.window().isActiveWindow():
             if self.__notify_finish:
                 self.__notifierWidget = NotifierWidget(
                     informative_text=LangClass.TRANSLATIONS["Response 👌"],
-                    detailed_text=self.__browser.getLastResponse(),
+                    detailed_text=self.__browser.getLastResponse() if is_current else t.getInfo().content,
                 )
                 self.__notifierWidget.show()
                 self.__notifierWidget.doubleClicked.connect(self.__bringWindowToFront)
@@ -340,11 +468,18 @@ class ChatWidget(QWidget):
         self.__prompt.toggleJSON(f)
 
     def showMessages(self, cur_id):
+        self.__cur_id = cur_id
         self.__browser.resetChatWidget(cur_id)
-        self.__browser.replaceThread(DB.selectCertainThreadMessages(cur_id), cur_id)
+        self.__browser.replaceThread(DB.selectMessagesPage(cur_id), cur_id)
+        # The reply which is still streamed is not saved yet
+        if self.__stream_replies.get(cur_id):
+            self.__browser.showLabel(self.__stream_replies[cur_id], True, self.__requests[cur_id].getInfo())
+        self.__toggleWidgetOfCurrentThread()
         self.__mainPrompt.setFocus()
         # Reset menu widget
         self.__menuWidget.getFindTextWidget().clearFormatting()
 
     def clearMessages(self):
+        self.__cur_id = 0
         self.__browser.resetChatWidget(0)
+        self.__toggleWidgetOfCurrentThread()
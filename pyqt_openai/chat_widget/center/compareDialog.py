@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import time
+
+from typing import Callable
+
+from qtpy.QtCore import Qt, Signal
+from qtpy.QtGui import QTextCursor
+from qtpy.QtWidgets import (
+    QDialog,
+    QGroupBox,
+    QHBoxLayout,
+    QLabel,
+    QMessageBox,
+    QPushButton,
+    QScrollArea,
+    QSplitter,
+    QTextBrowser,
+    QVBoxLayout,
+    QWidget,
+)
+
+from pyqt_openai import COMPARE_MESSAGE_TAG
+from pyqt_openai.config_loader import CONFIG_MANAGER
+from pyqt_openai.lang.translations import LangClass
+from pyqt_openai.models import ChatMessageContainer
+from pyqt_openai.util.common import ChatRequest, get_chat_model
+from pyqt_openai.util.token_counter import count_messages_tokens, count_tokens, get_cost
+from pyqt_openai.widgets.checkBoxListWidget import CheckBoxListWidget
+
+
+class CompareReplyWidget(QGroupBox):
+    """The reply of one model in the compare mode, with its metrics below."""
+
+    def __init__(self, title, parent=None):
+        super().__init__(title, parent)
+        self.__initUi()
+
+    def __initUi(self):
+        self.__browser = QTextBrowser()
+        self.__metricsLbl = QLabel()
+        self.__metricsLbl.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+
+        lay = QVBoxLayout()
+        lay.addWidget(self.__browser)
+        lay.addWidget(self.__metricsLbl)
+        self.setLayout(lay)
+        self.setMinimumWidth(300)
+
+    def addText(self, text):
+        cursor = self.__browser.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+
+    def setText(self, text):
+        # The error is in HTML
+        if text.startswith("<"):
+            self.__browser.setHtml(text)
+        else:
+            self.__browser.setPlainText(text)
+
+    def getText(self):
+        return self.__browser.toPlainText()
+
+    def setMetrics(self, text):
+        self.__metricsLbl.setText(text)
+
+
+class CompareDialog(QDialog):
+    """Send the same prompt to the selected models (API and G4F) at the same time, and show their replies side by side.
+
+    == runStarted Signal ==
+    The prompt, which is sent right before the requests (the replies come after it in the thread)
+
+    == replyFinished Signal ==
+    Each reply which is done, tagged with COMPARE_MESSAGE_TAG to be added to the thread
+    """
+
+    runStarted = Signal(str)
+    replyFinished = Signal(ChatMessageContainer)
+
+    def __init__(
+        self, text, get_argument: Callable[[str, bool, str], dict], parent=None,
+    ):
+        super().__init__(parent)
+        self.__initVal(text, get_argument)
+        self.__initUi()
+
+    def __initVal(self, text, get_argument):
+        self.__text = text
+        self.__get_argument = get_argument
+        # (model, is_g4f) of each row of the list
+        self.__models = [(model, False) for model in get_chat_model(is_g4f=False)] + [
+            (model, True) for model in get_chat_model(is_g4f=True)
+        ]
+        self.__requests: list[ChatRequest] = []
+        self.__running_count = 0
+
+    def __initUi(self):
+        self.setWindowTitle(LangClass.TRANSLATIONS["Compare Models"])
+        self.setWindowFlags(
+            Qt.WindowType.Window
+            | Qt.WindowType.WindowCloseButtonHint
+            | Qt.WindowType.WindowMaximizeButtonHint
+        )
+
+        promptLbl = QLabel(self.__text)
+        promptLbl.setWordWrap(True)
+        promptLbl.setMaximumHeight(100)
+
+        self.__modelListWidget = CheckBoxListWidget()
+        self.__modelListWidget.addItems(
+            [f"G4F / {model}" if is_g4f else model for model, is_g4f in self.__models]
+        )
+
+        self.__runBtn = QPushButton(LangClass.TRANSLATIONS["Run"])
+        self.__runBtn.clicked.connect(self.__run)
+        self.__stopBtn = QPushButton(LangClass.TRANSLATIONS["Stop"])
+        self.__stopBtn.clicked.connect(self.__stop)
+        self.__stopBtn.setEnabled(False)
+
+        lay = QHBoxLayout()
+        lay.addWidget(self.__runBtn)
+        lay.addWidget(self.__stopBtn)
+        lay.setAlignment(Qt.AlignmentFlag.AlignRight)
+        lay.setContentsMargins(0, 0, 0, 0)
+
+        btnWidget = QWidget()
+        btnWidget.setLayout(lay)
+
+        lay = QVBoxLayout()
+        lay.addWidget(promptLbl)
+        lay.addWidget(self.__modelListWidget)
+        lay.addWidget(btnWidget)
+        lay.setContentsMargins(0, 0, 0, 0)
+
+        topWidget = QWidget()
+        topWidget.setLayout(lay)
+
+        self.__replyLayout = QHBoxLayout()
+        replyWidget = QWidget()
+        replyWidget.setLayout(self.__replyLayout)
+
+        scrollArea = QScrollArea()
+        scrollArea.setWidget(replyWidget)
+        scrollArea.setWidgetResizable(True)
+
+        splitter = QSplitter(Qt.Orientation.Vertical)
+        splitter.addWidget(topWidget)
+        splitter.addWidget(scrollArea)
+        splitter.setSizes([200, 600])
+        splitter.setChildrenCollapsible(False)
+
+        lay = QVBoxLayout()
+        lay.addWidget(splitter)
+        self.setLayout(lay)
+
+        self.resize(1200, 800)
+
+    def __run(self):
+        targets = [self.__models[i] for i in self.__modelListWidget.getCheckedRows()]
+        if not targets:
+            QMessageBox.warning(
+                self,
+                LangClass.TRANSLATIONS["Warning"],
+                LangClass.TRANSLATIONS["Please select at least one model."],
+            )
+            return
+
+        # The history is read before the prompt is added to the thread
+        args = [self.__get_argument(model, is_g4f, self.__text) for model, is_g4f in targets]
+        self.runStarted.emit(self.__text)
+
+        while self.__replyLayout.count():
+            self.__replyLayout.takeAt(0).widget().deleteLater()
+        self.__requests = []
+
+        provider = CONFIG_MANAGER.get_general_property("provider")
+        for (model, is_g4f), arg in zip(targets, args):
+            widget = CompareReplyWidget(f"G4F / {model}" if is_g4f else model)
+            self.__replyLayout.addWidget(widget)
+
+            info = ChatMessageContainer(
+                model=model, is_g4f=int(is_g4f), tag=COMPARE_MESSAGE_TAG,
+            )
+            request = ChatRequest(
+                arg, info=info, is_g4f=is_g4f, provider=provider if is_g4f else "",
+            )
+            self.__connectRequest(request, widget, arg)
+            self.__requests.append(request)
+
+        self.__running_count = len(self.__requests)
+        self.__runBtn.setEnabled(False)
+        self.__stopBtn.setEnabled(True)
+        for request in self.__requests:
+            request.start()
+
+    def __connectRequest(self, request: ChatRequest, widget: CompareReplyWidget, arg):
+        times = {"start": time.perf_counter(), "first_token": None}
+
+        def replyGenerated(text, stream_f, info):
+            if stream_f:
+                if times["first_token"] is None and text:
+                    times["first_token"] = time.perf_counter()
+                widget.addText(text)
+            else:
+                widget.setText(text)
+
+        def streamFinished(info):
+            info.content = widget.getText()
+
+        def finished():
+            end_time = time.perf_counter()
+            info = request.getInfo()
+            total_time = end_time - times["start"]
+            ttft = (times["first_token"] or end_time) - times["start"]
+            if info.finish_reason == "Error":
+                widget.setMetrics(f"{total_time:.2f}s")
+            else:
+                model = info.model or arg["model"]
+                prompt_tokens = count_messages_tokens(arg["messages"], model)
+                completion_tokens = count_tokens(info.content, model)
+                info.prompt_tokens = prompt_tokens
+                info.completion_tokens = completion_tokens
+                info.total_tokens = prompt_tokens + completion_tokens
+
+                metrics = [
+                    f'{LangClass.TRANSLATIONS["First token"]} {ttft:.2f}s',
+                    f'{LangClass.TRANSLATIONS["Total"]} {total_time:.2f}s',
+                    f'{completion_tokens} {LangClass.TRANSLATIONS["tokens"]}',
+                ]
+                cost = None if info.is_g4f else get_cost(model, prompt_tokens, completion_tokens)
+                if cost is not None:
+                    metrics.append(f"${cost:.5f}")
+                if info.provider:
+                    metrics.append(info.provider)
+                widget.setMetrics(" · ".join(metrics))
+                self.replyFinished.emit(info)
+
+            self.__running_count -= 1
+            if self.__running_count == 0:
+                self.__runBtn.setEnabled(True)
+                self.__stopBtn.setEnabled(False)
+
+        request.replyGenerated.connect(replyGenerated)
+        request.streamFinished.connect(streamFinished)
+        request.finished.connect(finished)
+
+    def __stop(self):
+        for request in self.__requests:
+            request.stop()
+
+    def reject(self):
+        # Closed while the replies are coming
+        self.__stop()
+        super().reject()
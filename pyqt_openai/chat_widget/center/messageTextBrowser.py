@@ -3,10 +3,25 @@ from __future__ import annotations
 import json
 
 # from qtpy.QtWidgets import QApplication, QWidget, QVBoxLayout
-from qtpy.QtGui import QColor, QDesktopServices, QPalette
+from qtpy.QtCore import QTimer
+from qtpy.QtGui import (
+    QColor,
+    QDesktopServices,
+    QPalette,
+    QTextBlockFormat,
+    QTextCharFormat,
+    QTextCursor,
+    QTextDocument,
+    QTextDocumentFragment,
+)
 from qtpy.QtWidgets import QTextBrowser
 
-from pyqt_openai import INDENT_SIZE, MESSAGE_MAXIMUM_HEIGHT, MESSAGE_PADDING
+from pyqt_openai import (
+    INDENT_SIZE,
+    MESSAGE_HEIGHT_UPDATE_INTERVAL_MS,
+    MESSAGE_MAXIMUM_HEIGHT,
+    MESSAGE_PADDING,
+)
 
 
 class MessageTextBrowser(QTextBrowser):
@@ -16,8 +31,16 @@ class MessageTextBrowser(QTextBrowser):
         # Make the remote links clickable
         self.anchorClicked.connect(self.on_anchor_clicked)
         self.setOpenExternalLinks(True)
+        self.__initVal()
         self.__initUi()
 
+    def __initVal(self):
+        # The text as it's given (the markdown, or the plain text), and where its last block (which may be incomplete yet)
+        # starts in it and in the document while the markdown is streamed
+        self.__text = ""
+        self.__markdown_block_start = 0
+        self.__document_block_start = 0
+
     def on_anchor_clicked(self, url):
         QDesktopServices.openUrl(url)
 
@@ -35,6 +58,11 @@ class MessageTextBrowser(QTextBrowser):
 
         self.setContentsMargins(0, 0, 0, 0)
 
+        self.__heightTimer = QTimer(self)
+        self.__heightTimer.setSingleShot(True)
+        self.__heightTimer.setInterval(MESSAGE_HEIGHT_UPDATE_INTERVAL_MS)
+        self.__heightTimer.timeout.connect(self.adjustBrowserHeight)
+
     def setJson(self, json_str):
         try:
             json_data = json.loads(json_str)
@@ -53,8 +81,86 @@ class MessageTextBrowser(QTextBrowser):
             self.setMinimumHeight(int(max_height))
         self.verticalScrollBar().setSliderPosition(self.verticalScrollBar().maximum())
 
+    def adjustBrowserHeightLater(self):
+        """adjustBrowserHeight once for the chunks which come in MESSAGE_HEIGHT_UPDATE_INTERVAL_MS."""
+        if not self.__heightTimer.isActive():
+            self.__heightTimer.start()
+
+    def getSourceText(self) -> str:
+        """Return the text as it's given with setText, setMarkdown and the streamed chunks, not as it's shown (See toPlainText)."""
+        return self.__text
+
+    def setText(self, text: str) -> None:
+        super().setText(text)
+        self.__text = text
+        self.__markdown_block_start = 0
+        self.__document_block_start = 0
+
+    def addPlainText(self, text: str):
+        self.__text += text
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+
+    @staticmethod
+    def __getCompleteMarkdownLength(markdown: str) -> int:
+        """Return the length of the complete blocks at the start of the markdown, which end with the blank line outside the code block."""
+        length = 0
+        in_code_block = False
+        position = 0
+        for line in markdown.splitlines(keepends=True):
+            position += len(line)
+            stripped = line.strip()
+            if stripped.startswith(("```", "~~~")):
+                in_code_block = not in_code_block
+            elif not stripped and not in_code_block and line.endswith("\n"):
+                length = position
+        return length
+
+    def __renderMarkdownAt(self, position: int, markdown: str):
+        """Replace the document from the position to the end with the markdown."""
+        if position == 0:
+            super().setMarkdown(markdown)
+            return
+        document = QTextDocument()
+        document.setMarkdown(markdown)
+        # The first block of the fragment is merged into the block at the position and loses its format,
+        # so the empty block is put before it
+        cursor = QTextCursor(document)
+        first_block = document.begin()
+        cursor.insertBlock(first_block.blockFormat(), first_block.charFormat())
+        cursor.setPosition(0)
+        cursor.setBlockFormat(QTextBlockFormat())
+        cursor.setBlockCharFormat(QTextCharFormat())
+
+        cursor = QTextCursor(self.document())
+        cursor.setPosition(position)
+        cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor)
+        cursor.insertFragment(QTextDocumentFragment(document))
+
+    def addMarkdown(self, markdown: str):
+        """Add the chunk of the markdown which is streamed.
+        Only the last block is rendered again, so it takes the same time however long the markdown is.
+        The blocks which are split by the blank lines (e.g. the loose list) may look different until the whole markdown is set again with setMarkdown.
+        """
+        self.__text += markdown
+        rest = self.__text[self.__markdown_block_start:]
+        length = self.__getCompleteMarkdownLength(rest)
+        if length:
+            # Render the blocks which are complete for the last time
+            self.__renderMarkdownAt(self.__document_block_start, rest[:length])
+            self.__markdown_block_start += length
+            self.__document_block_start = self.document().characterCount() - 1
+            rest = rest[length:]
+            if not rest:
+                return
+        self.__renderMarkdownAt(self.__document_block_start, rest)
+
     def setMarkdown(self, markdown: str) -> None:
         super().setMarkdown(markdown)
+        self.__text = markdown
+        self.__markdown_block_start = 0
+        self.__document_block_start = 0
         # Convert markdown to HTML using QTextDocument
 
     #     document = QTextDocument()
@@ -56,6 +56,7 @@ from pyqt_openai.widgets.toolButton import ToolButton
 class Prompt(QWidget):
     onRecording = Signal(bool)
     onStoppedClicked = Signal()
+    onCompareClicked = Signal()
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -171,6 +172,9 @@ class Prompt(QWidget):
         readingFilesAction = QAction(LangClass.TRANSLATIONS["Upload Files..."], self)
         readingFilesAction.triggered.connect(self.__readingFiles)
 
+        compareAction = QAction(LangClass.TRANSLATIONS["Compare Models..."], self)
+        compareAction.triggered.connect(self.onCompareClicked.emit)
+
         self.__writeJSONAction = QAction(LangClass.TRANSLATIONS["Write JSON"], self)
         self.__writeJSONAction.toggled.connect(self.__showJSON)
         self.__writeJSONAction.setCheckable(True)
@@ -182,6 +186,7 @@ class Prompt(QWidget):
         menu.addAction(supportPromptCommandAction)
         menu.addAction(self.__writeJSONAction)
         menu.addAction(readingFilesAction)
+        menu.addAction(compareAction)
 
         # Connect the button to the menu
         settingsBtn.setMenu(menu)
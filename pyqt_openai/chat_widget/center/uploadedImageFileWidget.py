@@ -4,11 +4,13 @@ import os
 
 from typing import TYPE_CHECKING
 
+import filetype
+
 from qtpy.QtCore import QBuffer, QByteArray, Qt
 from qtpy.QtGui import QPixmap
 from qtpy.QtWidgets import QHBoxLayout, QLabel, QPushButton, QScrollArea, QSizePolicy, QSpacerItem, QVBoxLayout, QWidget
 
-from pyqt_openai import IMAGE_FILE_EXT_LIST, PROMPT_IMAGE_SCALE
+from pyqt_openai import CHAT_FILE_MIME_TYPES, IMAGE_FILE_EXT_LIST, PROMPT_IMAGE_SCALE
 from pyqt_openai.lang.translations import LangClass
 
 if TYPE_CHECKING:
@@ -27,7 +29,8 @@ class UploadedImageFileWidget(QWidget):
 
     def __initVal(self):
         self.__delete_mode: bool = False
-        self.__original_pixmaps: list[QPixmap] = []  # Array of original images
+        # The data of each image, which is sent as it is instead of being encoded again when sending
+        self.__image_buffers: dict[QLabel, bytes] = {}
 
     def __initUi(self):
         lbl = QLabel(LangClass.TRANSLATIONS["Uploaded Files (Only Images)"])
@@ -96,28 +99,23 @@ class UploadedImageFileWidget(QWidget):
         lbl.installEventFilter(self)
         pixmap = QPixmap()
         pixmap.loadFromData(image_buffer)
-        self.__original_pixmaps.append(pixmap)
-        pixmap = pixmap.scaled(*PROMPT_IMAGE_SCALE)
-        lbl.setPixmap(pixmap)
-        lay.addWidget(lbl)
-        self.__toggle(True)
-
-    def getImageBuffers(self) -> list[bytes | bytearray | memoryview[int]]:
-        buffers = []
-        # Make a copy of the original images
-        for pixmap in self.__original_pixmaps:
+        data = QByteArray(image_buffer).data()
+        if filetype.guess_mime(data) not in CHAT_FILE_MIME_TYPES:
+            # Convert the image which can't be sent as it is (e.g. BMP) to PNG only once
             byte_array = QByteArray()
             buffer = QBuffer(byte_array)
             buffer.open(QBuffer.OpenModeFlag.WriteOnly)
-
-            # Save the pixmap to the buffer
             pixmap.save(buffer, "PNG")
+            data = byte_array.data()
+        self.__image_buffers[lbl] = data
+        pixmap = pixmap.scaled(*PROMPT_IMAGE_SCALE)
+        lbl.setPixmap(pixmap)
+        lay.addWidget(lbl)
+        self.__toggle(True)
 
-            # Convert the buffer to bytes
-            image_bytes = byte_array.data()
-            buffers.append(image_bytes)
-
-        self.__original_pixmaps = []
+    def getImageBuffers(self) -> list[bytes]:
+        buffers = list(self.__image_buffers.values())
+        self.__image_buffers = {}
 
         return buffers
 
@@ -138,6 +136,7 @@ class UploadedImageFileWidget(QWidget):
             widget = lay_item_i.widget()
             assert widget is not None, f"widget is None at index {i}"
             widget.deleteLater()
+        self.__image_buffers = {}
         self.__toggle(False)
 
     def eventFilter(
@@ -148,6 +147,8 @@ class UploadedImageFileWidget(QWidget):
         if isinstance(obj, QLabel):
             if event.type() == 2:
                 if self.__delete_mode:
+                    # Don't send the deleted image
+                    self.__image_buffers.pop(obj, None)
                     obj.deleteLater()
                     if self.getLayout().count() == 1:
                         self.__toggle(False)
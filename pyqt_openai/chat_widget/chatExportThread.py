@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from qtpy.QtCore import QThread, Signal
+
+from pyqt_openai.globals import DB
+from pyqt_openai.util.common import export_threads_to_zip
+
+
+class ChatExportThread(QThread):
+    """Write the selected threads and their messages into the file in the background,
+    so the UI is not blocked while exporting the large history.
+    The file type is "json", "jsonl" (JSON Lines), or "txt"/"html" (the file of each thread in ZIP).
+    """
+
+    progressUpdated = Signal(int)
+    exportFinished = Signal(str)
+    errorGenerated = Signal(str)
+
+    def __init__(self, ids: list[int], filename: str, file_type: str = "json", parent=None):
+        super().__init__(parent)
+        self.__ids = ids
+        self.__filename = filename
+        self.__file_type = file_type
+        self.__cancelled = False
+
+    def cancel(self):
+        self.__cancelled = True
+
+    def run(self):
+        try:
+            if self.__file_type in ("json", "jsonl"):
+                finished = DB.exportThreads(
+                    self.__ids,
+                    self.__filename,
+                    ndjson=self.__file_type == "jsonl",
+                    progress_callback=self.progressUpdated.emit,
+                    is_cancelled=lambda: self.__cancelled,
+                )
+            else:
+                finished = export_threads_to_zip(
+                    DB,
+                    self.__ids,
+                    self.__filename,
+                    self.__file_type,
+                    progress_callback=self.progressUpdated.emit,
+                    is_cancelled=lambda: self.__cancelled,
+                )
+            if finished:
+                self.exportFinished.emit(self.__filename)
+        except Exception as e:
+            self.errorGenerated.emit(str(e))
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from qtpy.QtCore import QThread, Signal
+
+from pyqt_openai.globals import DB
+
+
+class ChatImportThread(QThread):
+    """Insert the imported threads and their messages into the database in bulk,
+    so the UI is not blocked while importing the large file.
+    """
+
+    progressUpdated = Signal(int)
+    importFinished = Signal(list)
+    errorGenerated = Signal(str)
+
+    def __init__(self, data: list[dict], parent=None):
+        super().__init__(parent)
+        self.__data = data
+
+    def run(self):
+        try:
+            ids = DB.importThreads(self.__data, progress_callback=self.progressUpdated.emit)
+            self.importFinished.emit(ids)
+        except Exception as e:
+            self.errorGenerated.emit(str(e))
@@ -5,25 +5,27 @@ import os
 from typing import TYPE_CHECKING, Any
 
 from qtpy.QtCore import Qt
-from qtpy.QtWidgets import QFileDialog, QHBoxLayout, QMessageBox, QPushButton, QSplitter, QStackedWidget, QVBoxLayout, QWidget
+from qtpy.QtWidgets import QFileDialog, QHBoxLayout, QMessageBox, QProgressDialog, QPushButton, QSplitter, QStackedWidget, QVBoxLayout, QWidget
 
 from pyqt_openai import (
     DEFAULT_SHORTCUT_CONTROL_PROMPT_WINDOW,
     DEFAULT_SHORTCUT_FIND,
     DEFAULT_SHORTCUT_LEFT_SIDEBAR_WINDOW,
     DEFAULT_SHORTCUT_RIGHT_SIDEBAR_WINDOW,
-    FILE_NAME_LENGTH,
     ICON_PROMPT,
     ICON_REALTIME_API,
     ICON_SETTING,
     ICON_SIDEBAR,
     JSON_FILE_EXT_LIST_STR,
+    JSONL_FILE_EXT_LIST_STR,
     QFILEDIALOG_DEFAULT_DIRECTORY,
     THREAD_TABLE_NAME,
 )
 from pyqt_openai.chat_widget.center.chatWidget import ChatWidget
 from pyqt_openai.chat_widget.center.messageTextBrowser import MessageTextBrowser
 from pyqt_openai.chat_widget.center.realtimeApiWidget import RealtimeApiWidget
+from pyqt_openai.chat_widget.chatExportThread import ChatExportThread
+from pyqt_openai.chat_widget.chatImportThread import ChatImportThread
 from pyqt_openai.chat_widget.left_sidebar.chatNavWidget import ChatNavWidget
 from pyqt_openai.chat_widget.prompt_gen_widget.promptGeneratorWidget import PromptGeneratorWidget
 from pyqt_openai.chat_widget.right_sidebar.chatRightSideBarWidget import ChatRightSideBarWidget
@@ -31,12 +33,10 @@ from pyqt_openai.config_loader import CONFIG_MANAGER
 from pyqt_openai.globals import DB
 from pyqt_openai.lang.translations import LangClass
 from pyqt_openai.models import ChatMessageContainer, ChatThreadContainer
-from pyqt_openai.util.common import add_file_to_zip, conv_unit_to_html, getSeparator, get_generic_ext_out_of_qt_ext, message_list_to_txt, open_directory
+from pyqt_openai.util.common import getSeparator, get_generic_ext_out_of_qt_ext, open_directory
 from pyqt_openai.widgets.button import Button
 
 if TYPE_CHECKING:
-    from collections.abc import Callable
-
     from pyqt_openai.models import CustomizeParamsContainer
 
 
@@ -288,34 +288,38 @@ class ChatMainWidget(QWidget):
         self.__chatNavWidget.add(called_from_parent=True)
 
     def __importChat(self, data: list[dict[str, Any]]):
-        try:
-            # Import thread
-            for thread in data:
-                cur_id = DB.insertThread(
-                    thread["name"], thread["insert_dt"], thread["update_dt"],
-                )
-                messages = thread["messages"]
-                # Import message
-                for message in messages:
-                    message["thread_id"] = cur_id
-                    container = ChatMessageContainer(**message)
-                    DB.insertMessage(container, deactivate_trigger=True)
-            self.__chatNavWidget.refreshData()
-        except Exception:
-            QMessageBox.critical(  # type: ignore[call-arg]
-                self,
-                LangClass.TRANSLATIONS["Error"],
-                LangClass.TRANSLATIONS[
-                    "Check whether the file is a valid JSON file for importing."
-                ],
-            )
+        self.__importProgressDialog = QProgressDialog(
+            LangClass.TRANSLATIONS["Importing..."], "", 0, len(data), self,
+        )
+        self.__importProgressDialog.setCancelButton(None)
+        self.__importProgressDialog.setWindowModality(Qt.WindowModality.WindowModal)
+        self.__importProgressDialog.setMinimumDuration(0)
+
+        # Insert the threads in the background
+        self.__importThread = ChatImportThread(data, parent=self)
+        self.__importThread.progressUpdated.connect(self.__importProgressDialog.setValue)
+        self.__importThread.importFinished.connect(self.__afterImportChat)
+        self.__importThread.errorGenerated.connect(self.__failToImportChat)
+        self.__importThread.finished.connect(self.__importProgressDialog.close)
+        self.__importThread.start()
+
+    def __afterImportChat(self, ids: list[int]):
+        self.__chatNavWidget.refreshData()
+
+    def __failToImportChat(self, error: str):
+        self.__chatNavWidget.refreshData()
+        QMessageBox.critical(  # type: ignore[call-arg]
+            self,
+            LangClass.TRANSLATIONS["Error"],
+            f'{LangClass.TRANSLATIONS["Check whether the file is a valid JSON file for importing."]}\n\n{error}',
+        )
 
     def __exportChat(self, ids: list[int]):
         file_data = QFileDialog.getSaveFileName(
             self,
             LangClass.TRANSLATIONS["Save"],
             QFILEDIALOG_DEFAULT_DIRECTORY,
-            f"{JSON_FILE_EXT_LIST_STR};;txt files Compressed File (*.zip);;html files Compressed File (*.zip)",
+            f"{JSON_FILE_EXT_LIST_STR};;{JSONL_FILE_EXT_LIST_STR};;txt files Compressed File (*.zip);;html files Compressed File (*.zip)",
         )
         if file_data[0]:
             filename = file_data[0]
@@ -323,29 +327,34 @@ class ChatMainWidget(QWidget):
                 file_data[1],
             )
             if ext == ".zip":
+                # txt or html
                 compressed_file_type = file_data[1].split(" ")[0].lower()
-                ext_dict: dict[str, dict[str, str | Callable]] = {
-                    "txt": {"ext": ".txt", "func": message_list_to_txt},
-                    "html": {"ext": ".html", "func": conv_unit_to_html},
-                }
-                for id in ids:
-                    row_info = DB.selectThread(id)
-                    # Limit the title length to file name length
-                    title = row_info["name"][:FILE_NAME_LENGTH]
-                    txt_filename = (
-                        f'{title}_{id}{ext_dict[compressed_file_type]["ext"]}'
-                    )
-                    txt_content_func = ext_dict[compressed_file_type]["func"]
-                    assert not isinstance(txt_content_func, str)
-                    txt_content = txt_content_func(DB, id, title)
-                    add_file_to_zip(
-                        txt_content,
-                        txt_filename,
-                        os.path.splitext(filename)[0] + ".zip",
-                    )
-            elif ext == ".json":
-                DB.export(ids, filename)
-            open_directory(os.path.dirname(filename))
+                self.__exportChatInBackground(ids, os.path.splitext(filename)[0] + ".zip", compressed_file_type)
+            elif ext in (".json", ".jsonl"):
+                self.__exportChatInBackground(ids, filename, ext[1:])
+
+    def __exportChatInBackground(self, ids: list[int], filename: str, file_type: str):
+        self.__exportProgressDialog = QProgressDialog(
+            LangClass.TRANSLATIONS["Exporting..."], LangClass.TRANSLATIONS["Cancel"], 0, len(ids), self,
+        )
+        self.__exportProgressDialog.setWindowModality(Qt.WindowModality.WindowModal)
+        self.__exportProgressDialog.setMinimumDuration(0)
+
+        # Write the file in the background
+        self.__exportThread = ChatExportThread(ids, filename, file_type, parent=self)
+        self.__exportThread.progressUpdated.connect(self.__exportProgressDialog.setValue)
+        self.__exportThread.exportFinished.connect(lambda f: open_directory(os.path.dirname(f)))
+        self.__exportThread.errorGenerated.connect(self.__failToExportChat)
+        self.__exportThread.finished.connect(self.__exportProgressDialog.close)
+        self.__exportProgressDialog.canceled.connect(self.__exportThread.cancel)
+        self.__exportThread.start()
+
+    def __failToExportChat(self, error: str):
+        QMessageBox.critical(  # type: ignore[call-arg]
+            self,
+            LangClass.TRANSLATIONS["Error"],
+            error,
+        )
 
     def setColumns(self, columns: list[str]):
         self.__chatNavWidget.setColumns(columns)
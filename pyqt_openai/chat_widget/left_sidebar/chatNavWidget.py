@@ -2,8 +2,8 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from qtpy.QtCore import QSortFilterProxyModel, Qt, Signal
-from qtpy.QtSql import QSqlQuery, QSqlTableModel
+from qtpy.QtCore import QSortFilterProxyModel, QTimer, Qt, Signal
+from qtpy.QtSql import QSqlTableModel
 from qtpy.QtWidgets import (
     QComboBox,
     QDialog,
@@ -18,7 +18,15 @@ from qtpy.QtWidgets import (
     QWidget,
 )
 
-from pyqt_openai import ICON_ADD, ICON_IMPORT, ICON_REFRESH, ICON_SAVE, THREAD_ORDERBY
+from pyqt_openai import (
+    ICON_ADD,
+    ICON_IMPORT,
+    ICON_REFRESH,
+    ICON_SAVE,
+    THREAD_CONTENT_SEARCH_DELAY_MS,
+    THREAD_ORDERBY,
+    THREAD_TABLE_NAME,
+)
 from pyqt_openai.chat_widget.left_sidebar.exportDialog import ExportDialog
 from pyqt_openai.chat_widget.left_sidebar.importDialog import ImportDialog
 from pyqt_openai.chat_widget.left_sidebar.selectChatImportTypeDialog import SelectChatImportTypeDialog
@@ -101,6 +109,13 @@ class ChatNavWidget(BaseNavWidget):
 
     def __initUi(self):
         self.setModel(table_type="chat")
+        self.__showColumns()
+
+        # Search the content when the typing pauses, not on every key
+        self.__contentSearchTimer = QTimer(self)
+        self.__contentSearchTimer.setSingleShot(True)
+        self.__contentSearchTimer.setInterval(THREAD_CONTENT_SEARCH_DELAY_MS)
+        self.__contentSearchTimer.timeout.connect(self.__searchContent)
 
         imageGenerationHistoryLbl = QLabel()
         imageGenerationHistoryLbl.setText(LangClass.TRANSLATIONS["History"])
@@ -220,6 +235,7 @@ class ChatNavWidget(BaseNavWidget):
         self,
         title: str | None = None,
     ):
+        self._model.setFilter("")
         self._model.select()
         # index -1 will be read from all columns
         # otherwise it will be read the current column number indicated by combobox
@@ -278,6 +294,7 @@ class ChatNavWidget(BaseNavWidget):
         self._model.select()
 
     def _search(self, text: str):
+        self.__contentSearchTimer.stop()
         # title
         if self.__searchOptionCmbBox.currentText() == LangClass.TRANSLATIONS["Title"]:
             self.refreshData(text)
@@ -286,17 +303,15 @@ class ChatNavWidget(BaseNavWidget):
             self.__searchOptionCmbBox.currentText() == LangClass.TRANSLATIONS["Content"]
         ):
             if text:
-                threads = DB.selectAllContentOfThread(content_to_select=text)
-                ids = [_[0] for _ in threads]
-                self._model.setQuery(
-                    QSqlQuery(
-                        f"SELECT {','.join(self._columns)} FROM {self._table_nm} "
-                        f"WHERE id IN ({','.join(map(str, ids))})",
-                    ),
-                )
+                self.__contentSearchTimer.start()
             else:
                 self.refreshData()
 
+    def __searchContent(self):
+        ids = DB.searchThreads(self._searchBar.getSearchBar().text())
+        self._model.setFilter(f"{THREAD_TABLE_NAME}.id IN ({','.join(map(str, ids))})")
+        self._model.select()
+
     def isCurrentConvExists(self) -> QModelIndex | None:
         return self._model.rowCount() > 0 and self._tableView.currentIndex() or None
 
@@ -305,7 +320,20 @@ class ChatNavWidget(BaseNavWidget):
         columns: list[str],
         table_type: str = "chat",
     ):
-        super().setColumns(columns, table_type=table_type)
+        # The model always has every column, so only which ones are shown changes
+        self._columns = columns
+        self._model.select()
+        self.__showColumns()
+
+    def __showColumns(self):
+        """Show only the columns in self._columns.
+        The model has the columns of the thread table and its statistics (e.g. message_count) in the order of the query.
+        """
+        record = self._model.record()
+        for i in range(record.count()):
+            name = record.fieldName(i)
+            self._model.setHeaderData(i, Qt.Orientation.Horizontal, name)
+            self._tableView.setColumnHidden(i, name not in self._columns)
 
     def __onFavoriteClicked(self, f: bool):
         self.onFavoriteClicked.emit(f)
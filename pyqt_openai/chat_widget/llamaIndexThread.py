@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import threading
+from queue import Empty, Queue
+
 from llama_index.core.base.response.schema import StreamingResponse
 from qtpy.QtCore import QThread, Signal
 
 from pyqt_openai.models import ChatMessageContainer
+from pyqt_openai.util.chunk_buffer import ChunkBuffer
 
 
 # Should combine with ChatThread
@@ -22,20 +26,54 @@ class LlamaIndexThread(QThread):
         self.__wrapper = wrapper
         self.__query_text = query_text
 
+    def getInfo(self):
+        return self.__info
+
     def stop(self):
         self.__stop = True
 
+    def __readChunks(self, response_gen, chunks: Queue):
+        """Put the chunks of the stream in the queue, so the collected ones can be flushed while the next one is awaited.
+        None is put at the end, and the exception if the stream fails.
+        """
+        try:
+            for chunk in response_gen:
+                if self.__stop:
+                    break
+                chunks.put(chunk)
+        except Exception as e:
+            chunks.put(e)
+        chunks.put(None)
+
     def run(self):
         try:
             resp = self.__wrapper.get_response(self.__query_text)
             f = isinstance(resp, StreamingResponse)
             if f:
-                for chunk in resp.response_gen:
-                    if self.__stop:
-                        self.__info.finish_reason = "stopped by user"
-                        self.streamFinished.emit(self.__info)
+                # The chunks are sent together once per frame, the rest is sent before the stream is finished
+                chunk_buffer = ChunkBuffer()
+                chunks = Queue()
+                threading.Thread(target=self.__readChunks, args=(resp.response_gen, chunks), daemon=True).start()
+                while True:
+                    try:
+                        # Wait for the next chunk only until the collected ones are due
+                        chunk = chunks.get(timeout=None if chunk_buffer.is_empty() else chunk_buffer.get_delay())
+                    except Empty:
+                        self.replyGenerated.emit(chunk_buffer.flush(), True, self.__info)
+                        continue
+                    if chunk is None or self.__stop:
                         break
-                    self.replyGenerated.emit(chunk, True, self.__info)
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    chunk_buffer.add(chunk)
+                    if chunk_buffer.is_due():
+                        self.replyGenerated.emit(chunk_buffer.flush(), True, self.__info)
+                if not chunk_buffer.is_empty():
+                    self.replyGenerated.emit(chunk_buffer.flush(), True, self.__info)
+                if self.__stop:
+                    self.__info.finish_reason = "stopped by user"
+                    self.streamFinished.emit(self.__info)
+                    return
             else:
                 self.__info.content = resp.response
                 # self.__info.prompt_tokens = ""
@@ -41,6 +41,7 @@ from pyqt_openai.lang.translations import LangClass
 from pyqt_openai.util.common import (
     getSeparator,
     init_llama,
+    prewarm_provider,
 )
 from pyqt_openai.widgets.APIInputButton import APIInputButton
 from pyqt_openai.widgets.linkLabel import LinkLabel
@@ -311,6 +312,7 @@ class UsingAPIPage(QWidget):
     def __modelChanged(self, v):
         self.__model = v
         CONFIG_MANAGER.set_general_property("model", v)
+        prewarm_provider(v)
         # TODO LANGUAGE
         additional_message = (
             "\nNote: The selected model is only available at Tier 3 or higher."
@@ -4,7 +4,7 @@ import base64
 
 from qtpy.QtCore import QThread, Signal
 
-from pyqt_openai.globals import OPENAI_CLIENT
+from pyqt_openai.globals import DB, OPENAI_CLIENT, RATE_LIMITER
 from pyqt_openai.models import ImagePromptContainer
 from pyqt_openai.util.common import generate_random_prompt
 
@@ -36,7 +36,9 @@ class DallEThread(QThread):
                     self.__input_args["prompt"] = generate_random_prompt(
                         self.__randomizing_prompt_source_arr,
                     )
-                response = OPENAI_CLIENT.images.generate(**self.__input_args)
+                response = RATE_LIMITER.call(
+                    "OpenAI", OPENAI_CLIENT.images.generate, **self.__input_args,
+                )
                 container = ImagePromptContainer(**self.__input_args)
                 for _ in response.data:
                     image_data = base64.b64decode(_.b64_json)
@@ -44,6 +46,7 @@ class DallEThread(QThread):
                     container.revised_prompt = _.revised_prompt
                     container.width = self.__input_args["size"].split("x")[0]
                     container.height = self.__input_args["size"].split("x")[1]
+                    container.id = DB.insertImage(container)
                     self.replyGenerated.emit(container)
             self.allReplyGenerated.emit()
         except Exception as e:
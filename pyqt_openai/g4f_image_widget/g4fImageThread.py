@@ -1,9 +1,11 @@
 from __future__ import annotations
 
+import time
+
 from pyqt_openai import G4F_PROVIDER_DEFAULT
-from pyqt_openai.globals import G4F_CLIENT
+from pyqt_openai.globals import DB, G4F_CLIENT, PROVIDER_HEALTH, RATE_LIMITER
 from pyqt_openai.models import ImagePromptContainer
-from pyqt_openai.util.common import generate_random_prompt
+from pyqt_openai.util.common import generate_random_prompt, get_provider_name
 from pyqt_openai.util.replicate import download_image_as_base64
 from qtpy.QtCore import QThread, Signal
 
@@ -31,6 +33,8 @@ class G4FImageThread(QThread):
         # try:
             if self.__input_args["provider"] == G4F_PROVIDER_DEFAULT:
                 del self.__input_args["provider"]
+            provider = self.__input_args.get("provider", "")
+            model = self.__input_args["model"]
 
             for _ in range(self.__number_of_images):
                 if self.__stop:
@@ -39,8 +43,19 @@ class G4FImageThread(QThread):
                     self.__input_args["prompt"] = generate_random_prompt(
                         self.__randomizing_prompt_source_arr
                     )
-                response =  G4F_CLIENT.images.generate(
-                    **self.__input_args
+                start_time = time.perf_counter()
+                try:
+                    response = RATE_LIMITER.call(
+                        get_provider_name(model, True, provider),
+                        G4F_CLIENT.images.generate,
+                        **self.__input_args,
+                    )
+                except Exception:
+                    # It's not known which provider failed if it's Auto
+                    PROVIDER_HEALTH.record_error(provider, model)
+                    raise
+                PROVIDER_HEALTH.record_success(
+                    str(response.provider or provider), model, time.perf_counter() - start_time
                 )
                 arg = {
                     **self.__input_args,
@@ -49,6 +64,7 @@ class G4FImageThread(QThread):
                 }
 
                 result = ImagePromptContainer(**arg)
+                result.id = DB.insertImage(result)
                 self.replyGenerated.emit(result)
             self.allReplyGenerated.emit()
 #         except Exception as e:
@@ -1,11 +1,17 @@
 """This is the file that contains the global variables that are used, or possibly used, throughout the application."""
 from __future__ import annotations
 
-from g4f.client import Client
+import litellm
+
+from g4f.client import AsyncClient, Client
 from openai import OpenAI
 
 from pyqt_openai.sqlite import SqliteDatabase
+from pyqt_openai.util.chat_engine import ChatEngine
+from pyqt_openai.util.http_client import get_async_httpx_client, get_httpx_client
 from pyqt_openai.util.llamaindex import LlamaIndexWrapper
+from pyqt_openai.util.provider_health import ProviderHealthRegistry
+from pyqt_openai.util.rate_limiter import ProviderRateLimiter
 from pyqt_openai.util.replicate import ReplicateWrapper
 
 DB = SqliteDatabase()
@@ -13,8 +19,22 @@ DB = SqliteDatabase()
 LLAMAINDEX_WRAPPER = LlamaIndexWrapper()
 
 G4F_CLIENT = Client()
+G4F_ASYNC_CLIENT = AsyncClient()
+
+# Runs the chat requests
+CHAT_ENGINE = ChatEngine()
+
+# Orders the G4F providers when the provider is Auto
+PROVIDER_HEALTH = ProviderHealthRegistry(DB)
+
+# Waits for the limits and the 429 of each provider before the requests are sent
+RATE_LIMITER = ProviderRateLimiter()
+
+# LiteLLM sends the requests to OpenAI and the compatible APIs with these, so their connections are reused
+litellm.client_session = get_httpx_client()
+litellm.aclient_session = get_async_httpx_client()
 
 # For Whisper
-OPENAI_CLIENT = OpenAI(api_key="")
+OPENAI_CLIENT = OpenAI(api_key="", http_client=get_httpx_client())
 
 REPLICATE_CLIENT = ReplicateWrapper(api_key="")
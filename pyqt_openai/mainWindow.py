@@ -4,12 +4,13 @@ import webbrowser
 
 from typing import TYPE_CHECKING
 
-from qtpy.QtCore import Qt
+from qtpy.QtCore import QTimer, Qt
 from qtpy.QtGui import QIcon
 from qtpy.QtWidgets import (
     QAction,  # pyright: ignore[reportPrivateImportUsage]
     QApplication,
     QDialog,
+    QFileDialog,
     QHBoxLayout,
     QMainWindow,
     QMenu,
@@ -25,6 +26,7 @@ from qtpy.QtWidgets import (
 
 from pyqt_openai import (
     APP_INITIAL_WINDOW_SIZE,
+    DB_BACKUP_CHECK_INTERVAL_MS,
     DEFAULT_APP_ICON,
     DEFAULT_APP_NAME,
     DEFAULT_SHORTCUT_FOCUS_MODE,
@@ -60,13 +62,25 @@ from pyqt_openai.customizeDialog import CustomizeDialog
 from pyqt_openai.dalle_widget.dalleMainWidget import DallEMainWidget
 from pyqt_openai.doNotAskAgainDialog import DoNotAskAgainDialog
 from pyqt_openai.g4f_image_widget.g4fImageMainWidget import G4FImageMainWidget
+from pyqt_openai.globals import DB
 from pyqt_openai.lang.translations import LangClass
 from pyqt_openai.models import CustomizeParamsContainer, SettingsParamsContainer
 from pyqt_openai.replicate_widget.replicateMainWidget import ReplicateMainWidget
 from pyqt_openai.settings_dialog.settingsDialog import SettingsDialog
 from pyqt_openai.shortcutDialog import ShortcutDialog
 from pyqt_openai.updateSoftwareDialog import update_software
-from pyqt_openai.util.common import init_llama, restart_app, set_api_key, set_auto_start_windows, show_message_box_after_change_to_restart
+from pyqt_openai.util.common import (
+    DatabaseTaskThread,
+    backup_database,
+    get_image_thumbnail_thread,
+    get_snapshot_store,
+    init_llama,
+    restart_app,
+    restore_database,
+    set_api_key,
+    set_auto_start_windows,
+    show_message_box_after_change_to_restart,
+)
 from pyqt_openai.widgets.navWidget import NavBar
 
 if TYPE_CHECKING:
@@ -93,6 +107,9 @@ class MainWindow(QMainWindow):
     def __initUi(self):
         self.setWindowTitle(DEFAULT_APP_NAME)
 
+        # The previews of the images are made when the image widgets are created
+        get_image_thumbnail_thread().errorGenerated.connect(self.__failToRunDatabaseTask)
+
         self.__chatMainWidget: ChatMainWidget = ChatMainWidget(self)
         self.__dallEWidget: DallEMainWidget = DallEMainWidget(self)
         self.__replicateWidget: ReplicateMainWidget = ReplicateMainWidget(self)
@@ -110,6 +127,10 @@ class MainWindow(QMainWindow):
         self.__setToolBar()
 
         self.__loadApiKeys()
+        self.__migrateImageData()
+        self.__countMessageTokens()
+        self.__archiveThreads()
+        self.__scheduleDatabaseBackup()
 
         self.setCentralWidget(self.__mainWidget)
         self.resize(*APP_INITIAL_WINDOW_SIZE)
@@ -122,6 +143,139 @@ class MainWindow(QMainWindow):
         set_api_key("REPLICATE_API_KEY", CONFIG_MANAGER.get_general_property("REPLICATE_API_KEY"))
         init_llama()
 
+    def __runDatabaseBatches(self, task) -> DatabaseTaskThread:
+        thread = DatabaseTaskThread(task, batch=True, parent=self)
+        thread.errorGenerated.connect(self.__failToRunDatabaseTask)
+        # Finish the current batch before quitting
+        app: QCoreApplication | None = QApplication.instance()
+        assert app is not None
+        app.aboutToQuit.connect(thread.stop)
+        app.aboutToQuit.connect(thread.wait)
+        thread.start()
+        return thread
+
+    def __failToRunDatabaseTask(self, error: str):
+        QMessageBox.critical(self, LangClass.TRANSLATIONS["Error"], error)
+
+    def __migrateImageData(self):
+        # Move the images saved before the blob store is turned on, in the background
+        if CONFIG_MANAGER.get_general_property("image_blob_store"):
+            self.__imageBlobMigrationThread = self.__runDatabaseBatches(DB.migrateImageDataToBlobStore)
+
+    def __countMessageTokens(self):
+        # Count the tokens of the messages saved before the token count is kept, in the background
+        self.__messageTokenCountThread = self.__runDatabaseBatches(DB.countMessageTokens)
+
+    def __archiveThreads(self):
+        # Move the messages of the threads which haven't been updated for long into the archive, in the background
+        if CONFIG_MANAGER.get_general_property("archive_threads"):
+            days = int(CONFIG_MANAGER.get_general_property("archive_thread_days") or 365)
+            self.__threadArchiveThread = self.__runDatabaseBatches(lambda: DB.archiveOldThreads(days))
+
+    def __compactDatabase(self):
+        self.__compactDatabaseAction.setEnabled(False)
+        self.__databaseCompactThread = DatabaseTaskThread(DB.compactDatabase, parent=self)
+        self.__databaseCompactThread.taskFinished.connect(self.__afterCompactDatabase)
+        self.__databaseCompactThread.errorGenerated.connect(self.__failToCompactDatabase)
+        self.__databaseCompactThread.finished.connect(lambda: self.__compactDatabaseAction.setEnabled(True))
+        self.__databaseCompactThread.start()
+
+    def __afterCompactDatabase(self, freed: int):
+        QMessageBox.information(
+            self,
+            LangClass.TRANSLATIONS["Info"],
+            f'{LangClass.TRANSLATIONS["The database has been compacted."]} ({freed / 1024 / 1024:.1f} MB)',
+        )
+
+    def __failToCompactDatabase(self, error: str):
+        QMessageBox.critical(self, LangClass.TRANSLATIONS["Error"], error)
+
+    def __scheduleDatabaseBackup(self):
+        # Check regularly whether the snapshot is due, so it's taken even if the app keeps running for days
+        self.__databaseBackupThread = None
+        self.__databaseBackupTimer = QTimer(self)
+        self.__databaseBackupTimer.timeout.connect(self.__backupDatabaseIfDue)
+        self.__databaseBackupTimer.start(DB_BACKUP_CHECK_INTERVAL_MS)
+        self.__backupDatabaseIfDue()
+
+    def __backupDatabaseIfDue(self):
+        if CONFIG_MANAGER.get_general_property("db_backup"):
+            interval_hours = int(CONFIG_MANAGER.get_general_property("db_backup_interval_hours") or 24)
+            if get_snapshot_store().is_due(interval_hours):
+                self.__backupDatabase(notify=False)
+
+    def __backupDatabase(self, notify=True):
+        if self.__databaseBackupThread is not None and self.__databaseBackupThread.isRunning():
+            return
+        self.__backupDatabaseAction.setEnabled(False)
+        self.__restoreDatabaseAction.setEnabled(False)
+        keep_count = int(CONFIG_MANAGER.get_general_property("db_backup_keep_count") or 7)
+        # The backup stops when the thread is stopped
+        t = DatabaseTaskThread(lambda: backup_database(keep_count, is_cancelled=t.isStopped), parent=self)
+        self.__databaseBackupThread = t
+        # The scheduled snapshot is taken silently, but its failure is shown as well
+        if notify:
+            self.__databaseBackupThread.taskFinished.connect(self.__afterBackupDatabase)
+        self.__databaseBackupThread.errorGenerated.connect(self.__failToBackupDatabase)
+        self.__databaseBackupThread.finished.connect(lambda: self.__backupDatabaseAction.setEnabled(True))
+        self.__databaseBackupThread.finished.connect(lambda: self.__restoreDatabaseAction.setEnabled(True))
+        # Stop copying before quitting, the half-written snapshot is removed
+        app: QCoreApplication | None = QApplication.instance()
+        assert app is not None
+        app.aboutToQuit.connect(self.__databaseBackupThread.stop)
+        app.aboutToQuit.connect(self.__databaseBackupThread.wait)
+        self.__databaseBackupThread.start()
+
+    def __afterBackupDatabase(self, filename: str | None):
+        # None if it's cancelled
+        if not filename:
+            return
+        QMessageBox.information(
+            self,
+            LangClass.TRANSLATIONS["Info"],
+            f'{LangClass.TRANSLATIONS["The snapshot of the database has been saved."]}\n{filename}',
+        )
+
+    def __failToBackupDatabase(self, error: str):
+        QMessageBox.critical(self, LangClass.TRANSLATIONS["Error"], error)
+
+    def __restoreDatabase(self):
+        if self.__databaseBackupThread is not None and self.__databaseBackupThread.isRunning():
+            return
+        filename = QFileDialog.getOpenFileName(
+            self,
+            LangClass.TRANSLATIONS["Restore Database"],
+            get_snapshot_store().get_directory(),
+            "SQLite Database File (*.db)",
+        )
+        if filename[0]:
+            reply = QMessageBox.question(
+                self,
+                LangClass.TRANSLATIONS["Restore Database"],
+                LangClass.TRANSLATIONS["The current database will be replaced with the snapshot, after it is saved as the snapshot as well. Are you sure?"],
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            )
+            if reply == QMessageBox.StandardButton.Yes:
+                self.__backupDatabaseAction.setEnabled(False)
+                self.__restoreDatabaseAction.setEnabled(False)
+                self.__databaseRestoreThread = DatabaseTaskThread(lambda: restore_database(filename[0]), parent=self)
+                self.__databaseRestoreThread.taskFinished.connect(lambda _: self.__afterRestoreDatabase())
+                self.__databaseRestoreThread.errorGenerated.connect(self.__failToRestoreDatabase)
+                self.__databaseRestoreThread.start()
+
+    def __afterRestoreDatabase(self):
+        QMessageBox.information(
+            self,
+            LangClass.TRANSLATIONS["Info"],
+            LangClass.TRANSLATIONS["The database has been restored. The application will restart."],
+        )
+        restart_app()
+
+    def __failToRestoreDatabase(self, error: str):
+        self.__backupDatabaseAction.setEnabled(True)
+        self.__restoreDatabaseAction.setEnabled(True)
+        QMessageBox.critical(self, LangClass.TRANSLATIONS["Error"], error)
+
     def __setActions(self):
         self.__langAction = QAction()
 
@@ -129,6 +283,15 @@ class MainWindow(QMainWindow):
         self.__exitAction = QAction(LangClass.TRANSLATIONS["Exit"], self)
         self.__exitAction.triggered.connect(self.__beforeClose)
 
+        self.__compactDatabaseAction = QAction(LangClass.TRANSLATIONS["Compact Database"], self)
+        self.__compactDatabaseAction.triggered.connect(self.__compactDatabase)
+
+        self.__backupDatabaseAction = QAction(LangClass.TRANSLATIONS["Back Up Database"], self)
+        self.__backupDatabaseAction.triggered.connect(lambda: self.__backupDatabase())
+
+        self.__restoreDatabaseAction = QAction(LangClass.TRANSLATIONS["Restore Database"], self)
+        self.__restoreDatabaseAction.triggered.connect(self.__restoreDatabase)
+
         self.__stackAction = QAction(LangClass.TRANSLATIONS["Stack on Top"], self)
         self.__stackAction.setShortcut(DEFAULT_SHORTCUT_STACK_ON_TOP)
         self.__stackAction.setIcon(QIcon(ICON_STACKONTOP))
@@ -256,6 +419,9 @@ class MainWindow(QMainWindow):
 
         fileMenu = QMenu(LangClass.TRANSLATIONS["File"], self)
         fileMenu.addAction(self.__settingsAction)
+        fileMenu.addAction(self.__compactDatabaseAction)
+        fileMenu.addAction(self.__backupDatabaseAction)
+        fileMenu.addAction(self.__restoreDatabaseAction)
         fileMenu.addAction(self.__exitAction)
 
         viewMenu = QMenu(LangClass.TRANSLATIONS["View"], self)
@@ -401,6 +567,9 @@ class MainWindow(QMainWindow):
             prev_db = CONFIG_MANAGER.get_general_property("db")
             prev_show_secondary_toolbar = CONFIG_MANAGER.get_general_property("show_secondary_toolbar")
             prev_show_as_markdown = CONFIG_MANAGER.get_general_property("show_as_markdown")
+            prev_db_wal_mode = CONFIG_MANAGER.get_general_property("db_wal_mode")
+            prev_image_blob_store = CONFIG_MANAGER.get_general_property("image_blob_store")
+            prev_archive_threads = CONFIG_MANAGER.get_general_property("archive_threads")
             prev_run_at_startup = CONFIG_MANAGER.get_general_property("run_at_startup")
 
             for k, v in container.get_items():
@@ -424,12 +593,24 @@ class MainWindow(QMainWindow):
                         continue
                     currentWidget.showSecondaryToolBar(container.show_secondary_toolbar)
             # If properties that require a restart are changed
-            if container.lang != self.__lang or container.show_as_markdown != prev_show_as_markdown:
+            if (
+                container.lang != self.__lang
+                or container.show_as_markdown != prev_show_as_markdown
+                or container.db_wal_mode != prev_db_wal_mode
+                or container.image_blob_store != prev_image_blob_store
+                or container.archive_threads != prev_archive_threads
+            ):
                 change_list = []
                 if container.lang != self.__lang:
                     change_list.append(LangClass.TRANSLATIONS["Language"])
                 if container.show_as_markdown != prev_show_as_markdown:
                     change_list.append(LangClass.TRANSLATIONS["Show as Markdown"])
+                if container.db_wal_mode != prev_db_wal_mode:
+                    change_list.append(LangClass.TRANSLATIONS["Write to the database in the background (WAL mode)"])
+                if container.image_blob_store != prev_image_blob_store:
+                    change_list.append(LangClass.TRANSLATIONS["Save generated images as files outside of the database"])
+                if container.archive_threads != prev_archive_threads:
+                    change_list.append(LangClass.TRANSLATIONS["Archive the threads which haven't been updated for"])
                 result = show_message_box_after_change_to_restart(change_list)
                 if result == QMessageBox.StandardButton.Yes:
                     restart_app()
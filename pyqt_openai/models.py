@@ -75,6 +75,10 @@ class ChatThreadContainer(Container):
     name: str = ""
     insert_dt: str = ""
     update_dt: str = ""
+    message_count: int = 0
+    total_tokens: int = 0
+    last_model: str = ""
+    last_message: str = ""
 
 
 @dataclass
@@ -95,6 +99,12 @@ class ChatMessageContainer(Container):
     is_json_response_available: str = "0"
     is_g4f: int = 0
     provider: str = ""
+    # Tokens of the message which are counted when it's inserted (None for the archived messages of the older versions)
+    token_count: int | None = None
+    # Whether the response is replayed from the response cache
+    is_cached: int = 0
+    # e.g. COMPARE_MESSAGE_TAG for the replies of the compare mode
+    tag: str = ""
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -112,6 +122,8 @@ class ImagePromptContainer(Container):
     n: str = ""
     quality: str = ""
     data: str = ""
+    data_hash: str = ""
+    data_size: int = 0
     style: str = ""
     revised_prompt: str = ""
     update_dt: str = ""
@@ -121,10 +133,34 @@ class ImagePromptContainer(Container):
         super().__init__(**kwargs)
 
 
+@dataclass
+class ProviderHealthContainer(Container):
+    provider: str = ""
+    model: str = ""
+    # Moving averages, decayed over time (See ProviderHealthRegistry)
+    ttft: float = 0.0
+    throughput: float = 0.0
+    error_rate: float = 0.0
+    run_count: int = 0
+    # Unix time of the last run
+    update_time: float = 0.0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+
 @dataclass
 class SettingsParamsContainer(Container):
     lang: str = LangClass.lang_changed() or ""
     db: str = DB_FILE_NAME
+    db_wal_mode: bool = False
+    image_blob_store: bool = False
+    archive_threads: bool = False
+    archive_thread_days: int = 365
+    db_backup: bool = False
+    db_backup_interval_hours: int = 24
+    db_backup_keep_count: int = 7
+    response_cache: bool = False
     do_not_ask_again: bool = False
     notify_finish: bool = True
     show_secondary_toolbar: bool = True
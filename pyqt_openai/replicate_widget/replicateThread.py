@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from qtpy.QtCore import QThread, Signal
 
-from pyqt_openai.globals import REPLICATE_CLIENT
+from pyqt_openai.globals import DB, RATE_LIMITER, REPLICATE_CLIENT
 from pyqt_openai.models import ImagePromptContainer
 from pyqt_openai.util.common import generate_random_prompt
 
@@ -35,9 +35,13 @@ class ReplicateThread(QThread):
                     self.__input_args["prompt"] = generate_random_prompt(
                         self.__randomizing_prompt_source_arr,
                     )
-                result = REPLICATE_CLIENT.get_image_response(
-                    model=self.__input_args["model"], input_args=self.__input_args,
+                result = RATE_LIMITER.call(
+                    "Replicate",
+                    REPLICATE_CLIENT.get_image_response,
+                    model=self.__input_args["model"],
+                    input_args=self.__input_args,
                 )
+                result.id = DB.insertImage(result)
                 self.replyGenerated.emit(result)
             self.allReplyGenerated.emit()
         except Exception as e:
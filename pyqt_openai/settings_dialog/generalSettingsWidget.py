@@ -21,10 +21,13 @@ from qtpy.QtWidgets import (
 from pyqt_openai import (
     COLUMN_TO_EXCLUDE_FROM_SHOW_HIDE_CHAT,
     COLUMN_TO_EXCLUDE_FROM_SHOW_HIDE_IMAGE,
+    DB_BACKUP_INTERVAL_HOURS_RANGE,
+    DB_BACKUP_KEEP_COUNT_RANGE,
     DB_NAME_REGEX,
     DEFAULT_WARNING_COLOR,
     LANGUAGE_DICT,
     MAXIMUM_MESSAGES_IN_PARAMETER_RANGE,
+    THREAD_ARCHIVE_DAYS_RANGE,
 )
 from pyqt_openai.config_loader import CONFIG_MANAGER
 from pyqt_openai.lang.translations import LangClass
@@ -41,6 +44,14 @@ class GeneralSettingsWidget(QScrollArea):
     def __initVal(self):
         self.lang = CONFIG_MANAGER.get_general_property("lang")
         self.db = CONFIG_MANAGER.get_general_property("db")
+        self.db_wal_mode = CONFIG_MANAGER.get_general_property("db_wal_mode")
+        self.image_blob_store = CONFIG_MANAGER.get_general_property("image_blob_store")
+        self.archive_threads = CONFIG_MANAGER.get_general_property("archive_threads")
+        self.archive_thread_days = CONFIG_MANAGER.get_general_property("archive_thread_days")
+        self.db_backup = CONFIG_MANAGER.get_general_property("db_backup")
+        self.db_backup_interval_hours = CONFIG_MANAGER.get_general_property("db_backup_interval_hours")
+        self.db_backup_keep_count = CONFIG_MANAGER.get_general_property("db_backup_keep_count")
+        self.response_cache = CONFIG_MANAGER.get_general_property("response_cache")
         self.do_not_ask_again = CONFIG_MANAGER.get_general_property("do_not_ask_again")
         self.notify_finish = CONFIG_MANAGER.get_general_property("notify_finish")
         self.show_secondary_toolbar = CONFIG_MANAGER.get_general_property(
@@ -90,6 +101,58 @@ class GeneralSettingsWidget(QScrollArea):
         )
         dbLayout.addWidget(self.__dbLineEdit)
 
+        self.__dbWalModeCheckBox = QCheckBox(
+            LangClass.TRANSLATIONS["Write to the database in the background (WAL mode)"],
+        )
+        self.__dbWalModeCheckBox.setChecked(self.db_wal_mode)
+
+        self.__imageBlobStoreCheckBox = QCheckBox(
+            LangClass.TRANSLATIONS["Save generated images as files outside of the database"],
+        )
+        self.__imageBlobStoreCheckBox.setChecked(self.image_blob_store)
+
+        self.__archiveThreadsCheckBox = QCheckBox(
+            LangClass.TRANSLATIONS["Archive the threads which haven't been updated for"],
+        )
+        self.__archiveThreadsCheckBox.setChecked(self.archive_threads)
+        self.__archiveThreadDaysSpinBox = QSpinBox()
+        self.__archiveThreadDaysSpinBox.setRange(*THREAD_ARCHIVE_DAYS_RANGE)
+        self.__archiveThreadDaysSpinBox.setValue(self.archive_thread_days)
+        self.__archiveThreadDaysSpinBox.setSuffix(f' {LangClass.TRANSLATIONS["days"]}')
+        self.__archiveThreadDaysSpinBox.setEnabled(self.archive_threads)
+        self.__archiveThreadsCheckBox.toggled.connect(self.__archiveThreadDaysSpinBox.setEnabled)
+
+        archiveLayout = QHBoxLayout()
+        archiveLayout.addWidget(self.__archiveThreadsCheckBox)
+        archiveLayout.addWidget(self.__archiveThreadDaysSpinBox)
+
+        self.__dbBackupCheckBox = QCheckBox(
+            LangClass.TRANSLATIONS["Take a snapshot of the database every"],
+        )
+        self.__dbBackupCheckBox.setChecked(self.db_backup)
+        self.__dbBackupIntervalSpinBox = QSpinBox()
+        self.__dbBackupIntervalSpinBox.setRange(*DB_BACKUP_INTERVAL_HOURS_RANGE)
+        self.__dbBackupIntervalSpinBox.setValue(self.db_backup_interval_hours)
+        self.__dbBackupIntervalSpinBox.setSuffix(f' {LangClass.TRANSLATIONS["hours"]}')
+        self.__dbBackupKeepCountSpinBox = QSpinBox()
+        self.__dbBackupKeepCountSpinBox.setRange(*DB_BACKUP_KEEP_COUNT_RANGE)
+        self.__dbBackupKeepCountSpinBox.setValue(self.db_backup_keep_count)
+        self.__dbBackupKeepCountSpinBox.setPrefix(f'{LangClass.TRANSLATIONS["Keep"]} ')
+        self.__dbBackupIntervalSpinBox.setEnabled(self.db_backup)
+        self.__dbBackupKeepCountSpinBox.setEnabled(self.db_backup)
+        self.__dbBackupCheckBox.toggled.connect(self.__dbBackupIntervalSpinBox.setEnabled)
+        self.__dbBackupCheckBox.toggled.connect(self.__dbBackupKeepCountSpinBox.setEnabled)
+
+        dbBackupLayout = QHBoxLayout()
+        dbBackupLayout.addWidget(self.__dbBackupCheckBox)
+        dbBackupLayout.addWidget(self.__dbBackupIntervalSpinBox)
+        dbBackupLayout.addWidget(self.__dbBackupKeepCountSpinBox)
+
+        self.__responseCacheCheckBox = QCheckBox(
+            LangClass.TRANSLATIONS["Reuse the saved response of the same request (Temperature 0 only)"],
+        )
+        self.__responseCacheCheckBox.setChecked(self.response_cache)
+
         # Checkboxes
         self.__doNotAskAgainCheckBox = QCheckBox(
             f'{LangClass.TRANSLATIONS["Do not ask again when closing"]} ({LangClass.TRANSLATIONS["Always close the application"]})',
@@ -125,6 +188,11 @@ class GeneralSettingsWidget(QScrollArea):
         lay = QVBoxLayout()
         lay.addWidget(langWidget)
         lay.addLayout(dbLayout)
+        lay.addWidget(self.__dbWalModeCheckBox)
+        lay.addWidget(self.__imageBlobStoreCheckBox)
+        lay.addLayout(archiveLayout)
+        lay.addLayout(dbBackupLayout)
+        lay.addWidget(self.__responseCacheCheckBox)
         lay.addWidget(self.__doNotAskAgainCheckBox)
         lay.addWidget(self.__notifyFinishCheckBox)
         lay.addWidget(self.__showSecondaryToolBarChkBox)
@@ -242,6 +310,14 @@ class GeneralSettingsWidget(QScrollArea):
         return {
             "lang": self.__langCmbBox.currentText(),
             "db": self.__dbLineEdit.text(),
+            "db_wal_mode": self.__dbWalModeCheckBox.isChecked(),
+            "image_blob_store": self.__imageBlobStoreCheckBox.isChecked(),
+            "archive_threads": self.__archiveThreadsCheckBox.isChecked(),
+            "archive_thread_days": self.__archiveThreadDaysSpinBox.value(),
+            "db_backup": self.__dbBackupCheckBox.isChecked(),
+            "db_backup_interval_hours": self.__dbBackupIntervalSpinBox.value(),
+            "db_backup_keep_count": self.__dbBackupKeepCountSpinBox.value(),
+            "response_cache": self.__responseCacheCheckBox.isChecked(),
             "do_not_ask_again": self.__doNotAskAgainCheckBox.isChecked(),
             "notify_finish": self.__notifyFinishCheckBox.isChecked(),
             "show_secondary_toolbar": self.__showSecondaryToolBarChkBox.isChecked(),
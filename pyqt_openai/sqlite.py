@@ -1,24 +1,80 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
+import queue
 import sqlite3
-
+import tempfile
+import threading
+import zlib
+
+from collections import Counter
+from collections.abc import Iterable
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import groupby, islice
 from typing import TYPE_CHECKING
 
+import filetype
+
 from pyqt_openai import (
+    CHAT_FILE_MESSAGE_DELETED_TR_NAME,
+    CHAT_FILE_MESSAGE_FILE_ID_INDEX_NAME,
+    CHAT_FILE_MESSAGE_TABLE_NAME,
+    CHAT_FILE_MESSAGE_THREAD_ID_INDEX_NAME,
     CHAT_FILE_TABLE_NAME,
+    CONTEXT_TOKEN_COUNT_BATCH_SIZE,
+    DB_BACKUP_PAGES_PER_STEP,
+    DB_IMPORT_BATCH_SIZE,
+    DB_WRITER_BATCH_SIZE,
     DEFAULT_DATETIME_FORMAT,
+    IMAGE_BLOB_MIGRATION_BATCH_SIZE,
+    IMAGE_BLOB_STORE_DIR_NAME,
+    IMAGE_INSERT_DT_INDEX_NAME,
     IMAGE_TABLE_NAME,
+    IMAGE_THUMBNAIL_BATCH_SIZE,
+    IMAGE_THUMBNAIL_SIZES,
+    IMAGE_THUMBNAIL_TABLE_NAME,
+    MESSAGE_ARCHIVE_TABLE_NAME,
+    MESSAGE_ARCHIVE_THREAD_ID_INDEX_NAME,
+    MESSAGE_FAVORITE_INDEX_NAME,
+    MESSAGE_FTS_DELETED_TR_NAME,
+    MESSAGE_FTS_INSERTED_TR_NAME,
+    MESSAGE_FTS_MIN_QUERY_LENGTH,
+    MESSAGE_FTS_TABLE_NAME,
+    MESSAGE_FTS_UPDATED_TR_NAME,
+    MESSAGE_PAGE_SIZE,
+    MESSAGE_SEARCH_SNIPPET_LENGTH,
     MESSAGE_TABLE_NAME,
+    MESSAGE_THREAD_ID_INDEX_NAME,
+    MESSAGE_TOKEN_COUNT_INDEX_NAME,
+    MAXIMUM_MESSAGES_IN_PARAMETER,
     PROMPT_ENTRY_TABLE_NAME,
+    PROVIDER_HEALTH_TABLE_NAME,
+    RESPONSE_CACHE_ACCESS_DT_INDEX_NAME,
+    RESPONSE_CACHE_MAX_SIZE,
+    RESPONSE_CACHE_TABLE_NAME,
+    RESPONSE_CACHE_TTL_DAYS,
+    THREAD_ARCHIVE_BATCH_SIZE,
+    THREAD_ARCHIVE_DB_SUFFIX,
+    THREAD_ARCHIVE_SCHEMA_NAME,
+    THREAD_CONTENT_SEARCH_LIMIT,
     PROMPT_GROUP_TABLE_NAME,
+    THREAD_INSERT_DT_INDEX_NAME,
     THREAD_MESSAGE_DELETED_TR_NAME,
     THREAD_MESSAGE_INSERTED_TR_NAME,
     THREAD_MESSAGE_UPDATED_TR_NAME,
+    THREAD_STATS_DELETED_TR_NAME,
+    THREAD_STATS_INSERTED_TR_NAME,
+    THREAD_STATS_PREVIEW_LENGTH,
+    THREAD_STATS_TABLE_NAME,
+    THREAD_STATS_UPDATED_TR_NAME,
     THREAD_TABLE_NAME,
     THREAD_TRIGGER_NAME,
+    THREAD_UPDATE_DT_INDEX_NAME,
+    TRIGGER_GUARD_TABLE_NAME,
     get_config_directory,
 )
 from pyqt_openai.config_loader import CONFIG_MANAGER
@@ -26,7 +82,10 @@ from pyqt_openai.models import (
     ChatMessageContainer,
     PromptEntryContainer,
     PromptGroupContainer,
+    ProviderHealthContainer,
 )
+from pyqt_openai.util.blob_store import BlobStore
+from pyqt_openai.util.token_counter import count_message_tokens
 
 if TYPE_CHECKING:
     from pyqt_openai.models import (
@@ -42,43 +101,323 @@ def get_db_filename():
     return db_path
 
 
+def get_archive_filename(db_filename):
+    """Get the file name of the archive of the database, which is next to it (e.g. conv_archive.db)."""
+    return os.path.splitext(db_filename)[0] + THREAD_ARCHIVE_DB_SUFFIX + ".db"
+
+
+def compress_text(text):
+    """Compress the text for the archive. This is registered to each connection as zlib_compress."""
+    if text is None:
+        return None
+    return zlib.compress(text.encode("utf-8"))
+
+
+def decompress_text(data):
+    """Decompress the text compressed by compress_text. This is registered to each connection as zlib_decompress."""
+    if data is None:
+        return None
+    return zlib.decompress(data).decode("utf-8")
+
+
+class _BackupCancelled(Exception):
+    """Raised in the progress callback of the backup API to stop the backup."""
+
+
+class SqliteWriter(threading.Thread):
+    """The thread which owns the only connection that writes to the database.
+    Writes which are queued while the previous group is being committed are committed together in one transaction.
+    """
+
+    def __init__(self, db_filename, batch_size=DB_WRITER_BATCH_SIZE, init_connection=None):
+        """:param init_connection: The function called with the connection when it is made (e.g. to attach the other database)"""
+        super().__init__(name="SqliteWriter", daemon=True)
+        self.__db_filename = db_filename
+        self.__batch_size = batch_size
+        self.__init_connection = init_connection
+        self.__queue = queue.Queue()
+
+    def submit(self, func) -> Future:
+        """Queue func, which takes a cursor and writes with it.
+        The returned Future has the return value of func after the group including it is committed.
+        """
+        future = Future()
+        self.__queue.put((func, future))
+        return future
+
+    def stop(self):
+        """Commit every write left in the queue and stop the thread."""
+        self.__queue.put(None)
+        self.join()
+
+    def run(self):
+        # isolation_level=None to begin and commit the transaction explicitly
+        conn = sqlite3.connect(self.__db_filename, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        if self.__init_connection is not None:
+            self.__init_connection(conn)
+        c = conn.cursor()
+
+        running = True
+        while running:
+            jobs = [self.__queue.get()]
+            while len(jobs) < self.__batch_size:
+                try:
+                    jobs.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in jobs:
+                running = False
+                jobs = [job for job in jobs if job is not None]
+            if jobs:
+                self.__commitGroup(c, jobs)
+        conn.close()
+
+    def __commitGroup(self, c, jobs):
+        results = []
+        c.execute("BEGIN")
+        for func, future in jobs:
+            # Savepoint for each write, so the failed one doesn't roll back the others in the group
+            c.execute("SAVEPOINT write")
+            try:
+                results.append((future, func(c), None))
+                c.execute("RELEASE write")
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                c.execute("ROLLBACK TO write")
+                c.execute("RELEASE write")
+                results.append((future, None, e))
+        try:
+            c.execute("COMMIT")
+        except sqlite3.Error as e:
+            print(f"An error occurred while committing: {e}")
+            c.execute("ROLLBACK")
+            results = [(future, None, e) for future, _, _ in results]
+
+        for future, result, e in results:
+            if e is None:
+                future.set_result(result)
+            else:
+                future.set_exception(e)
+
+
 class SqliteDatabase:
     """Functions which only meant to be used frequently are defined.
     If there is no functions you want to use, use ``getCursor`` instead.
+
+    This can be used from any thread (e.g. QThread), because each thread gets its own connection when it first uses the database.
+
+    If WAL mode is on, every write goes through the writer thread (SqliteWriter), while reads keep using the connection of the caller's thread.
+    Methods which have ``wait`` argument return Future of the result instead of the result itself if it is False.
     """
 
-    def __init__(self, db_filename=get_db_filename()):
+    def __init__(self, db_filename=get_db_filename(), wal_mode=None, use_blob_store=None, archive_threads=None):
         super().__init__()
-        self.__initVal(db_filename)
+        self.__initVal(db_filename, wal_mode, use_blob_store, archive_threads)
         self.__initDb()
 
-    def __initVal(self, db_filename):
+    def __initVal(self, db_filename, wal_mode, use_blob_store, archive_threads):
         # DB file name
         self.__db_filename = db_filename or get_db_filename()
+        # WAL mode with the writer thread (Opt-in)
+        if wal_mode is None:
+            wal_mode = bool(CONFIG_MANAGER.get_general_property("db_wal_mode"))
+        self.__wal_mode = wal_mode
+        self.__writer = None
+        # The connection and cursor of each thread
+        self.__local = threading.local()
+        # Only the thread which created this stops the writer when closing
+        self.__owner_thread_id = threading.get_ident()
+        # Keep the image data in the content-addressed files instead of the image table (Opt-in)
+        if use_blob_store is None:
+            use_blob_store = bool(CONFIG_MANAGER.get_general_property("image_blob_store"))
+        self.__use_blob_store = use_blob_store
+        # The store is always available to read the images moved into it, even after it's turned off
+        self.__blob_store = BlobStore(os.path.join(get_config_directory(), IMAGE_BLOB_STORE_DIR_NAME))
+        # The number of the blobs of each hash which are put but whose rows are not committed yet,
+        # so removeImage doesn't remove the blob which the other thread is about to refer to
+        self.__pending_blobs = Counter()
+        self.__blob_lock = threading.Lock()
+        # Whether the full-text index of the messages can be used (SQLite can be built without FTS5)
+        self.__is_fts_available = False
+        # Move the messages of the old threads into the archive database (Opt-in)
+        if archive_threads is None:
+            archive_threads = bool(CONFIG_MANAGER.get_general_property("archive_threads"))
+        self.__archive_filename = get_archive_filename(self.__db_filename)
+        # The archive is always attached if it exists, to read the threads archived before it's turned off
+        self.__use_archive = archive_threads or os.path.exists(self.__archive_filename)
+
+    @property
+    def __conn(self) -> sqlite3.Connection:
+        """The connection of the current thread."""
+        return self.__getThreadLocal().conn
+
+    @property
+    def __c(self) -> sqlite3.Cursor:
+        """The cursor of the current thread."""
+        return self.__getThreadLocal().c
+
+    def __getThreadLocal(self):
+        """Connect to the database (create a new file if it doesn't exist) if the current thread isn't connected yet.
+        sqlite3 connection can't be shared between threads, so each thread has its own connection.
+        It is closed when the thread ends, or when close() is called in the thread.
+        """
+        if not hasattr(self.__local, "conn"):
+            conn = sqlite3.connect(self.__db_filename)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA foreign_keys = ON;")
+            if self.__wal_mode:
+                # NORMAL syncs to the disk only at checkpoints in WAL mode
+                conn.execute("PRAGMA synchronous = NORMAL;")
+            self.__initConnection(conn)
+            self.__local.conn = conn
+            self.__local.c = conn.cursor()
+        return self.__local
+
+    def __initConnection(self, conn):
+        """Prepare every connection (including the ones of the writer and the long transactions) for the archive."""
+        conn.create_function("zlib_compress", 1, compress_text, deterministic=True)
+        conn.create_function("zlib_decompress", 1, decompress_text, deterministic=True)
+        if self.__use_archive:
+            conn.execute(f"ATTACH DATABASE ? AS {THREAD_ARCHIVE_SCHEMA_NAME}", (self.__archive_filename,))
 
     def __initDb(self):
         try:
-            # Connect to the database (create a new file if it doesn't exist)
-            self.__conn = sqlite3.connect(self.__db_filename)
-            self.__conn.row_factory = sqlite3.Row
-            self.__conn.execute("PRAGMA foreign_keys = ON;")
+            if self.__wal_mode:
+                # Readers don't block the writer and vice versa
+                self.__conn.execute("PRAGMA journal_mode = WAL;")
+            elif self.__conn.execute("PRAGMA journal_mode;").fetchone()[0] == "wal":
+                # WAL mode is persistent, so turn it back
+                self.__conn.execute("PRAGMA journal_mode = DELETE;")
             self.__conn.commit()
 
-            # create cursor
-            self.__c = self.__conn.cursor()
+            # create or update the tables
+            self.__migrate()
 
-            # create conversation tables
-            self.__createThread()
+            if self.__use_archive:
+                self.__createMessageArchive()
 
-            # create prompt tables
-            self.__createPromptGroup()
-
-            # create image tables
-            self.__createImage()
+            if self.__wal_mode:
+                self.__writer = SqliteWriter(self.__db_filename, init_connection=self.__initConnection)
+                self.__writer.start()
         except sqlite3.Error as e:
             print(f"An error occurred while connecting to the database: {e}")
             raise
 
+    def __getMigrations(self):
+        """Return the migrations in order. The schema version of the database is the number of the migrations applied to it.
+        Never change or reorder the existing ones, add a new one at the end instead.
+
+        The database files of the versions before the schema version was stored are at the version 0 whatever tables they have,
+        so each migration checks what already exists and can be run on them as well.
+        """
+        return [
+            # 1: Conversation, prompt and image tables (including the updates of the tables of the older versions)
+            self.__migrateBaseTables,
+            # 2: Full-text index of the messages
+            self.__createMessageFts,
+            # 3: Index for the paginated selection of the messages
+            self.__createMessageIndex,
+            # 4: Columns for the image data in the blob store
+            self.__addImageBlobColumns,
+            # 5: Image thumbnail table
+            self.__createImageThumbnail,
+            # 6: Indexes for the order of the lists and the favorite messages
+            self.__createListIndexes,
+            # 7: Statistics of each thread
+            self.__createThreadStats,
+            # 8: Files attached to the messages
+            self.__createChatFile,
+            # 9: Token count of each message
+            self.__addMessageTokenCount,
+            # 10: Response cache
+            self.__createResponseCache,
+            # 11: Health of the G4F providers
+            self.__createProviderHealth,
+            # 12: Tag of each message
+            self.__addMessageTag,
+        ]
+
+    def __migrate(self):
+        """Run the migrations which are newer than the schema version stored in the database file (PRAGMA user_version).
+        If the database is up to date, which is the case on every launch but the first one after the update, nothing is checked.
+        """
+        migrations = self.__getMigrations()
+        version = self.__conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > len(migrations):
+            print(f"The database was made by the newer version (schema version {version}).")
+        for i, migration in enumerate(migrations[version:], start=version + 1):
+            migration()
+            # Record the version right after each migration, so the next launch resumes from the one which failed
+            self.__conn.execute(f"PRAGMA user_version = {i}")
+            self.__conn.commit()
+        self.__is_fts_available = self.__existsInSchema("table", MESSAGE_FTS_TABLE_NAME)
+
+    def __existsInSchema(self, type, name):
+        return (
+            self.__c.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type=? AND name=?", (type, name),
+            ).fetchone()[0]
+            == 1
+        )
+
+    def __migrateBaseTables(self):
+        # create conversation tables
+        self.__createThread()
+
+        # create prompt tables
+        self.__createPromptGroup()
+
+        # create image tables
+        self.__createImage()
+
+    def __write(self, func, wait=True):
+        """Run func, which takes a cursor and writes with it, and commit.
+        If the writer is running, func runs on the writer thread and is committed with the other queued writes.
+
+        :param func: The function to run
+        :param wait: Return the result of func if True, otherwise Future of it
+        """
+        if self.__writer is not None:
+            future = self.__writer.submit(func)
+        else:
+            future = Future()
+            try:
+                future.set_result(func(self.__c))
+                self.__conn.commit()
+            except sqlite3.Error as e:
+                print(f"An error occurred: {e}")
+                raise
+        return future.result() if wait else future
+
+    def __writeInTransaction(self, func):
+        """Run func, which takes a cursor and writes with it, in one transaction and return its result.
+        This is for the long write (e.g. bulk insertion), so it uses the separate connection which can include DDL in the transaction.
+        """
+        if self.__writer is not None:
+            return self.__writer.submit(func).result()
+        # isolation_level=None to include the statements which don't begin the transaction implicitly (e.g. CREATE TABLE)
+        conn = sqlite3.connect(self.__db_filename, isolation_level=None)
+        try:
+            conn.execute("PRAGMA foreign_keys = ON;")
+            self.__initConnection(conn)
+            c = conn.cursor()
+            c.execute("BEGIN")
+            try:
+                result = func(c)
+                c.execute("COMMIT")
+                return result
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+        finally:
+            conn.close()
+
     def __createPromptGroup(self):
         try:
             self.__c.execute(
@@ -106,19 +445,15 @@ class SqliteDatabase:
             raise
 
     def insertPromptGroup(self, name, prompt_type):
-        try:
+        def write(c):
             # Insert a row into the table
-            self.__c.execute(
+            c.execute(
                 f"INSERT INTO {PROMPT_GROUP_TABLE_NAME} (name, prompt_type) VALUES (?, ?)",
                 (name, prompt_type),
             )
-            new_id = self.__c.lastrowid
-            # Commit the transaction
-            self.__conn.commit()
-            return new_id
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+            return c.lastrowid
+
+        return self.__write(write)
 
     def selectPromptGroup(self, prompt_type=None):
         try:
@@ -154,25 +489,17 @@ class SqliteDatabase:
             raise
 
     def updatePromptGroup(self, id, name):
-        try:
-            self.__c.execute(
+        self.__write(
+            lambda c: c.execute(
                 f"UPDATE {PROMPT_GROUP_TABLE_NAME} SET name=? WHERE id={id}", (name,),
-            )
-            self.__conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+            ),
+        )
 
     def deletePromptGroup(self, id=None):
-        try:
-            query = f"DELETE FROM {PROMPT_GROUP_TABLE_NAME}"
-            if id:
-                query += f" WHERE id = {id}"
-            self.__c.execute(query)
-            self.__conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+        query = f"DELETE FROM {PROMPT_GROUP_TABLE_NAME}"
+        if id:
+            query += f" WHERE id = {id}"
+        self.__write(lambda c: c.execute(query))
 
     def __createPromptEntry(self):
         try:
@@ -247,19 +574,15 @@ class SqliteDatabase:
             raise
 
     def insertPromptEntry(self, group_id, act, prompt=""):
-        try:
+        def write(c):
             # Insert a row into the table
-            self.__c.execute(
+            c.execute(
                 f"INSERT INTO {PROMPT_ENTRY_TABLE_NAME} (group_id, act, prompt) VALUES (?, ?, ?)",
                 (group_id, act, prompt),
             )
-            new_id = self.__c.lastrowid
-            # Commit the transaction
-            self.__conn.commit()
-            return new_id
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+            return c.lastrowid
+
+        return self.__write(write)
 
     def selectPromptEntry(
             self, group_id, id=None, act=None,
@@ -281,26 +604,18 @@ class SqliteDatabase:
             raise
 
     def updatePromptEntry(self, id, act, prompt):
-        try:
-            self.__c.execute(
+        self.__write(
+            lambda c: c.execute(
                 f"UPDATE {PROMPT_ENTRY_TABLE_NAME} SET act=?, prompt=? WHERE id={id}",
                 (act, prompt),
-            )
-            self.__conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+            ),
+        )
 
     def deletePromptEntry(self, group_id, id=None):
-        try:
-            query = f"DELETE FROM {PROMPT_ENTRY_TABLE_NAME} WHERE group_id={group_id}"
-            if id:
-                query += f" AND id={id}"
-            self.__c.execute(query)
-            self.__conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+        query = f"DELETE FROM {PROMPT_ENTRY_TABLE_NAME} WHERE group_id={group_id}"
+        if id:
+            query += f" AND id={id}"
+        self.__write(lambda c: c.execute(query))
 
     def __createThread(self):
         try:
@@ -354,15 +669,153 @@ class SqliteDatabase:
             print(f"An error occurred while creating the table: {e}")
             raise
 
+    def __createThreadStats(self):
+        """Create the table of the statistics of each thread (the number of messages, total tokens, the last model and the preview of the last message).
+        The triggers on the message table keep it up to date, so the chat list can show them without aggregating the messages.
+        The statistics of the existing messages are filled once when it is created.
+        """
+        try:
+            self.__c.execute(
+                f"""CREATE TABLE IF NOT EXISTS {THREAD_STATS_TABLE_NAME}
+                         (thread_id INTEGER PRIMARY KEY,
+                          message_count INT DEFAULT 0,
+                          total_tokens INT DEFAULT 0,
+                          last_model VARCHAR(255),
+                          last_message TEXT,
+                          FOREIGN KEY (thread_id) REFERENCES {THREAD_TABLE_NAME}(id)
+                          ON DELETE CASCADE)""",
+            )
+            self.__c.execute(f"DROP TRIGGER IF EXISTS {THREAD_STATS_INSERTED_TR_NAME}")
+            self.__c.execute(f"DROP TRIGGER IF EXISTS {THREAD_STATS_UPDATED_TR_NAME}")
+            self.__c.execute(f"DROP TRIGGER IF EXISTS {THREAD_STATS_DELETED_TR_NAME}")
+            self.__createThreadStatsTrigger(self.__c)
+            # Fill the statistics of the existing messages
+            self.__c.execute(f"DELETE FROM {THREAD_STATS_TABLE_NAME}")
+            self.__c.execute(
+                f"""INSERT INTO {THREAD_STATS_TABLE_NAME} (thread_id, message_count, total_tokens, last_model, last_message)
+                    SELECT t.id, count(m.id), sum({self.__getTokensQuery("m.total_tokens")}),
+                           ({self.__getLastModelQuery("t.id")}),
+                           ({self.__getLastMessageQuery("t.id")})
+                    FROM {THREAD_TABLE_NAME} t JOIN {MESSAGE_TABLE_NAME} m ON m.thread_id = t.id
+                    GROUP BY t.id""",
+            )
+            self.__conn.commit()
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the table: {e}")
+            raise
+
+    @staticmethod
+    def __getTokensQuery(total_tokens):
+        """Return the expression of the number of the tokens of the message. total_tokens is the expression of the column.
+        The message without the usage (e.g. the user's message) has '' instead of NULL.
+        """
+        return f"IFNULL(CAST(NULLIF({total_tokens}, '') AS INTEGER), 0)"
+
+    @staticmethod
+    def __getLastModelQuery(thread_id):
+        """Return the query which selects the last model which answered in the thread. thread_id is the expression of its id."""
+        return f"""SELECT model FROM {MESSAGE_TABLE_NAME} WHERE thread_id = {thread_id} AND IFNULL(model, '') != ''
+                   ORDER BY id DESC LIMIT 1"""
+
+    @staticmethod
+    def __getLastMessageQuery(thread_id):
+        """Return the query which selects the beginning of the last message of the thread. thread_id is the expression of its id."""
+        return f"""SELECT substr(content, 1, {THREAD_STATS_PREVIEW_LENGTH}) FROM {MESSAGE_TABLE_NAME}
+                   WHERE thread_id = {thread_id} ORDER BY id DESC LIMIT 1"""
+
+    def __createThreadStatsTrigger(
+        self, c, insert_trigger=True, update_trigger=True, delete_trigger=True,
+    ):
+        """Create the triggers which keep the statistics of the threads with the cursor c. This doesn't commit.
+        The triggers are suspended with __suspendTriggers, not by dropping them.
+        """
+        self.__createTriggerGuard(c)
+        if insert_trigger:
+            c.execute(
+                f"""
+                CREATE TRIGGER {THREAD_STATS_INSERTED_TR_NAME}
+                AFTER INSERT ON {MESSAGE_TABLE_NAME}
+                {self.__getTriggerGuard(THREAD_STATS_INSERTED_TR_NAME)}
+                BEGIN
+                  INSERT INTO {THREAD_STATS_TABLE_NAME} (thread_id, message_count, total_tokens, last_model, last_message)
+                  VALUES (NEW.thread_id, 1, {self.__getTokensQuery("NEW.total_tokens")}, NULLIF(NEW.model, ''), substr(NEW.content, 1, {THREAD_STATS_PREVIEW_LENGTH}))
+                  ON CONFLICT (thread_id) DO UPDATE SET
+                    message_count = message_count + 1,
+                    total_tokens = total_tokens + excluded.total_tokens,
+                    last_model = IFNULL(excluded.last_model, last_model),
+                    last_message = excluded.last_message;
+                END
+            """,
+            )
+
+        # The deleted or updated message can be the last one, so the last model and message are selected again by the index
+        if update_trigger:
+            c.execute(
+                f"""
+                CREATE TRIGGER {THREAD_STATS_UPDATED_TR_NAME}
+                AFTER UPDATE OF content, model, total_tokens ON {MESSAGE_TABLE_NAME}
+                {self.__getTriggerGuard(THREAD_STATS_UPDATED_TR_NAME)}
+                BEGIN
+                  UPDATE {THREAD_STATS_TABLE_NAME} SET
+                    total_tokens = total_tokens - {self.__getTokensQuery("OLD.total_tokens")} + {self.__getTokensQuery("NEW.total_tokens")},
+                    last_model = ({self.__getLastModelQuery("NEW.thread_id")}),
+                    last_message = ({self.__getLastMessageQuery("NEW.thread_id")})
+                  WHERE thread_id = NEW.thread_id;
+                END
+            """,
+            )
+
+        if delete_trigger:
+            c.execute(
+                f"""
+                CREATE TRIGGER {THREAD_STATS_DELETED_TR_NAME}
+                AFTER DELETE ON {MESSAGE_TABLE_NAME}
+                {self.__getTriggerGuard(THREAD_STATS_DELETED_TR_NAME)}
+                BEGIN
+                  UPDATE {THREAD_STATS_TABLE_NAME} SET
+                    message_count = message_count - 1,
+                    total_tokens = total_tokens - {self.__getTokensQuery("OLD.total_tokens")},
+                    last_model = ({self.__getLastModelQuery("OLD.thread_id")}),
+                    last_message = ({self.__getLastMessageQuery("OLD.thread_id")})
+                  WHERE thread_id = OLD.thread_id;
+                END
+            """,
+            )
+
+    def getThreadListQuery(self, where="", order_by=""):
+        """Return the query which selects the threads with their statistics.
+        The columns of the thread table come first in the same order, followed by the statistics (THREAD_STATS_COLUMNS).
+        This is for the models of Qt (e.g. QSqlTableModel) which can't use this connection.
+
+        :param where: The condition without "WHERE", the columns of the thread table should be qualified with its name
+        :param order_by: The ORDER BY clause
+        """
+        # The thread which has no message yet has no statistics
+        stats_columns = [
+            "IFNULL(s.message_count, 0) AS message_count",
+            "IFNULL(s.total_tokens, 0) AS total_tokens",
+            "IFNULL(s.last_model, '') AS last_model",
+            "IFNULL(s.last_message, '') AS last_message",
+        ]
+        query = (
+            f"SELECT {THREAD_TABLE_NAME}.*, {', '.join(stats_columns)} FROM {THREAD_TABLE_NAME} "
+            f"LEFT JOIN {THREAD_STATS_TABLE_NAME} s ON s.thread_id = {THREAD_TABLE_NAME}.id"
+        )
+        if where:
+            query += f" WHERE {where}"
+        if order_by:
+            query += f" {order_by}"
+        return query
+
     def selectAllThread(self, id_arr=None):
-        """Select all thread
+        """Select all thread with their statistics
         id_arr: list of thread id.
         """
         try:
-            query = f"SELECT * FROM {THREAD_TABLE_NAME}"
+            where = ""
             if id_arr:
-                query += f' WHERE id IN ({",".join(map(str, id_arr))})'
-            self.__c.execute(query)
+                where = f'{THREAD_TABLE_NAME}.id IN ({",".join(map(str, id_arr))})'
+            self.__c.execute(self.getThreadListQuery(where))
             return self.__c.fetchall()
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
@@ -377,61 +830,111 @@ class SqliteDatabase:
             print(f"An error occurred: {e}")
             raise
 
-    def insertThread(self, name, insert_dt=None, update_dt=None):
-        try:
-            query = f"INSERT INTO {THREAD_TABLE_NAME} (name) VALUES (?)"
-            params = (name,)
+    @staticmethod
+    def __getInsertThreadQuery(name, insert_dt=None, update_dt=None):
+        query = f"INSERT INTO {THREAD_TABLE_NAME} (name) VALUES (?)"
+        params = (name,)
+
+        if insert_dt and update_dt:
+            query = f"INSERT INTO {THREAD_TABLE_NAME} (name, insert_dt, update_dt) VALUES (?, ?, ?)"
+            params = (name, insert_dt, update_dt)
+        elif insert_dt:
+            query = (
+                f"INSERT INTO {THREAD_TABLE_NAME} (name, insert_dt) VALUES (?, ?)"
+            )
+            params = (name, insert_dt)
+        return query, params
 
-            if insert_dt and update_dt:
-                query = f"INSERT INTO {THREAD_TABLE_NAME} (name, insert_dt, update_dt) VALUES (?, ?, ?)"
-                params = (name, insert_dt, update_dt)
-            elif insert_dt:
-                query = (
-                    f"INSERT INTO {THREAD_TABLE_NAME} (name, insert_dt) VALUES (?, ?)"
-                )
-                params = (name, insert_dt)
+    def insertThread(self, name, insert_dt=None, update_dt=None, wait=True):
+        query, params = self.__getInsertThreadQuery(name, insert_dt, update_dt)
 
-            # Insert a row into the table
-            self.__c.execute(query, params)
-            new_id = self.__c.lastrowid
-            # Commit the transaction
-            self.__conn.commit()
-            return new_id
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+        # Insert a row into the table
+        return self.__write(lambda c: c.execute(query, params).lastrowid, wait)
 
-    def updateThread(self, id, name):
-        try:
-            self.__c.execute(
+    def importThreads(self, threads: Iterable[dict], batch_size=DB_IMPORT_BATCH_SIZE, progress_callback=None) -> list[int]:
+        """Insert the threads with their messages, and return the ids of the inserted threads.
+        Each thread is a dict which has "name", "insert_dt", "update_dt" and "messages" (list of dicts for ChatMessageContainer).
+
+        Every batch of threads is inserted in one transaction with executemany,
+        and the trigger which updates update_dt of the thread is suspended during the batch to keep the imported dates.
+        This is meant to be called from the other thread (e.g. QThread) not to block the UI.
+
+        :param progress_callback: The function called with the number of threads inserted so far after each batch
+        """
+        excludes = ["id", "update_dt", "insert_dt"]
+        message_query = self.__getInsertMessageQuery(excludes)
+
+        def get_message_values(message, thread_id):
+            message = ChatMessageContainer(**{**message, "thread_id": thread_id})
+            # The files are not imported
+            if message.token_count is None:
+                message.token_count = count_message_tokens(message.content, message.model)
+            return message.get_values_for_insert(excludes=excludes)
+
+        def write(c, batch):
+            ids = []
+            with self.__suspendTriggers(c, THREAD_MESSAGE_INSERTED_TR_NAME):
+                for thread in batch:
+                    thread_id = c.execute(
+                        *self.__getInsertThreadQuery(thread["name"], thread.get("insert_dt"), thread.get("update_dt")),
+                    ).lastrowid
+                    c.executemany(
+                        message_query,
+                        (get_message_values(message, thread_id) for message in thread["messages"]),
+                    )
+                    ids.append(thread_id)
+            return ids
+
+        ids = []
+        threads = iter(threads)
+        while batch := list(islice(threads, batch_size)):
+            ids += self.__writeInTransaction(lambda c, batch=batch: write(c, batch))
+            if progress_callback:
+                progress_callback(len(ids))
+        return ids
+
+    def updateThread(self, id, name, wait=True):
+        return self.__write(
+            lambda c: c.execute(
                 f"UPDATE {THREAD_TABLE_NAME} SET name=(?) WHERE id={id}", (name,),
-            )
-            self.__conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+            ),
+            wait,
+        )
 
     def deleteThread(self, id=None):
-        try:
-            query = f"DELETE FROM {THREAD_TABLE_NAME}"
-            if id:
-                query += f" WHERE id = {id}"
-            self.__c.execute(query)
-            self.__conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            raise
+        query = f"DELETE FROM {THREAD_TABLE_NAME}"
+        archive_where = f" WHERE thread_id = {id}" if id else ""
+        if id:
+            query += f" WHERE id = {id}"
+
+        def write(c):
+            c.execute(query)
+            # The foreign key doesn't reach the other database
+            if self.__use_archive:
+                if self.__is_fts_available:
+                    # The archived messages are in the full-text index, which needs their content to remove them
+                    c.execute(
+                        f"""INSERT INTO {MESSAGE_FTS_TABLE_NAME} ({MESSAGE_FTS_TABLE_NAME}, rowid, content)
+                            SELECT 'delete', id, zlib_decompress(content) FROM {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME}{archive_where}""",
+                    )
+                c.execute(f"DELETE FROM {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME}{archive_where}")
+
+        self.__write(write)
 
     def __createMessageTrigger(
-        self, insert_trigger=True, update_trigger=True, delete_trigger=True,
+        self, c, insert_trigger=True, update_trigger=True, delete_trigger=True,
     ):
-        """Create message trigger."""
+        """Create message trigger with the cursor c. This doesn't commit.
+        The triggers are suspended with __suspendTriggers, not by dropping them.
+        """
+        self.__createTriggerGuard(c)
         if insert_trigger:
             # Create insert trigger
-            self.__c.execute(
+            c.execute(
                 f"""
                 CREATE TRIGGER {THREAD_MESSAGE_INSERTED_TR_NAME}
                 AFTER INSERT ON {MESSAGE_TABLE_NAME}
+                {self.__getTriggerGuard(THREAD_MESSAGE_INSERTED_TR_NAME)}
                 BEGIN
                   UPDATE {THREAD_TABLE_NAME} SET update_dt = CURRENT_TIMESTAMP WHERE id = NEW.thread_id;
                 END
@@ -440,10 +943,11 @@ class SqliteDatabase:
 
         if update_trigger:
             # Create update trigger
-            self.__c.execute(
+            c.execute(
                 f"""
                 CREATE TRIGGER {THREAD_MESSAGE_UPDATED_TR_NAME}
                 AFTER UPDATE ON {MESSAGE_TABLE_NAME}
+                {self.__getTriggerGuard(THREAD_MESSAGE_UPDATED_TR_NAME)}
                 BEGIN
                   UPDATE {THREAD_TABLE_NAME} SET update_dt = CURRENT_TIMESTAMP WHERE id = NEW.thread_id;
                 END
@@ -452,18 +956,40 @@ class SqliteDatabase:
 
         if delete_trigger:
             # Create delete trigger
-            self.__c.execute(
+            c.execute(
                 f"""
                 CREATE TRIGGER {THREAD_MESSAGE_DELETED_TR_NAME}
                 AFTER DELETE ON {MESSAGE_TABLE_NAME}
+                {self.__getTriggerGuard(THREAD_MESSAGE_DELETED_TR_NAME)}
                 BEGIN
                   UPDATE {THREAD_TABLE_NAME} SET update_dt = CURRENT_TIMESTAMP WHERE id = OLD.thread_id;
                 END
             """,
             )
 
-        # Commit the transaction
-        self.__conn.commit()
+    @staticmethod
+    def __createTriggerGuard(c):
+        """Create the table which the guarded triggers check, with the cursor c. This doesn't commit."""
+        c.execute(f"CREATE TABLE IF NOT EXISTS {TRIGGER_GUARD_TABLE_NAME} (name TEXT PRIMARY KEY)")
+
+    @staticmethod
+    def __getTriggerGuard(name):
+        """Return the WHEN clause of the trigger, which skips it while it is suspended with __suspendTriggers."""
+        return f"WHEN NOT EXISTS (SELECT 1 FROM {TRIGGER_GUARD_TABLE_NAME} WHERE name = '{name}')"
+
+    @staticmethod
+    @contextmanager
+    def __suspendTriggers(c, *names):
+        """Suspend the guarded triggers of the names in the transaction of the cursor c during the with block.
+        The rows of the guard are deleted at the end of the block (or rolled back with the transaction) before it's committed,
+        so the other connections never see them, and the schema doesn't change unlike dropping the triggers.
+        """
+        rows = [(name,) for name in names]
+        c.executemany(f"INSERT OR IGNORE INTO {TRIGGER_GUARD_TABLE_NAME} (name) VALUES (?)", rows)
+        try:
+            yield
+        finally:
+            c.executemany(f"DELETE FROM {TRIGGER_GUARD_TABLE_NAME} WHERE name = ?", rows)
 
     def __createMessage(self):
         """Create message table."""
@@ -473,7 +999,11 @@ class SqliteDatabase:
                 f"SELECT count(*) FROM sqlite_master WHERE type='table' AND name='{MESSAGE_TABLE_NAME}'",
             )
             if self.__c.fetchone()[0] == 1:
-                pass
+                # The older versions dropped the triggers and created them again to suspend them, so create them with the guard
+                for name in [THREAD_MESSAGE_INSERTED_TR_NAME, THREAD_MESSAGE_UPDATED_TR_NAME, THREAD_MESSAGE_DELETED_TR_NAME]:
+                    self.__c.execute(f"DROP TRIGGER IF EXISTS {name}")
+                self.__createMessageTrigger(self.__c)
+                self.__conn.commit()
             else:
                 # Create message table and triggers
                 self.__c.execute(
@@ -498,27 +1028,322 @@ class SqliteDatabase:
                               ON DELETE CASCADE)""",
                 )
 
-                self.__createMessageTrigger()
+                self.__createMessageTrigger(self.__c)
                 self.__conn.commit()
         except sqlite3.Error as e:
             print(f"An error occurred while creating the table: {e}")
             raise
 
+    def __createMessageIndex(self):
+        """Create index for the paginated selection of the messages."""
+        try:
+            self.__c.execute(
+                f"CREATE INDEX IF NOT EXISTS {MESSAGE_THREAD_ID_INDEX_NAME} ON {MESSAGE_TABLE_NAME} (thread_id, id)",
+            )
+            self.__conn.commit()
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the index: {e}")
+            raise
+
+    def __createListIndexes(self):
+        """Create indexes so that the thread and image lists are read in order, and the favorite messages are selected, without scanning the whole table."""
+        try:
+            # Order of the thread list in the navigation and export
+            self.__c.execute(
+                f"CREATE INDEX IF NOT EXISTS {THREAD_UPDATE_DT_INDEX_NAME} ON {THREAD_TABLE_NAME} (update_dt)",
+            )
+            self.__c.execute(
+                f"CREATE INDEX IF NOT EXISTS {THREAD_INSERT_DT_INDEX_NAME} ON {THREAD_TABLE_NAME} (insert_dt)",
+            )
+            self.__c.execute(
+                f"CREATE INDEX IF NOT EXISTS {IMAGE_INSERT_DT_INDEX_NAME} ON {IMAGE_TABLE_NAME} (insert_dt)",
+            )
+            # Only a few messages are favorite, so the partial index is small
+            self.__c.execute(
+                f"CREATE INDEX IF NOT EXISTS {MESSAGE_FAVORITE_INDEX_NAME} ON {MESSAGE_TABLE_NAME} (favorite_set_date) WHERE favorite=1",
+            )
+            self.__conn.commit()
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the index: {e}")
+            raise
+
+    def __createMessageArchive(self):
+        """Create the table of the archived messages in the archive database.
+        It has the same columns as the message table, but the content is compressed with zlib.
+        """
+        try:
+            self.__c.execute(
+                f"""CREATE TABLE IF NOT EXISTS {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME}
+                         (id INTEGER PRIMARY KEY,
+                          thread_id INTEGER,
+                          role VARCHAR(255),
+                          content BLOB,
+                          finish_reason VARCHAR(255),
+                          model VARCHAR(255),
+                          prompt_tokens INTEGER,
+                          completion_tokens INTEGER,
+                          total_tokens INTEGER,
+                          favorite INTEGER DEFAULT 0,
+                          update_dt DATETIME,
+                          insert_dt DATETIME,
+                          favorite_set_date DATETIME,
+                          is_json_response_available INT DEFAULT 0,
+                          is_g4f INT DEFAULT 0,
+                          provider VARCHAR(255),
+                          token_count INTEGER,
+                          is_cached INT DEFAULT 0,
+                          tag VARCHAR(255))""",
+            )
+            # The archive of the older versions
+            self.__c.execute(f"PRAGMA {THREAD_ARCHIVE_SCHEMA_NAME}.table_info({MESSAGE_ARCHIVE_TABLE_NAME})")
+            archive_columns = [col[1] for col in self.__c.fetchall()]
+            for column, column_type in [("token_count", "INTEGER"), ("is_cached", "INT DEFAULT 0"), ("tag", "VARCHAR(255)")]:
+                if column not in archive_columns:
+                    self.__c.execute(
+                        f"ALTER TABLE {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME} ADD COLUMN {column} {column_type}",
+                    )
+            self.__c.execute(
+                f"""CREATE INDEX IF NOT EXISTS {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_THREAD_ID_INDEX_NAME}
+                         ON {MESSAGE_ARCHIVE_TABLE_NAME} (thread_id, id)""",
+            )
+            self.__conn.commit()
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the table: {e}")
+            raise
+
+    def __getInsertMessageQuery(self, excludes):
+        """Return the query which inserts the message without the columns of excludes, which include "id".
+        If the archive is used, the id is given after the archived messages as well,
+        because the message table alone gives their ids again after the latest messages are archived.
+        """
+        columns = ChatMessageContainer.get_keys(excludes)
+        values = ["?" for _ in columns]
+        if self.__use_archive:
+            columns.insert(0, "id")
+            values.insert(
+                0,
+                f"""(SELECT max(IFNULL((SELECT max(id) FROM main.{MESSAGE_TABLE_NAME}), 0),
+                                IFNULL((SELECT max(id) FROM {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME}), 0)) + 1)""",
+            )
+        return f"INSERT INTO {MESSAGE_TABLE_NAME} ({', '.join(columns)}) VALUES ({', '.join(values)})"
+
+    def __isThreadArchived(self, thread_id):
+        """Return whether the thread has the messages in the archive."""
+        if not self.__use_archive:
+            return False
+        return self.__c.execute(
+            f"SELECT 1 FROM {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME} WHERE thread_id = ? LIMIT 1", (thread_id,),
+        ).fetchone() is not None
+
+    def __getThreadMessagesQuery(self, thread_id, conditions=(), params=(), descending=False, limit=None):
+        """Return the query which selects the messages of the thread in order of id, and its parameters.
+        The archived messages are included with the content decompressed only if the thread has them,
+        so the callers don't have to know where the messages are.
+        Then both tables are read in order of their own index and merged, which stops at the limit.
+
+        :param conditions: The conditions of the messages other than the thread (e.g. "id < ?"), "{content}" is replaced with the content
+        :param params: The parameters of the conditions
+        """
+        columns = ChatMessageContainer.get_keys()
+        order_by = f" ORDER BY id {'DESC' if descending else 'ASC'}"
+        if limit:
+            order_by += f" LIMIT {int(limit)}"
+
+        def get_query(table_name, content):
+            selected_columns = [f"{content} AS content" if column == "content" else column for column in columns]
+            where = " AND ".join(["thread_id = ?", *[condition.format(content=content) for condition in conditions]])
+            return f"SELECT {', '.join(selected_columns)} FROM {table_name} WHERE {where}"
+
+        query = get_query(f"main.{MESSAGE_TABLE_NAME}", "content")
+        if not self.__isThreadArchived(thread_id):
+            return query + order_by, [thread_id, *params]
+        archive_query = get_query(f"{THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME}", "zlib_decompress(content)")
+        return f"{query} UNION ALL {archive_query}{order_by}", [thread_id, *params] * 2
+
+    def archiveOldThreads(self, days, batch_size=THREAD_ARCHIVE_BATCH_SIZE) -> int:
+        """Move the messages of the threads which haven't been updated for the days into the archive, and return the number of the threads.
+        Only batch_size threads are archived in one transaction, so call this until it returns 0.
+        The threads themselves (and their statistics) stay, and their messages are still read by selectCertainThreadMessages and selectMessagesPage.
+        The threads which have the favorite messages are not archived.
+        """
+        if not self.__use_archive:
+            return 0
+        columns = ChatMessageContainer.get_keys()
+        compressed_columns = ["zlib_compress(content)" if column == "content" else column for column in columns]
+
+        def write(c):
+            c.execute(
+                f"""SELECT t.id FROM {THREAD_TABLE_NAME} t
+                    WHERE IFNULL(t.update_dt, t.insert_dt) < datetime('now', ?)
+                    AND EXISTS (SELECT 1 FROM {MESSAGE_TABLE_NAME} m WHERE m.thread_id = t.id)
+                    AND NOT EXISTS (SELECT 1 FROM {MESSAGE_TABLE_NAME} m WHERE m.thread_id = t.id AND m.favorite = 1)
+                    LIMIT ?""",
+                (f"-{days} days", batch_size),
+            )
+            ids = ",".join(str(row[0]) for row in c.fetchall())
+            if not ids:
+                return 0
+            # The messages are moved, not deleted, so keep update_dt, the statistics of the threads and the full-text index
+            with self.__suspendTriggers(c, THREAD_MESSAGE_DELETED_TR_NAME, THREAD_STATS_DELETED_TR_NAME, MESSAGE_FTS_DELETED_TR_NAME):
+                c.execute(
+                    f"""INSERT OR REPLACE INTO {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME} ({', '.join(columns)})
+                        SELECT {', '.join(compressed_columns)} FROM main.{MESSAGE_TABLE_NAME} WHERE thread_id IN ({ids})""",
+                )
+                c.execute(f"DELETE FROM main.{MESSAGE_TABLE_NAME} WHERE thread_id IN ({ids})")
+            return ids.count(",") + 1
+
+        return self.__writeInTransaction(write)
+
+    def __restoreThread(self, c, thread_id):
+        """Move the archived messages of the thread back to the message table with the cursor c. This doesn't commit."""
+        columns = ChatMessageContainer.get_keys()
+        decompressed_columns = ["zlib_decompress(content)" if column == "content" else column for column in columns]
+        # The statistics and the full-text index already have the archived messages
+        with self.__suspendTriggers(c, THREAD_MESSAGE_INSERTED_TR_NAME, THREAD_STATS_INSERTED_TR_NAME, MESSAGE_FTS_INSERTED_TR_NAME):
+            c.execute(
+                f"""INSERT INTO main.{MESSAGE_TABLE_NAME} ({', '.join(columns)})
+                    SELECT {', '.join(decompressed_columns)} FROM {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME} WHERE thread_id = ?""",
+                (thread_id,),
+            )
+        c.execute(f"DELETE FROM {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME} WHERE thread_id = ?", (thread_id,))
+
+    def compactDatabase(self) -> int:
+        """Return the free pages of the database and the archive to the file system with the incremental vacuum, and return the number of bytes freed.
+        The first time, the full VACUUM runs once to turn the incremental auto vacuum on.
+        This can take long, so call this from the other thread (e.g. QThread).
+        """
+        # VACUUM can't run in the transaction
+        conn = sqlite3.connect(self.__db_filename, isolation_level=None)
+        try:
+            self.__initConnection(conn)
+            schemas = ["main"]
+            if self.__use_archive:
+                schemas.append(THREAD_ARCHIVE_SCHEMA_NAME)
+            freed = 0
+            for schema in schemas:
+                page_size = conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+                page_count = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+                # 2 is INCREMENTAL
+                if conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] != 2:
+                    conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+                    conn.execute(f"VACUUM {schema}")
+                else:
+                    conn.execute(f"PRAGMA {schema}.incremental_vacuum")
+                # The full VACUUM of the small database can add a page for the auto vacuum
+                freed += max(page_count - conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0], 0) * page_size
+            if self.__wal_mode:
+                # Shrink the WAL file as well
+                conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+            return freed
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def __getBackupSchemas(self, filename):
+        """Return the schemas to copy and the files of each of them (the database and its archive)."""
+        schemas = [("main", filename)]
+        if self.__use_archive:
+            schemas.append((THREAD_ARCHIVE_SCHEMA_NAME, get_archive_filename(filename)))
+        return schemas
+
+    def backupDatabase(self, filename, pages=DB_BACKUP_PAGES_PER_STEP, progress_callback=None, is_cancelled=None) -> bool:
+        """Save the consistent snapshot of the database (and the archive) to the file with the online backup API, while the app keeps using it.
+        The pages are copied ``pages`` at a time, so the writes of the app wait only for a step, not for the whole copy.
+        progress_callback is called with the percentage. If is_cancelled returns True, the backup stops without leaving the file and returns False.
+        This can take long, so call this from the other thread (e.g. QThread).
+        """
+        schemas = self.__getBackupSchemas(filename)
+
+        def progress(i, status, remaining, total):
+            if is_cancelled is not None and is_cancelled():
+                raise _BackupCancelled()
+            if progress_callback is not None and total > 0:
+                progress_callback(int((i + (total - remaining) / total) / len(schemas) * 100))
+
+        src = sqlite3.connect(self.__db_filename)
+        tmp_filenames = []
+        try:
+            self.__initConnection(src)
+            for i, (schema, target) in enumerate(schemas):
+                # Copy to the temporary file and rename it, so the half-written snapshot is never left
+                fd, tmp_filename = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(target)))
+                os.close(fd)
+                tmp_filenames.append(tmp_filename)
+                dst = sqlite3.connect(tmp_filename)
+                try:
+                    src.backup(dst, pages=pages, name=schema, progress=lambda *args, i=i: progress(i, *args))
+                    # The snapshot of the database in WAL mode is also in WAL mode, keep it in a single file
+                    dst.execute("PRAGMA journal_mode = DELETE;")
+                finally:
+                    dst.close()
+            for (schema, target), tmp_filename in zip(schemas, tmp_filenames):
+                os.replace(tmp_filename, target)
+            return True
+        except _BackupCancelled:
+            return False
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+        finally:
+            src.close()
+            for tmp_filename in tmp_filenames:
+                if os.path.exists(tmp_filename):
+                    os.remove(tmp_filename)
+
+    def restoreDatabase(self, filename, pages=DB_BACKUP_PAGES_PER_STEP):
+        """Overwrite the database (and the archive) with the snapshot saved by backupDatabase, with the online backup API.
+        The app should be restarted after this, to run the migrations if the snapshot is older than the app.
+        """
+        try:
+            dst = sqlite3.connect(self.__db_filename)
+            try:
+                src = sqlite3.connect(filename)
+                try:
+                    src.backup(dst, pages=pages)
+                finally:
+                    src.close()
+            finally:
+                dst.close()
+
+            archive_filename = get_archive_filename(filename)
+            if os.path.exists(archive_filename):
+                dst = sqlite3.connect(self.__archive_filename)
+                try:
+                    src = sqlite3.connect(archive_filename)
+                    try:
+                        src.backup(dst, pages=pages)
+                    finally:
+                        src.close()
+                finally:
+                    dst.close()
+            elif self.__use_archive:
+                # The snapshot has every message in the database, so the ones archived after it would be duplicated
+                conn = sqlite3.connect(self.__archive_filename)
+                try:
+                    conn.execute(f"DELETE FROM {MESSAGE_ARCHIVE_TABLE_NAME}")
+                    conn.commit()
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+
     def selectCertainThreadMessagesRaw(self, thread_id, content_to_select=None):
         """This is for selecting all messages in a thread with a specific thread_id.
         The format of the result is a list of sqlite Rows.
         """
-        # Begin the query with the thread_id filter
-        query = f"SELECT * FROM {MESSAGE_TABLE_NAME} WHERE thread_id = ?"
-        params = [thread_id]  # Start the parameter list with the thread_id
+        conditions = []
+        params = []
 
-        # If content_to_select is provided, append to the query
+        # If content_to_select is provided, select only the messages which include it
         if content_to_select:
-            query += " AND LOWER(content) LIKE LOWER(?)"  # Modify for case-insensitive
+            conditions.append("LOWER({content}) LIKE LOWER(?)")  # Modify for case-insensitive
             params.append(f"%{content_to_select}%")  # Use parameterized placeholder
 
         # Execute the query with parameters
-        self.__c.execute(query, params)
+        self.__c.execute(*self.__getThreadMessagesQuery(thread_id, conditions, params))
 
         # Fetch all results and return
         return self.__c.fetchall()
@@ -537,44 +1362,274 @@ class SqliteDatabase:
         ]
         return result
 
-    def selectAllContentOfThread(self, content_to_select=None):
-        """This is for selecting all messages in all threads which include the content_to_select."""
-        arr = []
-        for _id in [conv[0] for conv in self.selectAllThread()]:
-            result = self.selectCertainThreadMessages(_id, content_to_select)
-            if result:
-                arr.append((_id, result))
-        return arr
-
-    def insertMessage(self, arg: ChatMessageContainer, deactivate_trigger=False):
-        try:
-            if deactivate_trigger:
-                # Remove the trigger
-                self.__c.execute(f"DROP TRIGGER {THREAD_MESSAGE_INSERTED_TR_NAME}")
-            excludes = ["id", "update_dt", "insert_dt"]
-            insert_query = arg.create_insert_query(
-                table_name=MESSAGE_TABLE_NAME, excludes=excludes,
-            )
-            self.__c.execute(insert_query, arg.get_values_for_insert(excludes=excludes))
-            new_id = self.__c.lastrowid
-            if deactivate_trigger:
-                # Create the trigger
-                self.__createMessageTrigger(
-                    insert_trigger=True, update_trigger=False, delete_trigger=False,
-                )
+    def selectMessagesPage(
+        self, thread_id, before_id=None, limit=MESSAGE_PAGE_SIZE,
+    ) -> list[ChatMessageContainer]:
+        """Select the latest messages of the thread which are older than the message of before_id (keyset pagination).
+        The result is in ascending order of id like selectCertainThreadMessages.
 
-            # Commit the transaction
-            self.__conn.commit()
-            return new_id
+        :param thread_id: The id of the thread
+        :param before_id: The id of the oldest message already loaded. If None, the latest messages are selected.
+        :param limit: The maximum number of the messages
+        """
+        try:
+            conditions = []
+            params = []
+            if before_id is not None:
+                conditions.append("id < ?")
+                params.append(before_id)
+
+            self.__c.execute(*self.__getThreadMessagesQuery(thread_id, conditions, params, descending=True, limit=limit))
+            return [ChatMessageContainer(**elem) for elem in reversed(self.__c.fetchall())]
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
             raise
 
-    def updateMessage(self, id, favorite):
-        """Update message favorite."""
+    def selectContextMessages(
+        self, thread_id, token_budget, limit=MAXIMUM_MESSAGES_IN_PARAMETER,
+    ) -> list[ChatMessageContainer]:
+        """Select the latest messages of the thread which fit in the token budget, in ascending order of id.
+        The token counts stored at insert are added up from the latest message, so only the selected messages (and one more) are read.
+
+        :param thread_id: The id of the thread
+        :param token_budget: The maximum number of the tokens of the messages
+        :param limit: The maximum number of the messages
+        """
         try:
-            current_date = datetime.now().strftime(DEFAULT_DATETIME_FORMAT)
-            self.__c.execute(
+            # Not the shared cursor, to close the query as soon as the budget runs out
+            c = self.__c.connection.cursor()
+            try:
+                c.execute(*self.__getThreadMessagesQuery(thread_id, descending=True, limit=limit))
+                messages = []
+                for row in c:
+                    message = ChatMessageContainer(**row)
+                    token_count = message.token_count
+                    if token_count is None:
+                        token_count = count_message_tokens(message.content, message.model)
+                    token_budget -= token_count
+                    if token_budget < 0:
+                        break
+                    messages.append(message)
+                return messages[::-1]
+            finally:
+                c.close()
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+
+    def __createMessageFts(self):
+        """Create the full-text index of the message content.
+        This is an external content FTS5 table, so the content itself is not duplicated.
+        Triggers keep it in sync with the message table, and the existing messages are indexed once when it is created.
+        The archived messages stay in the index (See archiveOldThreads), so they are found as well.
+        """
+        try:
+            fts_exists = (
+                self.__c.execute(
+                    f"SELECT count(*) FROM sqlite_master WHERE type='table' AND name='{MESSAGE_FTS_TABLE_NAME}'",
+                ).fetchone()[0]
+                == 1
+            )
+            if fts_exists:
+                pass
+            else:
+                self.__createTriggerGuard(self.__c)
+                # Trigram tokenizer is used to keep the substring matching of the former LIKE search
+                self.__c.execute(
+                    f"""CREATE VIRTUAL TABLE {MESSAGE_FTS_TABLE_NAME}
+                             USING fts5(content, content='{MESSAGE_TABLE_NAME}', content_rowid='id', tokenize='trigram')""",
+                )
+                self.__c.execute(
+                    f"""
+                    CREATE TRIGGER {MESSAGE_FTS_INSERTED_TR_NAME}
+                    AFTER INSERT ON {MESSAGE_TABLE_NAME}
+                    {self.__getTriggerGuard(MESSAGE_FTS_INSERTED_TR_NAME)}
+                    BEGIN
+                      INSERT INTO {MESSAGE_FTS_TABLE_NAME} (rowid, content) VALUES (NEW.id, NEW.content);
+                    END
+                """,
+                )
+                self.__c.execute(
+                    f"""
+                    CREATE TRIGGER {MESSAGE_FTS_UPDATED_TR_NAME}
+                    AFTER UPDATE OF content ON {MESSAGE_TABLE_NAME}
+                    {self.__getTriggerGuard(MESSAGE_FTS_UPDATED_TR_NAME)}
+                    BEGIN
+                      INSERT INTO {MESSAGE_FTS_TABLE_NAME} ({MESSAGE_FTS_TABLE_NAME}, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+                      INSERT INTO {MESSAGE_FTS_TABLE_NAME} (rowid, content) VALUES (NEW.id, NEW.content);
+                    END
+                """,
+                )
+                self.__c.execute(
+                    f"""
+                    CREATE TRIGGER {MESSAGE_FTS_DELETED_TR_NAME}
+                    AFTER DELETE ON {MESSAGE_TABLE_NAME}
+                    {self.__getTriggerGuard(MESSAGE_FTS_DELETED_TR_NAME)}
+                    BEGIN
+                      INSERT INTO {MESSAGE_FTS_TABLE_NAME} ({MESSAGE_FTS_TABLE_NAME}, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+                    END
+                """,
+                )
+                # Index the messages which already exist
+                self.__c.execute(
+                    f"INSERT INTO {MESSAGE_FTS_TABLE_NAME} ({MESSAGE_FTS_TABLE_NAME}) VALUES ('rebuild')",
+                )
+                self.__conn.commit()
+            self.__is_fts_available = True
+        except sqlite3.OperationalError as e:
+            # FTS5 or trigram tokenizer (SQLite 3.34.0+) is not supported, LIKE will be used instead
+            print(f"Full-text search is not available: {e}")
+            self.__conn.rollback()
+            self.__is_fts_available = False
+
+    def searchMessages(self, text, thread_id=None, limit=None):
+        """Search the messages which include the text, in order of relevance.
+        Every row has thread_id, message_id and snippet of the matched content.
+        The archived messages are searched as well.
+
+        :param text: The text to search
+        :param thread_id: Search only in this thread if it is given
+        :param limit: The maximum number of rows
+        """
+        try:
+            params = {"text": text, "thread_id": thread_id, "limit": limit}
+            if self.__isFtsQuery(text):
+                params["query"] = self.__getFtsQuery(text)
+                snippet = f"snippet({MESSAGE_FTS_TABLE_NAME}, 0, '', '', '...', {MESSAGE_SEARCH_SNIPPET_LENGTH})"
+                message_thread_id = "m.thread_id"
+                sources = f"{MESSAGE_FTS_TABLE_NAME} JOIN main.{MESSAGE_TABLE_NAME} m ON m.id = {MESSAGE_FTS_TABLE_NAME}.rowid"
+                if self.__use_archive:
+                    # The content of the archived message is only in the archive, where snippet() can't read it
+                    snippet = f"CASE WHEN m.id IS NULL THEN {self.__getSnippetQuery('zlib_decompress(a.content)')} ELSE {snippet} END"
+                    message_thread_id = "IFNULL(m.thread_id, a.thread_id)"
+                    sources = f"""{MESSAGE_FTS_TABLE_NAME}
+                                  LEFT JOIN main.{MESSAGE_TABLE_NAME} m ON m.id = {MESSAGE_FTS_TABLE_NAME}.rowid
+                                  LEFT JOIN {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME} a
+                                  ON m.id IS NULL AND a.id = {MESSAGE_FTS_TABLE_NAME}.rowid"""
+                query = f"""SELECT {message_thread_id} AS thread_id, {MESSAGE_FTS_TABLE_NAME}.rowid AS message_id, {snippet} AS snippet
+                            FROM {sources}
+                            WHERE {MESSAGE_FTS_TABLE_NAME} MATCH :query AND {message_thread_id} IS NOT NULL"""
+                if thread_id:
+                    query += f" AND {message_thread_id} = :thread_id"
+                query += f" ORDER BY {MESSAGE_FTS_TABLE_NAME}.rank"
+            else:
+                params["pattern"] = f"%{text}%"
+                queries = []
+                for table_name, content in self.__getMessageSources():
+                    query = f"""SELECT thread_id, id AS message_id, {self.__getSnippetQuery(content)} AS snippet
+                                FROM {table_name} WHERE LOWER({content}) LIKE LOWER(:pattern)"""
+                    if thread_id:
+                        query += " AND thread_id = :thread_id"
+                    queries.append(query)
+                query = " UNION ALL ".join(queries) + " ORDER BY message_id DESC"
+            if limit:
+                query += " LIMIT :limit"
+            self.__c.execute(query, params)
+            return self.__c.fetchall()
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+
+    def searchThreads(self, text, limit=THREAD_CONTENT_SEARCH_LIMIT) -> list[int]:
+        """Return the ids of the threads which have the messages including the text, up to the limit.
+        Unlike searchMessages, this doesn't rank the messages or make the snippets, so it's fast enough for the search while typing.
+        The archived messages are searched as well.
+        """
+        try:
+            if self.__isFtsQuery(text):
+                message_thread_id = "m.thread_id"
+                sources = f"{MESSAGE_FTS_TABLE_NAME} JOIN main.{MESSAGE_TABLE_NAME} m ON m.id = {MESSAGE_FTS_TABLE_NAME}.rowid"
+                if self.__use_archive:
+                    message_thread_id = "IFNULL(m.thread_id, a.thread_id)"
+                    sources = f"""{MESSAGE_FTS_TABLE_NAME}
+                                  LEFT JOIN main.{MESSAGE_TABLE_NAME} m ON m.id = {MESSAGE_FTS_TABLE_NAME}.rowid
+                                  LEFT JOIN {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME} a
+                                  ON m.id IS NULL AND a.id = {MESSAGE_FTS_TABLE_NAME}.rowid"""
+                query = f"""SELECT DISTINCT {message_thread_id} FROM {sources}
+                            WHERE {MESSAGE_FTS_TABLE_NAME} MATCH ? AND {message_thread_id} IS NOT NULL LIMIT ?"""
+                params = (self.__getFtsQuery(text), limit)
+            else:
+                queries = [
+                    f"SELECT thread_id FROM {table_name} WHERE LOWER({content}) LIKE LOWER(?)"
+                    for table_name, content in self.__getMessageSources()
+                ]
+                # UNION leaves each thread once
+                query = " UNION ".join(queries) + " LIMIT ?"
+                params = (*[f"%{text}%"] * len(queries), limit)
+            self.__c.execute(query, params)
+            return [row[0] for row in self.__c.fetchall()]
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+
+    def __getMessageSources(self):
+        """Return the tables of the messages with the expression of their content, which include the archive if it's used."""
+        sources = [(f"main.{MESSAGE_TABLE_NAME}", "content")]
+        if self.__use_archive:
+            sources.append((f"{THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME}", "zlib_decompress(content)"))
+        return sources
+
+    @staticmethod
+    def __getSnippetQuery(content):
+        """Return the expression of the part of the content around the text (the parameter :text) for the search without the full-text index."""
+        return f"""substr({content}, max(instr(LOWER({content}), LOWER(:text)) - {MESSAGE_SEARCH_SNIPPET_LENGTH}, 1),
+                          {MESSAGE_SEARCH_SNIPPET_LENGTH * 3})"""
+
+    def __isFtsQuery(self, text):
+        """Return whether the full-text index can search the text."""
+        return self.__is_fts_available and len(text) >= MESSAGE_FTS_MIN_QUERY_LENGTH
+
+    @staticmethod
+    def __getFtsQuery(text):
+        # Wrap the text in double quotes to match it as a phrase, not as FTS5 query syntax
+        return '"' + text.replace('"', '""') + '"'
+
+    def selectAllContentOfThread(self, content_to_select=None):
+        """This is for selecting all messages in all threads which include the content_to_select."""
+        message_ids = ",".join(str(row["message_id"]) for row in self.searchMessages(content_to_select))
+        if not message_ids:
+            return []
+        columns = ChatMessageContainer.get_keys()
+        queries = [
+            f"SELECT {', '.join(f'{content} AS content' if column == 'content' else column for column in columns)} "
+            f"FROM {table_name} WHERE id IN ({message_ids})"
+            for table_name, content in self.__getMessageSources()
+        ]
+        self.__c.execute(" UNION ALL ".join(queries) + " ORDER BY thread_id, id")
+        arr = {}
+        for elem in self.__c.fetchall():
+            arr.setdefault(elem["thread_id"], []).append(ChatMessageContainer(**elem))
+        return list(arr.items())
+
+    def insertMessage(self, arg: ChatMessageContainer, deactivate_trigger=False, wait=True, files=None):
+        """Insert the message and return its id.
+
+        :param files: The data of the files attached to the message (e.g. images), which are saved in the same transaction
+        """
+        excludes = ["id", "update_dt", "insert_dt"]
+        insert_query = self.__getInsertMessageQuery(excludes)
+        # Hash the files and count the tokens here, not in the writer thread
+        file_rows = [self.__getChatFileRow(bytes(data)) for data in files or []]
+        if arg.token_count is None:
+            arg.token_count = count_message_tokens(arg.content, arg.model, len(file_rows))
+        values = arg.get_values_for_insert(excludes=excludes)
+        triggers = [THREAD_MESSAGE_INSERTED_TR_NAME] if deactivate_trigger else []
+
+        def write(c):
+            with self.__suspendTriggers(c, *triggers):
+                new_id = c.execute(insert_query, values).lastrowid
+            if file_rows:
+                self.__insertChatFiles(c, arg.thread_id, new_id, file_rows)
+            return new_id
+
+        return self.__write(write, wait)
+
+    def updateMessage(self, id, favorite, wait=True):
+        """Update message favorite. This returns the date when favorite is set."""
+        current_date = datetime.now().strftime(DEFAULT_DATETIME_FORMAT)
+
+        def update(c):
+            c.execute(
                 f"""
                             UPDATE {MESSAGE_TABLE_NAME}
                             SET favorite = ?,
@@ -586,44 +1641,318 @@ class SqliteDatabase:
                         """,
                 (favorite, favorite, current_date, id),
             )
-            self.__conn.commit()
+            return c.rowcount
+
+        def write(c):
+            if update(c) == 0 and self.__use_archive:
+                # The message is archived, bring its thread back as it's used again
+                row = c.execute(f"SELECT thread_id FROM {THREAD_ARCHIVE_SCHEMA_NAME}.{MESSAGE_ARCHIVE_TABLE_NAME} WHERE id = ?", (id,)).fetchone()
+                if row:
+                    self.__restoreThread(c, row[0])
+                    update(c)
             return current_date
+
+        return self.__write(write, wait)
+
+    def __addMessageTokenCount(self):
+        """Add the column of the token count of each message, and the index of the messages which are not counted yet.
+        The tokens of the existing messages are counted later in the background (See countMessageTokens).
+        """
+        try:
+            self.__c.execute(f"PRAGMA table_info({MESSAGE_TABLE_NAME})")
+            if not any([col[1] == "token_count" for col in self.__c.fetchall()]):
+                self.__c.execute(
+                    f"ALTER TABLE {MESSAGE_TABLE_NAME} ADD COLUMN token_count INTEGER",
+                )
+            # Only the messages which are not counted yet are in the partial index,
+            # so finding none of them after they are counted doesn't scan the table on every launch
+            self.__c.execute(
+                f"CREATE INDEX IF NOT EXISTS {MESSAGE_TOKEN_COUNT_INDEX_NAME} ON {MESSAGE_TABLE_NAME} (id) WHERE token_count IS NULL",
+            )
+            self.__conn.commit()
+        except sqlite3.Error as e:
+            print(f"An error occurred while altering the table: {e}")
+            raise
+
+    def countMessageTokens(self, batch_size=CONTEXT_TOKEN_COUNT_BATCH_SIZE) -> int:
+        """Count the tokens of the messages saved before the token count is kept, up to batch_size messages in one transaction.
+        Call this repeatedly until it returns 0 to count every message incrementally.
+        The tokens are counted before the transaction, so the other writes don't wait for them.
+
+        :return: The number of the counted messages
+        """
+        try:
+            rows = self.__c.execute(
+                f"""SELECT m.id, m.content, m.model,
+                           (SELECT count(*) FROM {CHAT_FILE_MESSAGE_TABLE_NAME} f WHERE f.message_id = m.id) AS file_count
+                    FROM {MESSAGE_TABLE_NAME} m WHERE m.token_count IS NULL LIMIT ?""",
+                (batch_size,),
+            ).fetchall()
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
             raise
+        values = [(count_message_tokens(row["content"], row["model"], row["file_count"]), row["id"]) for row in rows]
+
+        def write(c):
+            # Counting the tokens doesn't update the threads
+            with self.__suspendTriggers(c, THREAD_MESSAGE_UPDATED_TR_NAME):
+                c.executemany(
+                    f"UPDATE {MESSAGE_TABLE_NAME} SET token_count = ? WHERE id = ? AND token_count IS NULL",
+                    values,
+                )
+            return len(values)
 
-    def __createChatFile(self):
+        return self.__write(write)
 
+    def __createResponseCache(self):
         try:
-            # Check if the table exists
+            # The chunks of each response are saved in JSON to replay the stream as it was
             self.__c.execute(
-                f"SELECT count(*) FROM sqlite_master WHERE type='table' AND name='{CHAT_FILE_TABLE_NAME}'",
+                f"""CREATE TABLE IF NOT EXISTS {RESPONSE_CACHE_TABLE_NAME}
+                         (hash VARCHAR(64) PRIMARY KEY,
+                          model VARCHAR(255),
+                          provider VARCHAR(255),
+                          chunks TEXT,
+                          size INT,
+                          insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
+                          access_dt DATETIME DEFAULT CURRENT_TIMESTAMP)""",
             )
-            if self.__c.fetchone()[0] == 1:
-                # Add provider column if not exists
-                self.__c.execute(f"PRAGMA table_info({CHAT_FILE_TABLE_NAME})")
-                columns = self.__c.fetchall()
-                if not any([col[1] == "provider" for col in columns]):
-                    self.__c.execute(
-                        f"ALTER TABLE {CHAT_FILE_TABLE_NAME} ADD COLUMN provider VARCHAR(255)",
-                    )
-            else:
+            self.__c.execute(
+                f"CREATE INDEX IF NOT EXISTS {RESPONSE_CACHE_ACCESS_DT_INDEX_NAME} ON {RESPONSE_CACHE_TABLE_NAME} (access_dt)",
+            )
+            # The messages which are replayed from the cache
+            self.__c.execute(f"PRAGMA table_info({MESSAGE_TABLE_NAME})")
+            if not any([col[1] == "is_cached" for col in self.__c.fetchall()]):
                 self.__c.execute(
-                    f"""CREATE TABLE {CHAT_FILE_TABLE_NAME}
-                             (id INTEGER PRIMARY KEY,
-                              thread_id INTEGER,
-                              message_id INTEGER,
-                              name TEXT,
-                              data BLOB,
-                              update_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
-                              insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP)""",
+                    f"ALTER TABLE {MESSAGE_TABLE_NAME} ADD COLUMN is_cached INT DEFAULT 0",
                 )
-                # Commit the transaction
-                self.__conn.commit()
+            self.__conn.commit()
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the table: {e}")
+            raise
+
+    def selectResponseCache(self, data_hash, ttl_days=RESPONSE_CACHE_TTL_DAYS) -> dict | None:
+        """Return the cached response of the request (dict of "model", "provider" and "chunks"), or None if it's not cached or expired.
+
+        :param data_hash: The hash of the request (See get_response_cache_key)
+        """
+        try:
+            row = self.__c.execute(
+                f"SELECT model, provider, chunks FROM {RESPONSE_CACHE_TABLE_NAME} WHERE hash = ? AND insert_dt >= datetime('now', ?)",
+                (data_hash, f"-{ttl_days} days"),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+        if row is None:
+            return None
+        # The least recently used responses are removed first
+        self.__write(
+            lambda c: c.execute(
+                f"UPDATE {RESPONSE_CACHE_TABLE_NAME} SET access_dt = CURRENT_TIMESTAMP WHERE hash = ?", (data_hash,),
+            ),
+            wait=False,
+        )
+        return {"model": row["model"], "provider": row["provider"], "chunks": json.loads(row["chunks"])}
+
+    def insertResponseCache(
+        self, data_hash, model, provider, chunks: list[str],
+        max_size=RESPONSE_CACHE_MAX_SIZE, ttl_days=RESPONSE_CACHE_TTL_DAYS, wait=False,
+    ):
+        """Save the response of the request, and remove the expired ones and the least recently used ones over max_size."""
+        data = json.dumps(chunks, ensure_ascii=False)
+
+        def write(c):
+            c.execute(
+                f"INSERT OR REPLACE INTO {RESPONSE_CACHE_TABLE_NAME} (hash, model, provider, chunks, size) VALUES (?, ?, ?, ?, ?)",
+                (data_hash, model, provider, data, len(data.encode("utf-8"))),
+            )
+            c.execute(
+                f"DELETE FROM {RESPONSE_CACHE_TABLE_NAME} WHERE insert_dt < datetime('now', ?)",
+                (f"-{ttl_days} days",),
+            )
+            c.execute(
+                f"""DELETE FROM {RESPONSE_CACHE_TABLE_NAME} WHERE hash IN (
+                      SELECT hash FROM (
+                        SELECT hash, SUM(size) OVER (ORDER BY access_dt DESC, rowid DESC) AS total_size
+                        FROM {RESPONSE_CACHE_TABLE_NAME}
+                      ) WHERE total_size > ?
+                    )""",
+                (max_size,),
+            )
+
+        return self.__write(write, wait)
+
+    def clearResponseCache(self):
+        self.__write(lambda c: c.execute(f"DELETE FROM {RESPONSE_CACHE_TABLE_NAME}"))
+
+    def __addMessageTag(self):
+        try:
+            self.__c.execute(f"PRAGMA table_info({MESSAGE_TABLE_NAME})")
+            if not any([col[1] == "tag" for col in self.__c.fetchall()]):
+                self.__c.execute(
+                    f"ALTER TABLE {MESSAGE_TABLE_NAME} ADD COLUMN tag VARCHAR(255)",
+                )
+            self.__conn.commit()
+        except sqlite3.Error as e:
+            print(f"An error occurred while altering the table: {e}")
+            raise
+
+    def __createProviderHealth(self):
+        try:
+            self.__c.execute(
+                f"""CREATE TABLE IF NOT EXISTS {PROVIDER_HEALTH_TABLE_NAME}
+                         (provider VARCHAR(255),
+                          model VARCHAR(255),
+                          ttft REAL,
+                          throughput REAL,
+                          error_rate REAL,
+                          run_count INT,
+                          update_time REAL,
+                          PRIMARY KEY (provider, model))""",
+            )
+            self.__conn.commit()
         except sqlite3.Error as e:
             print(f"An error occurred while creating the table: {e}")
             raise
 
+    def selectProviderHealth(self) -> list[ProviderHealthContainer]:
+        try:
+            self.__c.execute(f"SELECT * FROM {PROVIDER_HEALTH_TABLE_NAME}")
+            return [ProviderHealthContainer(**elem) for elem in self.__c.fetchall()]
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+
+    def upsertProviderHealth(self, arg: ProviderHealthContainer, wait=False):
+        query = arg.create_insert_query(table_name=PROVIDER_HEALTH_TABLE_NAME).replace(
+            "INSERT", "INSERT OR REPLACE", 1,
+        )
+        values = arg.get_values_for_insert()
+        return self.__write(lambda c: c.execute(query, values), wait)
+
+    def __createChatFile(self):
+        try:
+            # The table of the older versions, which has a row for each file of each message
+            self.__c.execute(f"PRAGMA table_info({CHAT_FILE_TABLE_NAME})")
+            old_columns = [col[1] for col in self.__c.fetchall()]
+            if old_columns and "hash" not in old_columns:
+                self.__c.execute(f"ALTER TABLE {CHAT_FILE_TABLE_NAME} RENAME TO {CHAT_FILE_TABLE_NAME}_old")
+
+            # Each file is saved only once, however many messages it is attached to
+            self.__c.execute(
+                f"""CREATE TABLE IF NOT EXISTS {CHAT_FILE_TABLE_NAME}
+                         (id INTEGER PRIMARY KEY,
+                          hash VARCHAR(64) UNIQUE NOT NULL,
+                          mime_type VARCHAR(255),
+                          size INT,
+                          data BLOB,
+                          insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP)""",
+            )
+            # thread_id is kept to remove the links along with the thread, because the messages can be moved into the archive
+            self.__c.execute(
+                f"""CREATE TABLE IF NOT EXISTS {CHAT_FILE_MESSAGE_TABLE_NAME}
+                         (message_id INTEGER,
+                          position INT,
+                          thread_id INTEGER,
+                          file_id INTEGER,
+                          PRIMARY KEY (message_id, position),
+                          FOREIGN KEY (thread_id) REFERENCES {THREAD_TABLE_NAME}(id)
+                          ON DELETE CASCADE,
+                          FOREIGN KEY (file_id) REFERENCES {CHAT_FILE_TABLE_NAME}(id))""",
+            )
+            self.__c.execute(
+                f"CREATE INDEX IF NOT EXISTS {CHAT_FILE_MESSAGE_THREAD_ID_INDEX_NAME} ON {CHAT_FILE_MESSAGE_TABLE_NAME} (thread_id)",
+            )
+            self.__c.execute(
+                f"CREATE INDEX IF NOT EXISTS {CHAT_FILE_MESSAGE_FILE_ID_INDEX_NAME} ON {CHAT_FILE_MESSAGE_TABLE_NAME} (file_id)",
+            )
+            self.__c.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS {CHAT_FILE_MESSAGE_DELETED_TR_NAME}
+                AFTER DELETE ON {CHAT_FILE_MESSAGE_TABLE_NAME}
+                WHEN NOT EXISTS (SELECT 1 FROM {CHAT_FILE_MESSAGE_TABLE_NAME} WHERE file_id = OLD.file_id)
+                BEGIN
+                  DELETE FROM {CHAT_FILE_TABLE_NAME} WHERE id = OLD.file_id;
+                END
+            """,
+            )
+
+            if old_columns and "hash" not in old_columns:
+                self.__c.execute(
+                    f"""SELECT thread_id, message_id, data FROM {CHAT_FILE_TABLE_NAME}_old
+                        WHERE message_id IS NOT NULL AND data IS NOT NULL
+                        AND message_id IN (SELECT id FROM {MESSAGE_TABLE_NAME} WHERE thread_id = {CHAT_FILE_TABLE_NAME}_old.thread_id)
+                        ORDER BY message_id, id""",
+                )
+                rows = self.__c.fetchall()
+                for message_id, files in groupby(rows, key=lambda row: row["message_id"]):
+                    files = list(files)
+                    self.__insertChatFiles(
+                        self.__c,
+                        files[0]["thread_id"],
+                        message_id,
+                        [self.__getChatFileRow(bytes(row["data"])) for row in files],
+                    )
+                self.__c.execute(f"DROP TABLE {CHAT_FILE_TABLE_NAME}_old")
+            # Commit the transaction
+            self.__conn.commit()
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the table: {e}")
+            raise
+
+    @staticmethod
+    def __getChatFileRow(data: bytes):
+        """Return the hash, MIME type and data of the file to insert."""
+        return hashlib.sha256(data).hexdigest(), filetype.guess_mime(data), data
+
+    def __insertChatFiles(self, c, thread_id, message_id, file_rows):
+        """Link the files to the message with the cursor c, saving the ones which aren't saved yet. This doesn't commit."""
+        for position, (data_hash, mime_type, data) in enumerate(file_rows):
+            row = c.execute(f"SELECT id FROM {CHAT_FILE_TABLE_NAME} WHERE hash = ?", (data_hash,)).fetchone()
+            if row is None:
+                file_id = c.execute(
+                    f"INSERT INTO {CHAT_FILE_TABLE_NAME} (hash, mime_type, size, data) VALUES (?, ?, ?, ?)",
+                    (data_hash, mime_type, len(data), data),
+                ).lastrowid
+            else:
+                file_id = row[0]
+            c.execute(
+                f"INSERT INTO {CHAT_FILE_MESSAGE_TABLE_NAME} (message_id, position, thread_id, file_id) VALUES (?, ?, ?, ?)",
+                (message_id, position, thread_id, file_id),
+            )
+
+    def selectChatFilesOfMessages(self, message_ids) -> dict[int, list[str]]:
+        """Return the hashes of the files attached to each of the messages, in the order they are attached."""
+        files = {}
+        if not message_ids:
+            return files
+        try:
+            self.__c.execute(
+                f"""SELECT l.message_id, f.hash FROM {CHAT_FILE_MESSAGE_TABLE_NAME} l
+                    JOIN {CHAT_FILE_TABLE_NAME} f ON f.id = l.file_id
+                    WHERE l.message_id IN ({",".join("?" * len(message_ids))})
+                    ORDER BY l.message_id, l.position""",
+                list(message_ids),
+            )
+            for row in self.__c.fetchall():
+                files.setdefault(row["message_id"], []).append(row["hash"])
+            return files
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+
+    def selectChatFile(self, data_hash) -> sqlite3.Row | None:
+        """Return the MIME type and data of the file."""
+        try:
+            self.__c.execute(
+                f"SELECT mime_type, data FROM {CHAT_FILE_TABLE_NAME} WHERE hash = ?", (data_hash,),
+            )
+            return self.__c.fetchone()
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+
     def __createImage(self):
         try:
             # Check if the table exists
@@ -656,24 +1985,182 @@ class SqliteDatabase:
                               update_dt DATETIME DEFAULT CURRENT_TIMESTAMP,
                               insert_dt DATETIME DEFAULT CURRENT_TIMESTAMP)""",
                 )
-                # Commit the transaction
-                self.__conn.commit()
+            # Commit the transaction
+            self.__conn.commit()
         except sqlite3.Error as e:
             print(f"An error occurred while creating the table: {e}")
             raise
 
-    def insertImage(self, arg: ImagePromptContainer):
+    def __addImageBlobColumns(self):
+        """Add columns for the image data in the blob store if not exists."""
         try:
-            excludes = ["id", "insert_dt", "update_dt"]
-            query = arg.create_insert_query(IMAGE_TABLE_NAME, excludes)
-            values = arg.get_values_for_insert(excludes)
-            self.__c.execute(query, values)
-            new_id = self.__c.lastrowid
+            self.__c.execute(f"PRAGMA table_info({IMAGE_TABLE_NAME})")
+            columns = self.__c.fetchall()
+            if not any([col[1] == "data_hash" for col in columns]):
+                self.__c.execute(
+                    f"ALTER TABLE {IMAGE_TABLE_NAME} ADD COLUMN data_hash VARCHAR(64)",
+                )
+                self.__c.execute(
+                    f"ALTER TABLE {IMAGE_TABLE_NAME} ADD COLUMN data_size INT",
+                )
             self.__conn.commit()
-            return new_id
         except sqlite3.Error as e:
-            print("An error occurred..")
+            print(f"An error occurred while altering the table: {e}")
+            raise
+
+    def __createImageThumbnail(self):
+        try:
+            # Downscaled previews of the images for each size
+            # data is NULL if the preview can't be made (e.g. the image URL of the very old version)
+            self.__c.execute(
+                f"""CREATE TABLE IF NOT EXISTS {IMAGE_THUMBNAIL_TABLE_NAME}
+                         (image_id INTEGER,
+                          size INT,
+                          data BLOB,
+                          PRIMARY KEY (image_id, size),
+                          FOREIGN KEY (image_id) REFERENCES {IMAGE_TABLE_NAME}(id)
+                          ON DELETE CASCADE)""",
+            )
+            # Commit the transaction
+            self.__conn.commit()
+        except sqlite3.Error as e:
+            print(f"An error occurred while creating the table: {e}")
+            raise
+
+    def __putBlob(self, data: bytes) -> tuple[str, int]:
+        """Save the data into the blob store, and keep it until __releaseBlob is called after the row which refers to it is committed."""
+        with self.__blob_lock:
+            data_hash, data_size = self.__blob_store.put(data)
+            self.__pending_blobs[data_hash] += 1
+        return data_hash, data_size
+
+    def __releaseBlob(self, data_hash):
+        with self.__blob_lock:
+            self.__pending_blobs[data_hash] -= 1
+            if self.__pending_blobs[data_hash] <= 0:
+                del self.__pending_blobs[data_hash]
+
+    def __writeWithBlobs(self, func, data_hashes, wait=True):
+        """__write which releases the blobs put for func (__putBlob) after it is committed."""
+        try:
+            future = self.__write(func, wait=False)
+        except Exception:
+            for data_hash in data_hashes:
+                self.__releaseBlob(data_hash)
+            raise
+        future.add_done_callback(lambda _: [self.__releaseBlob(data_hash) for data_hash in data_hashes])
+        return future.result() if wait else future
+
+    def storeImageData(self, arg: ImagePromptContainer) -> bool:
+        """Save the image data into the blob store and set data_hash and data_size of arg, if the store is used.
+        Return True if it is saved, then the blob has to be released with __releaseBlob after the row is committed.
+        """
+        if self.__use_blob_store and isinstance(arg.data, bytes) and not arg.data_hash:
+            arg.data_hash, arg.data_size = self.__putBlob(arg.data)
+            return True
+        return False
+
+    def insertImage(self, arg: ImagePromptContainer, wait=True):
+        data_hashes = [arg.data_hash] if self.storeImageData(arg) else []
+        excludes = ["id", "insert_dt", "update_dt"]
+        query = arg.create_insert_query(IMAGE_TABLE_NAME, excludes)
+        values = arg.get_values_for_insert(excludes)
+        if arg.data_hash:
+            # Only the hash and size are kept in the table
+            values[arg.get_keys(excludes).index("data")] = None
+        return self.__writeWithBlobs(lambda c: c.execute(query, values).lastrowid, data_hashes, wait)
+
+    def selectImageData(self, id) -> bytes | str | None:
+        """Return the image data of the row, which is read from the blob store if it was moved into it."""
+        try:
+            self.__c.execute(f"SELECT data, data_hash FROM {IMAGE_TABLE_NAME} WHERE id=?", (id,))
+            row = self.__c.fetchone()
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+        if row is None:
+            return None
+        if row["data_hash"] and self.__blob_store.exists(row["data_hash"]):
+            return self.__blob_store.get(row["data_hash"])
+        return row["data"]
+
+    def selectImageThumbnail(self, image_id, size) -> bytes | None:
+        """Return the preview of the image in the size, or None if it is not made yet."""
+        try:
+            self.__c.execute(
+                f"SELECT data FROM {IMAGE_THUMBNAIL_TABLE_NAME} WHERE image_id=? AND size=?",
+                (image_id, size),
+            )
+            row = self.__c.fetchone()
+            return row["data"] if row else None
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+
+    def generateImageThumbnails(
+        self, create_thumbnail, sizes=IMAGE_THUMBNAIL_SIZES, batch_size=IMAGE_THUMBNAIL_BATCH_SIZE,
+    ) -> int:
+        """Make the previews of the images which don't have them yet, up to batch_size images in one transaction.
+        Call this repeatedly until it returns 0 to make the previews of every image.
+        The previews are made before the transaction, so the other writes don't wait for them.
+
+        :param create_thumbnail: The function which takes the image data and the size, and returns the preview (or None if it fails)
+        :return: The number of the images processed
+        """
+        try:
+            rows = self.__c.execute(
+                f"""SELECT id, data, data_hash FROM {IMAGE_TABLE_NAME}
+                    WHERE id NOT IN (SELECT image_id FROM {IMAGE_THUMBNAIL_TABLE_NAME})
+                    LIMIT ?""",
+                (batch_size,),
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
+        values = []
+        for id, data, data_hash in rows:
+            if data_hash and self.__blob_store.exists(data_hash):
+                data = self.__blob_store.get(data_hash)
+            values += [(id, size, create_thumbnail(data, size) if isinstance(data, bytes) else None, id) for size in sizes]
+
+        def write(c):
+            # The image can be removed in the meantime
+            c.executemany(
+                f"""INSERT OR IGNORE INTO {IMAGE_THUMBNAIL_TABLE_NAME} (image_id, size, data)
+                    SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM {IMAGE_TABLE_NAME} WHERE id = ?)""",
+                values,
+            )
+            return len(rows)
+
+        return self.__write(write)
+
+    def migrateImageDataToBlobStore(self, batch_size=IMAGE_BLOB_MIGRATION_BATCH_SIZE) -> int:
+        """Move the image data which is still in the table into the blob store, up to batch_size rows in one transaction.
+        Call this repeatedly until it returns 0 to move every image incrementally.
+        The files are written before the transaction, so the other writes don't wait for them.
+
+        :return: The number of the moved rows
+        """
+        try:
+            # The image URL (string) of the very old version can't be moved
+            rows = self.__c.execute(
+                f"SELECT id, data FROM {IMAGE_TABLE_NAME} WHERE IFNULL(data_hash, '') = '' AND typeof(data) = 'blob' LIMIT ?",
+                (batch_size,),
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
             raise
+        values = [(*self.__putBlob(data), id) for id, data in rows]
+
+        def write(c):
+            # The row can be removed or moved by the other thread in the meantime
+            c.executemany(
+                f"UPDATE {IMAGE_TABLE_NAME} SET data=NULL, data_hash=?, data_size=? WHERE id=? AND IFNULL(data_hash, '') = ''",
+                values,
+            )
+            return len(values)
+
+        return self.__writeWithBlobs(write, [data_hash for data_hash, _, _ in values])
 
     def selectImage(self):
         try:
@@ -692,12 +2179,39 @@ class SqliteDatabase:
             raise
 
     def removeImage(self, id=None):
+        condition = f" WHERE id = {id}" if id else ""
+
+        def write(c):
+            data_hashes = {
+                row[0]
+                for row in c.execute(
+                    f"SELECT DISTINCT data_hash FROM {IMAGE_TABLE_NAME}{condition}",
+                ).fetchall()
+                if row[0]
+            }
+            c.execute(f"DELETE FROM {IMAGE_TABLE_NAME}{condition}")
+            # Return the blobs which are not referred by any other row
+            return [
+                data_hash
+                for data_hash in data_hashes
+                if not c.execute(
+                    f"SELECT 1 FROM {IMAGE_TABLE_NAME} WHERE data_hash=? LIMIT 1", (data_hash,),
+                ).fetchone()
+            ]
+
+        data_hashes = self.__write(write)
+        with self.__blob_lock:
+            for data_hash in data_hashes:
+                # Check again under the lock, as the other thread can put the same data after the rows are deleted
+                if data_hash in self.__pending_blobs or self.__isBlobReferred(data_hash):
+                    continue
+                self.__blob_store.remove(data_hash)
+
+    def __isBlobReferred(self, data_hash):
         try:
-            query = f"DELETE FROM {IMAGE_TABLE_NAME}"
-            if id:
-                query += f" WHERE id = {id}"
-            self.__c.execute(query)
-            self.__conn.commit()
+            return self.__c.execute(
+                f"SELECT 1 FROM {IMAGE_TABLE_NAME} WHERE data_hash=? LIMIT 1", (data_hash,),
+            ).fetchone() is not None
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
             raise
@@ -713,28 +2227,73 @@ class SqliteDatabase:
             raise
 
     def export(self, ids, filename):
-        # Get the records of the threads of the given ids
-        thread_records = self.selectAllThread(ids)
-        data = [dict(record) for record in thread_records]
-        # Convert it into dictionary
-        for d in data:
-            d["messages"] = list(
-                map(lambda x: x.__dict__, self.selectCertainThreadMessages(d["id"])),
-            )
+        self.exportThreads(ids, filename)
+
+    def exportThreads(self, ids, filename, ndjson=False, progress_callback=None, is_cancelled=None) -> bool:
+        """Save the threads of the given ids with their messages as JSON, and return False if it is cancelled.
+        The threads and messages are written one by one while reading them from the cursors, so the memory use doesn't grow with the size of the history.
+        This is meant to be called from the other thread (e.g. QThread) not to block the UI.
 
-        # Save the JSON
-        with open(filename, "w") as f:
-            json.dump(data, f)
+        :param ndjson: Write each thread in one line (JSON Lines) instead of the array of the threads
+        :param progress_callback: The function called with the number of threads written so far after each thread
+        :param is_cancelled: The function which returns True to stop exporting. Nothing is saved then.
+        """
+        # Write to the temporary file and rename it, so the half-written file is never left
+        fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)))
+        try:
+            # The messages are read while the threads are being read, so each needs its own cursor
+            thread_c = self.__conn.cursor()
+            message_c = self.__conn.cursor()
+            thread_c.execute(self.getThreadListQuery(f'{THREAD_TABLE_NAME}.id IN ({",".join(map(str, ids))})'))
+            cancelled = False
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                if not ndjson:
+                    f.write("[")
+                for i, thread in enumerate(thread_c):
+                    if is_cancelled and is_cancelled():
+                        cancelled = True
+                        break
+                    if i > 0 and not ndjson:
+                        f.write(", ")
+                    # The thread object without the closing brace, to write its messages into it
+                    f.write(json.dumps(dict(thread))[:-1] + ', "messages": [')
+                    message_c.execute(*self.__getThreadMessagesQuery(thread["id"]))
+                    for j, message in enumerate(message_c):
+                        if j > 0:
+                            f.write(", ")
+                        f.write(json.dumps(ChatMessageContainer(**message).__dict__))
+                    f.write("]}")
+                    if ndjson:
+                        f.write("\n")
+                    if progress_callback:
+                        progress_callback(i + 1)
+                if not ndjson:
+                    f.write("]")
+            if cancelled:
+                os.remove(tmp_filename)
+                return False
+            os.replace(tmp_filename, filename)
+            return True
+        except Exception:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
 
     def getCursor(self):
         return self.__c
 
     def close(self):
-        self.__conn.close()
+        if self.__writer is not None and threading.get_ident() == self.__owner_thread_id:
+            self.__writer.stop()
+            self.__writer = None
+        # Close the connection of the current thread
+        if hasattr(self.__local, "conn"):
+            self.__local.conn.close()
+            del self.__local.conn, self.__local.c
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         # Close the connection
-        self.__conn.close()
\ No newline at end of file
+        self.close()
\ No newline at end of file
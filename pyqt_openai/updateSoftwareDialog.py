@@ -13,6 +13,7 @@ from qtpy.QtWidgets import QDialog, QDialogButtonBox, QLabel, QMessageBox, QText
 from pyqt_openai import BIN_DIR, CURRENT_FILENAME, OWNER, PACKAGE_NAME, UPDATER_PATH, __version__, is_frozen
 from pyqt_openai.config_loader import CONFIG_MANAGER
 from pyqt_openai.lang.translations import LangClass
+from pyqt_openai.util.http_client import http_get
 
 if TYPE_CHECKING:
     from qtpy.QtWidgets import QWidget
@@ -98,7 +99,7 @@ def check_for_updates(
     try:
         url: str = f"https://api.github.com/repos/{owner}/{repo}/releases"
 
-        response: requests.Response = requests.get(url)
+        response: requests.Response = http_get(url)
         releases: list[dict[str, str]] = response.json()
 
         update_available: bool = False
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import tempfile
+
+
+class BlobStore:
+    """Content-addressed store of the binary data (e.g. generated images) in the directory.
+    Each blob is saved in a file named after the SHA-256 hash of its content, so the same data is saved only once.
+    """
+
+    def __init__(self, directory):
+        self.__directory = directory
+
+    def get_directory(self):
+        return self.__directory
+
+    def get_path(self, data_hash: str):
+        # Split into subdirectories by the first two characters not to put too many files in one directory
+        return os.path.join(self.__directory, data_hash[:2], data_hash)
+
+    def exists(self, data_hash: str):
+        return os.path.exists(self.get_path(data_hash))
+
+    def put(self, data: bytes) -> tuple[str, int]:
+        """Save the data if it isn't saved yet, and return its hash and size."""
+        data_hash = hashlib.sha256(data).hexdigest()
+        path = self.get_path(data_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to the temporary file and rename it, so the half-written file is never read
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+        return data_hash, len(data)
+
+    def open(self, data_hash: str) -> mmap.mmap:
+        """Return the read-only memory-mapped file of the blob. Close it after use (It can be used with "with" statement)."""
+        with open(self.get_path(data_hash), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get(self, data_hash: str) -> bytes:
+        """Return the content of the blob. Use open to read it without copying it into memory."""
+        with open(self.get_path(data_hash), "rb") as f:
+            return f.read()
+
+    def remove(self, data_hash: str):
+        try:
+            os.remove(self.get_path(data_hash))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+from collections.abc import Coroutine
+from concurrent.futures import Future
+from typing import Any
+
+from pyqt_openai import CHAT_ENGINE_MAX_CONCURRENT_REQUESTS
+
+
+class ChatEngine:
+    """One long-lived asyncio event loop in the background thread, which runs the requests to the LLMs.
+    Many requests can be streamed at the same time without a thread for each of them.
+
+    The loop starts when the first coroutine is submitted. Only CHAT_ENGINE_MAX_CONCURRENT_REQUESTS requests
+    (the coroutines which use ``limit``) run at the same time, the others wait for their turn.
+    """
+
+    def __init__(self, max_concurrent_requests=CHAT_ENGINE_MAX_CONCURRENT_REQUESTS):
+        self.__max_concurrent_requests = max_concurrent_requests
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__thread: threading.Thread | None = None
+        self.__semaphore: asyncio.Semaphore | None = None
+        self.__lock = threading.Lock()
+
+    def __start(self):
+        with self.__lock:
+            if self.__loop is None:
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self.__semaphore = asyncio.Semaphore(self.__max_concurrent_requests)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                # Daemon not to keep the application running after the window is closed
+                self.__thread = threading.Thread(target=run, name="ChatEngine", daemon=True)
+                self.__thread.start()
+                started.wait()
+                self.__loop = loop
+        return self.__loop
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> Future:
+        """Run the coroutine in the loop and return Future of its result. Cancel the Future to cancel the coroutine."""
+        return asyncio.run_coroutine_threadsafe(coro, self.__start())
+
+    def call_soon(self, callback, *args):
+        """Call the callback in the loop from the other thread (e.g. to release the asyncio primitives)."""
+        self.__start().call_soon_threadsafe(callback, *args)
+
+    def limit(self) -> asyncio.Semaphore:
+        """The semaphore of the number of the requests running at the same time. Use it in the loop with ``async with``."""
+        return self.__semaphore
+
+    def stop(self):
+        """Cancel every coroutine and stop the loop."""
+        with self.__lock:
+            loop, self.__loop = self.__loop, None
+        if loop is None:
+            return
+
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop)
+        self.__thread.join()
+        loop.close()
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import time
+
+from pyqt_openai import CHUNK_FLUSH_INTERVAL_SECONDS, CHUNK_FLUSH_MAX_CHARS
+
+
+class ChunkBuffer:
+    """Collect the chunks of the stream in the worker, so they are sent to the UI at most once per display frame
+    (or when CHUNK_FLUSH_MAX_CHARS are collected) instead of one signal for each chunk.
+
+    The first chunk after a pause is due right away, and the worker flushes what's left when the stream ends.
+    This is used only in the thread (or the loop) which makes the chunks.
+    """
+
+    def __init__(self, interval=CHUNK_FLUSH_INTERVAL_SECONDS, max_size=CHUNK_FLUSH_MAX_CHARS):
+        self.__interval = interval
+        self.__max_size = max_size
+        self.__chunks: list[str] = []
+        self.__size = 0
+        self.__flush_time = float("-inf")
+
+    def add(self, chunk: str):
+        if chunk:
+            self.__chunks.append(chunk)
+            self.__size += len(chunk)
+
+    def is_empty(self) -> bool:
+        return not self.__chunks
+
+    def get_delay(self) -> float:
+        """Return the seconds until the collected chunks are due to be flushed."""
+        if self.__size >= self.__max_size:
+            return 0.0
+        return max(self.__flush_time + self.__interval - time.monotonic(), 0.0)
+
+    def is_due(self) -> bool:
+        return bool(self.__chunks) and self.get_delay() == 0.0
+
+    def flush(self) -> str:
+        """Return the collected chunks as one and empty the buffer."""
+        text = "".join(self.__chunks)
+        self.__chunks = []
+        self.__size = 0
+        self.__flush_time = time.monotonic()
+        return text
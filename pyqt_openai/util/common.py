@@ -5,8 +5,12 @@ Some of the functions are used to set PyQt settings, restart the application, sh
 """
 from __future__ import annotations
 
+import asyncio
 import base64
 import csv
+import hashlib
+import inspect
+import io
 import json
 import os
 import random
@@ -20,7 +24,11 @@ import traceback
 import wave
 import zipfile
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from itertools import count
 from pathlib import Path
 from inspect import signature
 
@@ -28,9 +36,10 @@ import filetype
 import numpy as np
 import psutil
 
+from PIL import Image, features
 from g4f import ProviderType
 from g4f.providers.base_provider import ProviderModelMixin
-from litellm import completion
+from litellm import acompletion, completion
 
 from pyqt_openai.widgets.scrollableErrorDialog import ScrollableErrorDialog
 
@@ -48,7 +57,7 @@ from g4f.errors import ProviderNotFoundError
 from g4f.models import ModelUtils
 from g4f.providers.retry_provider import IterListProvider
 from jinja2 import Template
-from qtpy.QtCore import QThread, QUrl, Qt, Signal
+from qtpy.QtCore import QObject, QThread, QUrl, Qt, Signal
 from qtpy.QtGui import QDesktopServices
 from qtpy.QtWidgets import QFrame, QMessageBox
 
@@ -66,20 +75,32 @@ from pyqt_openai import (
     AUTOSTART_REGISTRY_KEY,
     is_frozen,
     G4F_PROVIDER_DEFAULT,
+    G4F_AUTO_MAX_ATTEMPTS,
     O1_MODELS,
     STT_MODEL,
     DEFAULT_DATETIME_FORMAT,
-    DEFAULT_TOKEN_CHUNK_SIZE, DEFAULT_API_CONFIGS, INDENT_SIZE, )
+    DEFAULT_TOKEN_CHUNK_SIZE, DEFAULT_API_CONFIGS, INDENT_SIZE, IMAGE_THUMBNAIL_QUALITY,
+    FILE_NAME_LENGTH, ZIP_EXPORT_MAX_WORKERS, CHAT_ENGINE_MAX_PENDING_CHUNKS, DB_BACKUP_DIR_NAME, get_config_directory, CHAT_FILE_URL_CACHE_SIZE,
+    HTTP_KEEPALIVE_SECONDS, HTTP_PREWARM_URLS, )
 from pyqt_openai.config_loader import CONFIG_MANAGER
 from pyqt_openai.globals import (
+    CHAT_ENGINE,
     DB,
+    G4F_ASYNC_CLIENT,
     G4F_CLIENT,
     LLAMAINDEX_WRAPPER,
     OPENAI_CLIENT,
+    PROVIDER_HEALTH,
+    RATE_LIMITER,
     REPLICATE_CLIENT,
 )
 from pyqt_openai.lang.translations import LangClass
 from pyqt_openai.models import ChatMessageContainer
+from pyqt_openai.sqlite import get_db_filename
+from pyqt_openai.util.chunk_buffer import ChunkBuffer
+from pyqt_openai.util.http_client import prewarm_async
+from pyqt_openai.util.snapshot_store import SnapshotStore
+from pyqt_openai.util.token_counter import count_messages_tokens
 
 if TYPE_CHECKING:
     from g4f import ProviderType
@@ -98,14 +119,14 @@ def open_directory(path):
 
 
 def message_list_to_txt(db, thread_id, title, username="User", ai_name="AI"):
-    content = ""
     certain_thread_filename_content = db.selectCertainThreadMessagesRaw(thread_id)
-    content += f"== {title} ==" + CONTEXT_DELIMITER
+    # Join the parts at once instead of concatenating the long text repeatedly
+    content = [f"== {title} =="]
     for unit in certain_thread_filename_content:
-        unit_prefix = username if unit[2] == 1 else ai_name
-        unit_content = unit[3]
-        content += f"{unit_prefix}: {unit_content}" + CONTEXT_DELIMITER
-    return content
+        unit_prefix = username if unit["role"] == "user" else ai_name
+        unit_content = unit["content"]
+        content.append(f"{unit_prefix}: {unit_content}")
+    return CONTEXT_DELIMITER.join(content) + CONTEXT_DELIMITER
 
 
 def is_valid_regex(pattern):
@@ -116,10 +137,10 @@ def is_valid_regex(pattern):
         return False
 
 
-def conv_unit_to_html(db, id, title):
-    certain_conv_filename_content = db.selectCertainThreadMessagesRaw(id)
-    chat_history = [unit[3] for unit in certain_conv_filename_content]
-    template = Template(
+@lru_cache(maxsize=1)
+def get_conv_html_template():
+    """Compile the template of the exported html file only once."""
+    return Template(
         """
     <html>
         <head>
@@ -155,7 +176,12 @@ def conv_unit_to_html(db, id, title):
     </html>
     """
     )
-    html = template.render(title=title, chat_history=chat_history)
+
+
+def conv_unit_to_html(db, id, title):
+    certain_conv_filename_content = db.selectCertainThreadMessagesRaw(id)
+    chat_history = [unit[3] for unit in certain_conv_filename_content]
+    html = get_conv_html_template().render(title=title, chat_history=chat_history)
     return html
 
 
@@ -164,6 +190,57 @@ def add_file_to_zip(file_content, file_name, output_zip_file):
         zipf.writestr(file_name, file_content)
 
 
+def export_threads_to_zip(db, ids, output_zip_file, file_type, progress_callback=None, is_cancelled=None, max_workers=ZIP_EXPORT_MAX_WORKERS):
+    """Save each thread of the given ids as the txt or html file in the ZIP file, and return False if it is cancelled.
+    The threads are rendered in the thread pool and written in order to the ZIP file which is opened only once.
+    Only a few threads are rendered ahead of the one being written, so the memory use doesn't grow with the number of threads.
+
+    :param file_type: "txt" or "html"
+    :param progress_callback: The function called with the number of threads written so far after each thread
+    :param is_cancelled: The function which returns True to stop exporting. Nothing is saved then.
+    """
+    ext, func = {"txt": (".txt", message_list_to_txt), "html": (".html", conv_unit_to_html)}[file_type]
+
+    def render(id):
+        # Limit the title length to file name length
+        title = db.selectThread(id)["name"][:FILE_NAME_LENGTH]
+        return f"{title}_{id}{ext}", func(db, id, title)
+
+    # Write to the temporary file and rename it, so the half-written file is never left
+    fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_zip_file)))
+    os.close(fd)
+    cancelled = False
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor, zipfile.ZipFile(tmp_filename, "w") as zipf:
+            ids = iter(ids)
+            pending = deque()
+            written = 0
+            while True:
+                while len(pending) < max_workers * 2 and (id := next(ids, None)) is not None:
+                    pending.append(executor.submit(render, id))
+                if not pending:
+                    break
+                if is_cancelled and is_cancelled():
+                    cancelled = True
+                    for future in pending:
+                        future.cancel()
+                    break
+                file_name, file_content = pending.popleft().result()
+                zipf.writestr(file_name, file_content)
+                written += 1
+                if progress_callback:
+                    progress_callback(written)
+        if cancelled:
+            os.remove(tmp_filename)
+            return False
+        os.replace(tmp_filename, output_zip_file)
+        return True
+    except Exception:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
 def generate_random_string(length):
     letters = string.ascii_letters + string.digits
     return "".join(random.choice(letters) for _ in range(length))
@@ -581,6 +658,19 @@ def get_g4f_providers_by_model(model, including_auto=False):
     return supported_providers
 
 
+def get_g4f_auto_providers(model):
+    """Return the working providers which G4F uses for the model when the provider is Auto, in the order of G4F."""
+    best_provider = getattr(ModelUtils.convert.get(model), "best_provider", None)
+    if best_provider is None:
+        return []
+    providers = getattr(best_provider, "providers", [best_provider])
+    return [
+        provider.__name__
+        for provider in providers
+        if getattr(provider, "working", False) and provider.__name__ in ProviderUtils.convert
+    ]
+
+
 def get_chat_model(is_g4f=False):
     if is_g4f:
         return get_g4f_models()
@@ -627,6 +717,17 @@ def get_image_url_from_local(image):
     return f"data:{get_mime_type_from_bytes(image)};base64,{base64_image}"
 
 
+@lru_cache(maxsize=CHAT_FILE_URL_CACHE_SIZE)
+def get_chat_file_url(data_hash):
+    """
+    Return the data URL of the file attached to the message, which is read from the database and encoded only once while it is cached
+    """
+    row = DB.selectChatFile(data_hash)
+    if row is None:
+        return None
+    return f"data:{row['mime_type']};base64,{base64.b64encode(row['data']).decode('utf-8')}"
+
+
 def get_message_obj(role, content):
     return {"role": role, "content": content}
 
@@ -639,6 +740,37 @@ def get_provider_from_model(model):
     return None
 
 
+def get_provider_name(model, is_g4f=False, provider=G4F_PROVIDER_DEFAULT):
+    """Return the name of the provider of the model for the rate limit (e.g. "OpenAI", "G4F" or the name of the G4F provider)."""
+    if is_g4f:
+        return "G4F" if not provider or provider == G4F_PROVIDER_DEFAULT else provider
+    for config in DEFAULT_API_CONFIGS:
+        if model in config.get("model_list", []) or (
+            config.get("prefix") and model.startswith(config["prefix"] + "/")
+        ):
+            return config["display_name"]
+    return "API"
+
+
+# The last time each url was connected in advance
+_prewarm_times: dict[str, float] = {}
+
+
+def prewarm_provider(model, is_g4f=False, provider=G4F_PROVIDER_DEFAULT):
+    """Connect to the API of the model in the chat engine in advance, so the first request to it doesn't wait for the connection.
+    G4F providers use their own sessions, so they are not connected in advance.
+    """
+    url = HTTP_PREWARM_URLS.get(get_provider_name(model, is_g4f, provider))
+    if url is None:
+        return
+    now = time.monotonic()
+    # The connection is still alive
+    if now - _prewarm_times.get(url, -HTTP_KEEPALIVE_SECONDS) < HTTP_KEEPALIVE_SECONDS:
+        return
+    _prewarm_times[url] = now
+    CHAT_ENGINE.submit(prewarm_async(url))
+
+
 def get_g4f_image_models() -> list:
     """
     Get all the models that support image generation
@@ -935,17 +1067,62 @@ def get_response(args, is_g4f=False, get_content_only=True, provider=""):
     :param provider: The provider of the model (Auto if not provided)
     """
     try:
+        # Waits for the rate limit of the provider, and sends it again after 429
+        provider_name = get_provider_name(args["model"], is_g4f, provider)
+        tokens = count_messages_tokens(args.get("messages", []), args["model"])
         if is_g4f:
             if provider != G4F_PROVIDER_DEFAULT:
-                args["provider"] = convert_to_provider(provider)
-            return get_g4f_response(args, get_content_only=False)
+                # The arguments of the caller are kept as they are, e.g. for the next provider
+                args = {**args, "provider": convert_to_provider(provider)}
+            return RATE_LIMITER.call(
+                provider_name, get_g4f_response, args, get_content_only=False, tokens=tokens,
+            )
         else:
-            return get_api_response(args, get_content_only)
+            return RATE_LIMITER.call(
+                provider_name, get_api_response, args, get_content_only, tokens=tokens,
+            )
     except Exception as e:
         print(e)
         raise e
 
 
+async def get_async_response(args, is_g4f=False, provider=""):
+    """
+    Get the response from the API in the event loop of the chat engine
+    :param args: The arguments to pass to the API
+    :param is_g4f: Whether the model is G4F or not
+    :param provider: The provider of the model (Auto if not provided)
+    :return: The async iterator of the chunks if args["stream"] is True, otherwise the response
+    """
+    if is_g4f:
+        if provider != G4F_PROVIDER_DEFAULT:
+            # The arguments of the caller are kept as they are, e.g. for the next provider
+            args = {**args, "provider": convert_to_provider(provider)}
+        response = G4F_ASYNC_CLIENT.chat.completions.create(**args)
+    else:
+        response = acompletion(drop_params=True, **args)
+    # The async client of G4F returns the async iterator itself when streaming
+    if inspect.isawaitable(response):
+        response = await response
+    return response
+
+
+def is_response_cacheable(args, is_g4f=False):
+    """Only the deterministic requests to the API (temperature 0) are cached. G4F may answer from a different provider each time."""
+    return not is_g4f and "messages" in args and args.get("temperature") == 0
+
+
+def get_response_cache_key(args):
+    """Return the hash of the request arguments (See get_argument).
+    It doesn't depend on the order of the keys or whether the response is streamed, so the same request always has the same key.
+    """
+    canonical = json.dumps(
+        {k: v for k, v in args.items() if k != "stream"},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
 # This has to be here because of the circular import problem
 def init_llama():
     llama_index_directory = CONFIG_MANAGER.get_general_property("llama_index_directory")
@@ -1191,79 +1368,292 @@ class STTThread(QThread):
             os.remove(self.filename)
 
 
-class ChatThread(QThread):
+class ChatEngineBridge(QObject):
+    """
+    Delivers what the requests running in the chat engine make to the UI thread
+    The signals are emitted in the thread of the engine, and queued to this object which lives in the UI thread
     """
+
+    chunkReceived = Signal(object, str)
+    replyReceived = Signal(object, str)
+    streamFinished = Signal(object)
+    requestFinished = Signal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.chunkReceived.connect(self.__showChunk)
+        self.replyReceived.connect(lambda request, reply: request.replyGenerated.emit(reply, False, request.getInfo()))
+        self.streamFinished.connect(lambda request: request.streamFinished.emit(request.getInfo()))
+        self.requestFinished.connect(lambda request: request.finished.emit())
+
+    def __showChunk(self, request, chunk):
+        request.replyGenerated.emit(chunk, True, request.getInfo())
+        # Let the stream go on, now that the chunk is shown
+        request.chunkShown()
+
+
+_chat_engine_bridge = None
+
+
+def get_chat_engine_bridge():
+    """Return the bridge of the chat engine, which is made in the UI thread when it's called for the first time."""
+    global _chat_engine_bridge
+    if _chat_engine_bridge is None:
+        _chat_engine_bridge = ChatEngineBridge()
+    return _chat_engine_bridge
+
+
+class ChatRequest(QObject):
+    """
+    The request to the LLM, which runs in the chat engine (See CHAT_ENGINE) instead of its own thread
+    It can be used like QThread (start, stop, started, finished), and many of them can run at the same time
+
     == replyGenerated Signal ==
     First: response
     Second: streaming or not streaming
     Third: ChatMessageContainer
     """
 
+    started = Signal()
+    finished = Signal()
     replyGenerated = Signal(str, bool, ChatMessageContainer)
     streamFinished = Signal(ChatMessageContainer)
 
+    __ids = count(1)
+
     def __init__(
-        self, input_args, info: ChatMessageContainer, is_g4f=False, provider=""
+        self, input_args, info: ChatMessageContainer, is_g4f=False, provider="", parent=None
     ):
-        super().__init__()
+        super().__init__(parent)
+        self.__id = next(self.__ids)
         self.__input_args = input_args
-        self.__stop = False
         self.__is_g4f = is_g4f
         self.__provider = provider
+        self.__future = None
+        # Whether __run or __finishIfNotRun has taken the request, which is set in the loop of the engine
+        self.__is_taken = False
+        self.__is_stopped = False
+        # The chunks which are sent to the UI but not shown yet, which is made in the loop of the engine
+        self.__pending_chunks = None
+        self.__emitted_count = 0
+        # The chunks are sent to the UI together once per frame, which are made in the loop of the engine
+        self.__chunk_buffer = ChunkBuffer()
+        self.__flush_lock = None
+        self.__flush_task = None
 
         self.__info = info
         self.__info.role = "assistant"
 
+        self.__use_cache = CONFIG_MANAGER.get_general_property(
+            "response_cache",
+        ) and is_response_cacheable(input_args, is_g4f)
+
+    def getId(self):
+        return self.__id
+
+    def getInfo(self):
+        return self.__info
+
+    def start(self):
+        self.__bridge = get_chat_engine_bridge()
+        self.started.emit()
+        self.__future = CHAT_ENGINE.submit(self.__run())
+        self.__future.add_done_callback(self.__onDone)
+
     def stop(self):
-        self.__stop = True
+        if self.__future is not None:
+            self.__is_stopped = True
+            self.__future.cancel()
+
+    def isRunning(self):
+        return self.__future is not None and not self.__future.done()
+
+    def __onDone(self, future):
+        # Stopped by the user (not by the engine which is shutting down).
+        # It's checked in the loop, where __run starts, so only one of them finishes the request
+        if future.cancelled() and self.__is_stopped:
+            CHAT_ENGINE.call_soon(self.__finishIfNotRun)
+
+    def __finishIfNotRun(self):
+        """Finish the request which is stopped before it starts to run, as __run does when it's stopped."""
+        if self.__is_taken:
+            return
+        self.__is_taken = True
+        self.__info.finish_reason = "stopped by user"
+        if self.__input_args["stream"]:
+            self.__bridge.streamFinished.emit(self)
+        else:
+            self.__bridge.replyReceived.emit(self, self.__info.content or "")
+        self.__bridge.requestFinished.emit(self)
+
+    def chunkShown(self):
+        CHAT_ENGINE.call_soon(self.__pending_chunks.release)
+
+    async def __emitChunk(self, chunk):
+        # The chunk without the content (e.g. the first one which has the role only) doesn't count as the output
+        if not chunk:
+            return
+        self.__chunk_buffer.add(chunk)
+        self.__emitted_count += 1
+        if self.__chunk_buffer.is_due():
+            await self.__flushChunks()
+        elif self.__flush_task is None or self.__flush_task.done():
+            # Send the rest even if the stream pauses before the next chunk
+            self.__flush_task = asyncio.create_task(self.__flushChunksLater())
+
+    async def __flushChunks(self):
+        # The lock keeps the order of the chunks between the stream and the delayed flush
+        async with self.__flush_lock:
+            # Wait for the UI to catch up if it's behind, instead of piling up the chunks
+            await self.__pending_chunks.acquire()
+            text = self.__chunk_buffer.flush()
+            if text:
+                self.__bridge.chunkReceived.emit(self, text)
+            else:
+                self.__pending_chunks.release()
 
-    def run(self):
-        try:
-            self.__info.is_g4f = self.__is_g4f
-            # For getting the provider if it is G4F
-            get_content_only = not self.__info.is_g4f
+    async def __flushChunksLater(self):
+        await asyncio.sleep(self.__chunk_buffer.get_delay())
+        await self.__flushChunks()
 
-            if self.__input_args["stream"]:
-                response = get_response(
-                    self.__input_args, self.__is_g4f, get_content_only, self.__provider
-                )
-                for chunk in response:
-                    # Get provider if it is G4F
-                    # Get the content from choices[0].delta.content if it is G4F, otherwise get it from chunk
-                    # The reason is that G4F has content in choices[0].delta.content, otherwise it has content in chunk.
-                    if self.__is_g4f:
-                        self.__info.provider = chunk.provider
-                        self.__info.model = chunk.model
-                        chunk = chunk.choices[0].delta.content
-                    if self.__stop:
-                        self.__info.finish_reason = "stopped by user"
-                        self.streamFinished.emit(self.__info)
-                        break
-                    else:
-                        self.replyGenerated.emit(chunk, True, self.__info)
+    def __cancelFlush(self):
+        if self.__flush_task is not None:
+            self.__flush_task.cancel()
+            self.__flush_task = None
+
+    async def __request(self, stream) -> list[str]:
+        """Send the request and show the response, and return the chunks of it.
+        If the provider of G4F is Auto, the providers are tried in the order of their health until one of them answers.
+        """
+        model = self.__input_args["model"]
+        providers = [self.__provider]
+        if self.__is_g4f and self.__provider == G4F_PROVIDER_DEFAULT:
+            # The health may be read from the database for the first time
+            providers = (await asyncio.to_thread(
+                PROVIDER_HEALTH.sort_providers, get_g4f_auto_providers(model), model,
+            ))[:G4F_AUTO_MAX_ATTEMPTS] or providers
+        # Counting the tokens of the whole history takes a while, so it's done once out of the loop
+        tokens = await asyncio.to_thread(count_messages_tokens, self.__input_args["messages"], model)
+        for i, provider in enumerate(providers):
+            emitted_count = self.__emitted_count
+            try:
+                return await self.__requestProvider(stream, provider, tokens)
+            except Exception:
+                # The response which is shown partly can't be answered by the other provider
+                if self.__emitted_count > emitted_count or i == len(providers) - 1:
+                    raise
+
+    async def __requestProvider(self, stream, provider, tokens) -> list[str]:
+        model = self.__input_args["model"]
+        # Auto if there is no provider to try, then G4F picks it
+        self.__info.provider = "" if provider == G4F_PROVIDER_DEFAULT else provider
+        start_time = time.perf_counter()
+        first_token_time = None
+        try:
+            # Waits in the loop while the provider is rate-limited, so the other requests keep going
+            response = await RATE_LIMITER.call_async(
+                get_provider_name(model, self.__is_g4f, provider),
+                get_async_response,
+                self.__input_args,
+                self.__is_g4f,
+                provider,
+                tokens=tokens,
+            )
+            if stream:
+                chunks = []
+                try:
+                    async for chunk in response:
+                        # Get provider if it is G4F
+                        if self.__is_g4f:
+                            self.__info.provider = chunk.provider
+                            self.__info.model = chunk.model
+                        content = chunk.choices[0].delta.content or ""
+                        if first_token_time is None and content:
+                            first_token_time = time.perf_counter()
+                        chunks.append(content)
+                        await self.__emitChunk(content)
+                finally:
+                    # Close the connection right away when stopped
+                    if hasattr(response, "aclose"):
+                        await response.aclose()
             else:
-                response = get_response(
-                    self.__input_args, self.__is_g4f, get_content_only
-                )
                 # Get provider if it is G4F
-                # Get the content from choices[0].message.content if it is G4F, otherwise get it from response
-                # The reason is that G4F has content in choices[0].message.content, otherwise it has content in response.
                 if self.__is_g4f:
-                    self.__info.content = response.choices[0].message.content
                     self.__info.model = response.model
                     self.__info.provider = response.provider
-                else:
-                    self.__info.content = response
+                self.__info.content = response.choices[0].message.content or ""
                 self.__info.prompt_tokens = ""
                 self.__info.completion_tokens = ""
                 self.__info.total_tokens = ""
+                chunks = [self.__info.content]
+        except Exception:
+            if self.__is_g4f:
+                await asyncio.to_thread(PROVIDER_HEALTH.record_error, self.__info.provider, model)
+            raise
+
+        if self.__is_g4f:
+            end_time = time.perf_counter()
+            first_token_time = first_token_time or end_time
+            throughput = None
+            if stream and end_time > first_token_time:
+                throughput = sum(map(len, chunks)) / (end_time - first_token_time)
+            await asyncio.to_thread(
+                PROVIDER_HEALTH.record_success, self.__info.provider, model, first_token_time - start_time, throughput,
+            )
+        return chunks
+
+    async def __replay(self, cached, stream):
+        """Show the cached response as if it's sent from the API."""
+        self.__info.model = cached["model"] or self.__info.model
+        self.__info.provider = cached["provider"] or ""
+        self.__info.is_cached = 1
+        if stream:
+            for chunk in cached["chunks"]:
+                await self.__emitChunk(chunk)
+        else:
+            self.__info.content = "".join(cached["chunks"])
+
+    async def __run(self):
+        # The task may start after the stop has been handled by __finishIfNotRun
+        if self.__is_taken:
+            return
+        self.__is_taken = True
+        self.__pending_chunks = asyncio.Semaphore(CHAT_ENGINE_MAX_PENDING_CHUNKS)
+        self.__flush_lock = asyncio.Lock()
+        stream = self.__input_args["stream"]
+        try:
+            async with CHAT_ENGINE.limit():
+                self.__info.is_g4f = self.__is_g4f
+                # The key of the request as the user made it, before the provider is tried
+                cache_key = get_response_cache_key(self.__input_args) if self.__use_cache else None
+                # The database is used out of the loop not to stop the other streams (it commits right away without WAL mode)
+                cached = await asyncio.to_thread(DB.selectResponseCache, cache_key) if cache_key else None
+                if cached:
+                    await self.__replay(cached, stream)
+                else:
+                    chunks = await self.__request(stream)
+                    if cache_key:
+                        await asyncio.to_thread(
+                            DB.insertResponseCache, cache_key, self.__info.model, self.__info.provider, chunks,
+                        )
 
             self.__info.finish_reason = "stop"
 
-            if self.__input_args["stream"]:
-                self.streamFinished.emit(self.__info)
+            if stream:
+                # Every chunk is shown before the stream is finished
+                self.__cancelFlush()
+                await self.__flushChunks()
+                self.__bridge.streamFinished.emit(self)
             else:
-                self.replyGenerated.emit(self.__info.content, False, self.__info)
+                self.__bridge.replyReceived.emit(self, self.__info.content)
+        except asyncio.CancelledError:
+            self.__info.finish_reason = "stopped by user"
+            if stream:
+                self.__cancelFlush()
+                await self.__flushChunks()
+                self.__bridge.streamFinished.emit(self)
+            else:
+                self.__bridge.replyReceived.emit(self, self.__info.content or "")
         except Exception as e:
             self.__info.provider = self.__provider
             self.__info.finish_reason = "Error"
@@ -1277,7 +1667,138 @@ You can try the following:
 - Change the model
 - Use API instead of G4F
 """
-            self.replyGenerated.emit(self.__info.content, False, self.__info)
+            self.__bridge.replyReceived.emit(self, self.__info.content)
+        finally:
+            self.__cancelFlush()
+            self.__bridge.requestFinished.emit(self)
+
+
+class DatabaseTaskThread(QThread):
+    """Run the task on the database in the background, and send its result with taskFinished.
+
+    If batch is True, the task is the function which processes a batch and returns the number of the rows (e.g. DB.migrateImageDataToBlobStore).
+    It's called until it returns 0 or the thread is stopped, so the database is locked only for a batch at a time,
+    and progressUpdated is sent with the number of the rows done so far after each batch.
+    """
+
+    progressUpdated = Signal(int)
+    taskFinished = Signal(object)
+    errorGenerated = Signal(str)
+
+    def __init__(self, task, batch=False, parent=None):
+        super().__init__(parent)
+        self.__task = task
+        self.__batch = batch
+        self.__stop = False
+        self.__requested = False
+        self.finished.connect(self.__runAgainIfRequested)
+
+    def stop(self):
+        self.__stop = True
+
+    def isStopped(self):
+        return self.__stop
+
+    def request(self):
+        """Start the thread, or run it again after it's finished if it's running (e.g. for the rows added in the meantime)."""
+        if self.isRunning():
+            self.__requested = True
+        else:
+            self.start()
+
+    def __runAgainIfRequested(self):
+        if self.__requested:
+            self.__requested = False
+            self.start()
+
+    def run(self):
+        try:
+            if self.__batch:
+                done = 0
+                while not self.__stop:
+                    count = self.__task()
+                    if count == 0:
+                        break
+                    done += count
+                    self.progressUpdated.emit(done)
+                self.taskFinished.emit(done)
+            else:
+                self.taskFinished.emit(self.__task())
+        except Exception as e:
+            self.errorGenerated.emit(str(e))
+
+
+def get_snapshot_store():
+    return SnapshotStore(os.path.join(get_config_directory(), DB_BACKUP_DIR_NAME), get_db_filename())
+
+
+def backup_database(keep_count: int, progress_callback=None, is_cancelled=None) -> str | None:
+    """Save the snapshot of the database while it's used, and remove the old snapshots except the newest keep_count ones.
+
+    :return: The filename of the snapshot, or None if it's cancelled
+    """
+    store = get_snapshot_store()
+    filename = store.get_new_path()
+    if DB.backupDatabase(filename, progress_callback=progress_callback, is_cancelled=is_cancelled):
+        store.prune(keep_count)
+        return filename
+    return None
+
+
+def restore_database(filename: str):
+    """Overwrite the database with the snapshot. The current database is saved as the snapshot first, so the restore can be undone."""
+    new_filename = get_snapshot_store().get_new_path()
+    # Don't overwrite the snapshot to restore, which has just been taken
+    if os.path.abspath(new_filename) != os.path.abspath(filename):
+        DB.backupDatabase(new_filename)
+    DB.restoreDatabase(filename)
+
+
+def create_image_thumbnail(image_data: bytes, size: int, error_callback=None) -> bytes | None:
+    """Downscale the image to fit in size x size and encode it in WebP (JPEG if WebP is not supported).
+    If it fails, error_callback is called with the error and None is returned.
+    """
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            image.thumbnail((size, size))
+            buffer = io.BytesIO()
+            if features.check("webp"):
+                image.convert("RGBA").save(buffer, "WEBP", quality=IMAGE_THUMBNAIL_QUALITY)
+            else:
+                image.convert("RGB").save(buffer, "JPEG", quality=IMAGE_THUMBNAIL_QUALITY)
+            return buffer.getvalue()
+    except Exception as e:
+        if error_callback:
+            error_callback(e)
+        return None
+
+
+# To manage only one thumbnail thread
+current_thumbnail_thread = None
+
+
+def get_image_thumbnail_thread():
+    """Return the thread which makes the missing previews of the images. errorGenerated is sent once for each batch in which some previews can't be made."""
+    if pyqt_openai.util.common.current_thumbnail_thread is None:
+
+        def generate():
+            errors = []
+            count = DB.generateImageThumbnails(lambda data, size: create_image_thumbnail(data, size, errors.append))
+            if errors:
+                # TODO LANGUAGE
+                thread.errorGenerated.emit(f"{len(errors)} previews of the images can't be made: {errors[0]}")
+            return count
+
+        thread = DatabaseTaskThread(generate, batch=True)
+        pyqt_openai.util.common.current_thumbnail_thread = thread
+    return pyqt_openai.util.common.current_thumbnail_thread
+
+
+def generate_image_thumbnails():
+    """Make the missing previews of the images in the background, and return the thread doing it."""
+    thread = get_image_thumbnail_thread()
+    thread.request()
+    return thread
 
 
 # To manage only one TTS stream at a time
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import importlib.util
+
+from functools import lru_cache
+
+import httpx
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from pyqt_openai import (
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    HTTP_KEEPALIVE_SECONDS,
+    HTTP_LLM_READ_TIMEOUT_SECONDS,
+    HTTP_POOL_HOSTS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_READ_TIMEOUT_SECONDS,
+)
+
+
+def is_http2_available() -> bool:
+    # httpx needs h2 (pip install httpx[http2]) for HTTP/2, otherwise HTTP/1.1 is used
+    return importlib.util.find_spec("h2") is not None
+
+
+@lru_cache(maxsize=None)
+def get_http_session() -> requests.Session:
+    """The session of requests shared by the app, which keeps the connections to each host alive for the next requests."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def http_get(url, **kwargs) -> requests.Response:
+    """requests.get with the shared session and the default timeout."""
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_READ_TIMEOUT_SECONDS))
+    return get_http_session().get(url, **kwargs)
+
+
+def _get_httpx_args():
+    return {
+        "limits": httpx.Limits(
+            max_keepalive_connections=HTTP_POOL_MAXSIZE,
+            keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+        ),
+        "timeout": httpx.Timeout(HTTP_LLM_READ_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        "http2": is_http2_available(),
+        # Same as the clients of OpenAI
+        "follow_redirects": True,
+    }
+
+
+@lru_cache(maxsize=None)
+def get_httpx_client() -> httpx.Client:
+    """The httpx client shared by the clients of the LLMs (OpenAI and LiteLLM)."""
+    return httpx.Client(**_get_httpx_args())
+
+
+@lru_cache(maxsize=None)
+def get_async_httpx_client() -> httpx.AsyncClient:
+    """The async httpx client shared by the async clients of the LLMs.
+    Its connections belong to the event loop which uses them first, so use it in the loop of the chat engine only.
+    """
+    return httpx.AsyncClient(**_get_httpx_args())
+
+
+async def prewarm_async(url):
+    """Open the connection to the host of the url, so the next request to it doesn't wait for DNS, TCP and TLS."""
+    try:
+        await get_async_httpx_client().head(url)
+    except httpx.HTTPError:
+        # Only the connection matters, not the response
+        pass
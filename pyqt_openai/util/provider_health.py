@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from typing import TYPE_CHECKING
+
+from pyqt_openai import (
+    PROVIDER_HEALTH_ALPHA,
+    PROVIDER_HEALTH_ERROR_PENALTY_SECONDS,
+    PROVIDER_HEALTH_HALF_LIFE_HOURS,
+)
+from pyqt_openai.models import ProviderHealthContainer
+
+if TYPE_CHECKING:
+    from pyqt_openai.sqlite import SqliteDatabase
+
+
+class ProviderHealthRegistry:
+    """Time to first token, throughput and error rate of each provider for each model, which are saved in the database.
+
+    Each of them is the moving average of the runs, and the older runs lose half of their weight every PROVIDER_HEALTH_HALF_LIFE_HOURS.
+    The error rate decays the same way while the provider is not used, so the provider which failed gets tried again after a while.
+    This can be used from any thread.
+    """
+
+    def __init__(self, db: SqliteDatabase):
+        self.__db = db
+        self.__stats: dict[tuple[str, str], ProviderHealthContainer] | None = None
+        self.__lock = threading.Lock()
+
+    def __get_stats(self):
+        # Loaded when it's used for the first time, not to read the database before it's ready
+        if self.__stats is None:
+            self.__stats = {(health.provider, health.model): health for health in self.__db.selectProviderHealth()}
+        return self.__stats
+
+    @staticmethod
+    def __get_decay(health: ProviderHealthContainer, now: float):
+        return 0.5 ** (max(now - health.update_time, 0) / (PROVIDER_HEALTH_HALF_LIFE_HOURS * 3600))
+
+    def __record(self, provider, model, ttft=None, throughput=None, error=False):
+        if not provider:
+            return
+        now = time.time()
+        with self.__lock:
+            health = self.__get_stats().get((provider, model))
+            if health is None:
+                health = ProviderHealthContainer(provider=provider, model=model, update_time=now)
+                # The first run is all there is to know
+                old_weight = 0.0
+            else:
+                old_weight = (1 - PROVIDER_HEALTH_ALPHA) * self.__get_decay(health, now)
+
+            def average(old, new):
+                return old * old_weight + new * (1 - old_weight)
+
+            health.error_rate = average(health.error_rate, 1.0 if error else 0.0)
+            # The failed runs don't tell how fast the provider is
+            if ttft is not None:
+                health.ttft = average(health.ttft, ttft) if health.ttft else ttft
+            if throughput is not None:
+                health.throughput = average(health.throughput, throughput) if health.throughput else throughput
+            health.run_count += 1
+            health.update_time = now
+            self.__stats[(provider, model)] = health
+            self.__db.upsertProviderHealth(ProviderHealthContainer(**dict(health.get_items())))
+
+    def record_success(self, provider, model, ttft, throughput=None):
+        """Record the run which succeeded.
+
+        :param ttft: Seconds until the first token (or the whole response if it's not streamed)
+        :param throughput: Characters per second after the first token, if it's streamed
+        """
+        self.__record(provider, model, ttft=ttft, throughput=throughput)
+
+    def record_error(self, provider, model):
+        self.__record(provider, model, error=True)
+
+    def get(self, provider, model) -> ProviderHealthContainer | None:
+        with self.__lock:
+            return self.__get_stats().get((provider, model))
+
+    def get_score(self, provider, model) -> float:
+        """Return the expected seconds until the first token with the penalty of the (decayed) error rate. Lower is better.
+        The provider which has never been used gets 0, so it's tried once to know how it is.
+        """
+        health = self.get(provider, model)
+        if health is None:
+            return 0.0
+        error_rate = health.error_rate * self.__get_decay(health, time.time())
+        return health.ttft + error_rate * PROVIDER_HEALTH_ERROR_PENALTY_SECONDS
+
+    def sort_providers(self, providers: list[str], model) -> list[str]:
+        """Return the providers in the order to try for the model, the healthiest first.
+        The providers of the same score keep their order.
+        """
+        return sorted(providers, key=lambda provider: self.get_score(provider, model))
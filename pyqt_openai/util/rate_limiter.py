@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+
+from email.utils import parsedate_to_datetime
+
+from pyqt_openai import (
+    RATE_LIMIT_BACKOFF_BASE_SECONDS,
+    RATE_LIMIT_BACKOFF_MAX_SECONDS,
+    RATE_LIMIT_MAX_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """Return whether the error is 429 (Too Many Requests) of the provider.
+    The clients (OpenAI, LiteLLM, Replicate, G4F) have their own errors, so the status code and the name of the error are checked.
+    """
+    response = getattr(e, "response", None)
+    for status_code in (
+        getattr(e, "status_code", None),
+        getattr(e, "status", None),
+        getattr(response, "status_code", None),
+    ):
+        if status_code == 429:
+            return True
+    return any("RateLimit" in cls.__name__ for cls in type(e).__mro__)
+
+
+def get_retry_after(e: Exception) -> float | None:
+    """Return the seconds to wait in the Retry-After header of the response of the error, or None if there is no header."""
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        # OpenAI sends this more precise one
+        value = headers.get("retry-after-ms")
+        if value:
+            return max(float(value) / 1000, 0.0)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            # HTTP date
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """The bucket which is filled with per_minute units every minute, up to per_minute units."""
+
+    def __init__(self, per_minute: float):
+        self.__capacity = per_minute
+        self.__rate = per_minute / 60
+        self.__level = per_minute
+        self.__update_time = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take the amount out of the bucket and return the seconds to wait until the bucket had it.
+        The bucket goes below zero for the amount which is not there yet, so the later ones wait after it.
+        """
+        self.__level = min(self.__level + (now - self.__update_time) * self.__rate, self.__capacity)
+        self.__update_time = now
+        # More than the bucket can hold waits for the full bucket only
+        self.__level -= min(amount, self.__capacity)
+        return 0.0 if self.__level >= 0 else -self.__level / self.__rate
+
+
+class ProviderRateLimiter:
+    """Keep the requests to each provider under its limits, and wait instead of failing when the provider says 429.
+
+    Each provider has the bucket of the requests and the bucket of the tokens per minute if their limits are set.
+    When the provider answers 429, every request to the provider waits for Retry-After of it
+    (or RATE_LIMIT_BACKOFF_BASE_SECONDS doubled for each 429 in a row, up to RATE_LIMIT_BACKOFF_MAX_SECONDS) and is sent again.
+    The provider is the name in get_provider_name. This can be used from any thread and from the loop of the chat engine.
+    """
+
+    def __init__(self):
+        self.__request_buckets: dict[str, TokenBucket] = {}
+        self.__token_buckets: dict[str, TokenBucket] = {}
+        self.__blocked_until: dict[str, float] = {}
+        self.__failure_counts: dict[str, int] = {}
+        self.__lock = threading.Lock()
+
+    def set_limit(self, provider, requests_per_minute=None, tokens_per_minute=None):
+        """Set the limits of the provider. None or 0 is no limit."""
+        with self.__lock:
+            for buckets, per_minute in (
+                (self.__request_buckets, requests_per_minute),
+                (self.__token_buckets, tokens_per_minute),
+            ):
+                if per_minute:
+                    buckets[provider] = TokenBucket(per_minute)
+                else:
+                    buckets.pop(provider, None)
+
+    def __reserve(self, provider, tokens) -> tuple[float, bool]:
+        """Return the seconds to wait and whether the request is counted in the buckets.
+        While the provider is backing off, nothing is taken from the buckets until it's over.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            blocked_until = self.__blocked_until.get(provider, 0.0)
+            if blocked_until > now:
+                return blocked_until - now, False
+            wait_time = 0.0
+            if provider in self.__request_buckets:
+                wait_time = self.__request_buckets[provider].reserve(1, now)
+            if tokens and provider in self.__token_buckets:
+                wait_time = max(wait_time, self.__token_buckets[provider].reserve(tokens, now))
+            return wait_time, True
+
+    def acquire(self, provider, tokens=0):
+        """Wait until the request of the tokens can be sent to the provider."""
+        while True:
+            wait_time, reserved = self.__reserve(provider, tokens)
+            if wait_time > 0:
+                time.sleep(wait_time)
+            if reserved:
+                return
+
+    async def acquire_async(self, provider, tokens=0):
+        """acquire for the coroutines, which doesn't block the loop while waiting."""
+        while True:
+            wait_time, reserved = self.__reserve(provider, tokens)
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+            if reserved:
+                return
+
+    def backoff(self, provider, retry_after=None) -> float:
+        """Hold the requests to the provider after 429, and return the seconds to wait."""
+        with self.__lock:
+            failure_count = self.__failure_counts.get(provider, 0) + 1
+            self.__failure_counts[provider] = failure_count
+            if retry_after is None:
+                retry_after = min(
+                    RATE_LIMIT_BACKOFF_BASE_SECONDS * 2 ** (failure_count - 1),
+                    RATE_LIMIT_BACKOFF_MAX_SECONDS,
+                )
+            blocked_until = time.monotonic() + retry_after
+            self.__blocked_until[provider] = max(self.__blocked_until.get(provider, 0.0), blocked_until)
+            return retry_after
+
+    def reset_backoff(self, provider):
+        with self.__lock:
+            self.__failure_counts.pop(provider, None)
+
+    def __retry(self, provider, e, attempt) -> bool:
+        if not is_rate_limit_error(e) or attempt == RATE_LIMIT_MAX_RETRIES:
+            return False
+        wait_time = self.backoff(provider, get_retry_after(e))
+        logger.info(f"Rate limited by {provider}, retrying in {wait_time:.1f}s")
+        return True
+
+    def call(self, provider, func, *args, tokens=0, **kwargs):
+        """Call func after acquire, and call it again after the backoff if the provider says 429
+        (up to RATE_LIMIT_MAX_RETRIES times, then the error is raised)."""
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            self.acquire(provider, tokens)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if self.__retry(provider, e, attempt):
+                    continue
+                raise
+            self.reset_backoff(provider)
+            return result
+
+    async def call_async(self, provider, func, *args, tokens=0, **kwargs):
+        """call for the coroutine function."""
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            await self.acquire_async(provider, tokens)
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if self.__retry(provider, e, attempt):
+                    continue
+                raise
+            self.reset_backoff(provider)
+            return result
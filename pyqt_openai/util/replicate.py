@@ -4,13 +4,13 @@ import base64
 import os
 
 import replicate
-import requests
 
 from pyqt_openai.models import ImagePromptContainer
+from pyqt_openai.util.http_client import http_get
 
 
 def download_image_as_base64(url: str):
-    response = requests.get(url)
+    response = http_get(url)
     response.raise_for_status()  # Check if the URL is correct and raise an exception if there is a problem
     image_data = response.content
     base64_encoded = base64.b64decode(base64.b64encode(image_data).decode("utf-8"))
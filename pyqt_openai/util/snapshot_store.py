@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import os
+
+from datetime import datetime, timedelta
+
+from pyqt_openai.sqlite import get_archive_filename
+
+SNAPSHOT_DATETIME_FORMAT = "%Y%m%d_%H%M%S"
+
+
+class SnapshotStore:
+    """Snapshots of the database in the directory, which are named after the database and the time they are taken (e.g. conv_20240101_120000.db).
+    The archive of each snapshot is saved next to it with the archive suffix (e.g. conv_20240101_120000_archive.db).
+    """
+
+    def __init__(self, directory, db_filename):
+        self.__directory = directory
+        self.__prefix = os.path.splitext(os.path.basename(db_filename))[0] + "_"
+
+    def get_directory(self):
+        return self.__directory
+
+    def get_new_path(self, now: datetime | None = None):
+        os.makedirs(self.__directory, exist_ok=True)
+        now = now or datetime.now()
+        return os.path.join(self.__directory, f"{self.__prefix}{now.strftime(SNAPSHOT_DATETIME_FORMAT)}.db")
+
+    def get_time(self, path: str) -> datetime | None:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if not name.startswith(self.__prefix):
+            return None
+        try:
+            return datetime.strptime(name[len(self.__prefix):], SNAPSHOT_DATETIME_FORMAT)
+        except ValueError:
+            # The archive of the snapshot or the other file
+            return None
+
+    def list(self) -> list[str]:
+        """Return the paths of the snapshots, the newest first."""
+        if not os.path.isdir(self.__directory):
+            return []
+        snapshots = []
+        for name in os.listdir(self.__directory):
+            path = os.path.join(self.__directory, name)
+            time = self.get_time(path)
+            if time is not None and name.endswith(".db"):
+                snapshots.append((time, path))
+        return [path for time, path in sorted(snapshots, reverse=True)]
+
+    def is_due(self, interval_hours: int, now: datetime | None = None) -> bool:
+        """Whether the latest snapshot is older than the interval (or there is no snapshot yet)."""
+        snapshots = self.list()
+        if not snapshots:
+            return True
+        now = now or datetime.now()
+        return now - self.get_time(snapshots[0]) >= timedelta(hours=interval_hours)
+
+    def remove(self, path: str):
+        for p in (path, get_archive_filename(path)):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def prune(self, keep_count: int) -> int:
+        """Remove the snapshots except the newest keep_count ones, and return the number of the removed ones."""
+        old_snapshots = self.list()[max(keep_count, 1):]
+        for path in old_snapshots:
+            self.remove(path)
+        return len(old_snapshots)
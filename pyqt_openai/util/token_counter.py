@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+# LiteLLM is imported before tiktoken, so the encodings bundled with it are used instead of downloading them
+from litellm import cost_per_token, get_model_info
+
+import tiktoken
+
+from pyqt_openai import (
+    CONTEXT_DEFAULT_ENCODING,
+    CONTEXT_DEFAULT_WINDOW_TOKENS,
+    CONTEXT_IMAGE_TOKENS,
+    CONTEXT_MESSAGE_OVERHEAD_TOKENS,
+    CONTEXT_REPLY_RESERVED_TOKENS,
+)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = ""):
+    try:
+        # e.g. "openai/gpt-4o" of LiteLLM
+        return tiktoken.encoding_for_model(model.split("/")[-1])
+    except KeyError:
+        # The other models have their own tokenizers, but this is close enough to budget the context
+        return tiktoken.get_encoding(CONTEXT_DEFAULT_ENCODING)
+
+
+def count_tokens(text, model="") -> int:
+    if not text:
+        return 0
+    # The special tokens in the text are counted as the plain text
+    return len(get_encoding(model or "").encode(text, disallowed_special=()))
+
+
+def count_message_tokens(content, model="", image_count=0) -> int:
+    """Return the tokens of the message, including the overhead of the message format and the attached images."""
+    return count_tokens(content, model) + CONTEXT_MESSAGE_OVERHEAD_TOKENS + image_count * CONTEXT_IMAGE_TOKENS
+
+
+def count_messages_tokens(messages, model="") -> int:
+    """Return the tokens of the messages of the request (See get_argument), whose content is the text or the list of the text and the images."""
+    total = 0
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            text = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+            image_count = sum(part.get("type") == "image_url" for part in content)
+            total += count_message_tokens(text, model, image_count)
+        else:
+            total += count_message_tokens(content, model)
+    return total
+
+
+def get_cost(model, prompt_tokens, completion_tokens) -> float | None:
+    """Return the cost of the tokens in USD, or None if LiteLLM doesn't know the price of the model."""
+    try:
+        prompt_cost, completion_cost = cost_per_token(
+            model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+        )
+        return prompt_cost + completion_cost
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_context_window(model: str) -> int:
+    """Return the maximum input tokens of the model, or CONTEXT_DEFAULT_WINDOW_TOKENS if LiteLLM doesn't know the model."""
+    try:
+        info = get_model_info(model)
+        return info.get("max_input_tokens") or info.get("max_tokens") or CONTEXT_DEFAULT_WINDOW_TOKENS
+    except Exception:
+        return CONTEXT_DEFAULT_WINDOW_TOKENS
+
+
+def get_context_token_budget(model, prompt_tokens=0, reply_tokens=None) -> int:
+    """Return the tokens left for the previous messages in the context window of the model.
+
+    :param prompt_tokens: The tokens of the system message and the current message
+    :param reply_tokens: The tokens left for the reply (max_tokens). If None, CONTEXT_REPLY_RESERVED_TOKENS (or a quarter of the small window) is left.
+    """
+    window = get_context_window(model)
+    if reply_tokens is None or reply_tokens < 0:
+        reply_tokens = min(CONTEXT_REPLY_RESERVED_TOKENS, window // 4)
+    return max(window - prompt_tokens - reply_tokens, 0)
@@ -63,6 +63,12 @@ class SqlTableModel(QSqlTableModel):
         self.__table_type: str = table_type
         self.__parent: QWidget | None = parent
 
+    def selectStatement(self) -> str:
+        if self.__table_type == "chat":
+            # Select the statistics of the threads together, which are kept in the separate table
+            return DB.getThreadListQuery(self.filter(), self.orderByClause())
+        return super().selectStatement()
+
     def flags(
         self,
         index: QModelIndex,
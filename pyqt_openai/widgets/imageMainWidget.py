@@ -9,10 +9,9 @@ from qtpy.QtWidgets import QHBoxLayout, QSplitter, QStackedWidget, QVBoxLayout,
 
 from pyqt_openai import DEFAULT_SHORTCUT_LEFT_SIDEBAR_WINDOW, DEFAULT_SHORTCUT_RIGHT_SIDEBAR_WINDOW, ICON_HISTORY, ICON_SETTING
 from pyqt_openai.config_loader import CONFIG_MANAGER
-from pyqt_openai.globals import DB
 from pyqt_openai.lang.translations import LangClass
 from pyqt_openai.models import ImagePromptContainer
-from pyqt_openai.util.common import getSeparator, get_image_filename_for_saving, get_image_prompt_filename_for_saving, open_directory
+from pyqt_openai.util.common import generate_image_thumbnails, getSeparator, get_image_filename_for_saving, get_image_prompt_filename_for_saving, open_directory
 from pyqt_openai.widgets.button import Button
 from pyqt_openai.widgets.imageNavWidget import ImageNavWidget
 from pyqt_openai.widgets.notifier import NotifierWidget
@@ -163,7 +162,8 @@ class ImageMainWidget(QWidget):
         # save
         if self._rightSideBarWidget.isSavedEnabled():
             self._saveResultImage(result)
-        DB.insertImage(result)
+        # The result is already inserted by the thread which generated it
+        generate_image_thumbnails()
         self._imageNavWidget.refresh()
 
     def _saveResultImage(
@@ -2,17 +2,19 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from qtpy.QtCore import QByteArray, QSortFilterProxyModel, Qt, Signal
+from qtpy.QtCore import QSize, QSortFilterProxyModel, Qt, Signal
+from qtpy.QtGui import QIcon, QPixmap
 from qtpy.QtSql import QSqlTableModel
-from qtpy.QtWidgets import QHBoxLayout, QLabel, QMessageBox, QStyledItemDelegate, QVBoxLayout, QWidget
+from qtpy.QtWidgets import QHBoxLayout, QLabel, QMessageBox, QStyledItemDelegate, QStyleOptionViewItem, QVBoxLayout, QWidget
 
+from pyqt_openai import IMAGE_THUMBNAIL_SIZES
 from pyqt_openai.globals import DB
 from pyqt_openai.lang.translations import LangClass
+from pyqt_openai.util.common import generate_image_thumbnails
 from pyqt_openai.widgets.baseNavWidget import BaseNavWidget
 
 if TYPE_CHECKING:
     from qtpy.QtCore import QModelIndex, QPersistentModelIndex
-    from qtpy.QtWidgets import QStyleOptionViewItem
 
 
 class FilterProxyModel(QSortFilterProxyModel):
@@ -41,6 +43,36 @@ class AlignDelegate(QStyledItemDelegate):
         option.displayAlignment = Qt.AlignmentFlag.AlignCenter
 
 
+# for showing the preview of the image in the id column
+class ThumbnailDelegate(AlignDelegate):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.__pixmaps: dict[int, QPixmap] = {}
+
+    def initStyleOption(
+        self,
+        option: QStyleOptionViewItem,
+        index: QModelIndex | QPersistentModelIndex,
+    ):
+        super().initStyleOption(option, index)
+        pixmap = self.__getPixmap(index.data())
+        if pixmap is not None:
+            option.features |= QStyleOptionViewItem.ViewItemFeature.HasDecoration
+            option.icon = QIcon(pixmap)
+            option.decorationSize = QSize(IMAGE_THUMBNAIL_SIZES[0], IMAGE_THUMBNAIL_SIZES[0])
+
+    def __getPixmap(self, id) -> QPixmap | None:
+        if id not in self.__pixmaps:
+            data = DB.selectImageThumbnail(id, IMAGE_THUMBNAIL_SIZES[0])
+            # Not cached until the preview is made
+            if data is None:
+                return None
+            pixmap = QPixmap()
+            pixmap.loadFromData(data)
+            self.__pixmaps[id] = pixmap
+        return self.__pixmaps[id]
+
+
 class SqlTableModel(QSqlTableModel):
     added = Signal(int, str)
     updated = Signal(int, str)
@@ -81,9 +113,16 @@ class ImageNavWidget(BaseNavWidget):
         menuWidget = QWidget()
         menuWidget.setLayout(lay)
 
-        self._tableView.activated.connect(self.__clicked)
+        # Show the preview when clicked, and the original image when activated (e.g. double-clicked)
+        self._tableView.activated.connect(self.__activated)
         self._tableView.clicked.connect(self.__clicked)
 
+        self._tableView.setItemDelegateForColumn(0, ThumbnailDelegate(self))
+        self._tableView.verticalHeader().setDefaultSectionSize(IMAGE_THUMBNAIL_SIZES[0])
+
+        # Make the previews of the images which don't have them yet
+        generate_image_thumbnails().progressUpdated.connect(lambda _: self._tableView.viewport().update())
+
         lay = QVBoxLayout()
         lay.addWidget(imageGenerationHistoryLbl)
         lay.addWidget(menuWidget)
@@ -103,18 +142,40 @@ class ImageNavWidget(BaseNavWidget):
     def refresh(self):
         self._model.select()
 
-    def __clicked(
+    def __getId(
         self,
         idx: QModelIndex,
-    ):
+    ) -> int:
         # get the source index
         source_idx: QModelIndex = self._proxyModel.mapToSource(idx)
 
         # get the primary key value of the row
-        cur_id: int = self._model.record(source_idx.row()).value("id")
+        return self._model.record(source_idx.row()).value("id")
 
+    def __clicked(
+        self,
+        idx: QModelIndex,
+    ):
+        cur_id: int = self.__getId(idx)
+        data: bytes | None = DB.selectImageThumbnail(cur_id, IMAGE_THUMBNAIL_SIZES[-1])
+        if data:
+            self.getContent.emit(data)
+        else:
+            # The preview is not made yet
+            self.__showImage(cur_id)
+
+    def __activated(
+        self,
+        idx: QModelIndex,
+    ):
+        self.__showImage(self.__getId(idx))
+
+    def __showImage(
+        self,
+        cur_id: int,
+    ):
         # Get data from DB id
-        data: bytes | str = DB.selectCertainImage(cur_id)["data"]
+        data: bytes | str | None = DB.selectImageData(cur_id)
         if data:
             if isinstance(data, str):
                 QMessageBox.critical(
@@ -127,7 +188,6 @@ class ImageNavWidget(BaseNavWidget):
                     QMessageBox.StandardButton.No,
                 )
             else:
-                data = QByteArray(data).data()
                 self.getContent.emit(data)
         else:
             QMessageBox.critical(
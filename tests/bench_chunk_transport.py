@@ -0,0 +1,99 @@
+"""Measure the load of the streamed chunks on the event loop of the UI, with and without ChunkBuffer.
+
+A worker thread makes the chunks of a simulated stream at a fixed rate and sends them to an object in the main thread
+with a queued signal, like LlamaIndexThread and the chat engine do.
+"before" sends a signal for each chunk, "after" collects them in ChunkBuffer and sends them once per frame.
+
+Run it from the root of the repository (it's not collected by pytest):
+
+    python -m tests.bench_chunk_transport --rate 250 --seconds 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from qtpy.QtCore import QCoreApplication, QObject, QThread, Signal
+
+from pyqt_openai.util.chunk_buffer import ChunkBuffer
+
+
+class StreamThread(QThread):
+    replyGenerated = Signal(str)
+
+    def __init__(self, chunks, rate, use_buffer):
+        super().__init__()
+        self.__chunks = chunks
+        self.__rate = rate
+        self.__use_buffer = use_buffer
+
+    def run(self):
+        chunk_buffer = ChunkBuffer()
+        start = time.perf_counter()
+        for i, chunk in enumerate(self.__chunks):
+            # Keep the rate of the stream no matter how long the emission takes
+            delay = start + i / self.__rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if self.__use_buffer:
+                chunk_buffer.add(chunk)
+                if chunk_buffer.is_due():
+                    self.replyGenerated.emit(chunk_buffer.flush())
+            else:
+                self.replyGenerated.emit(chunk)
+        if not chunk_buffer.is_empty():
+            self.replyGenerated.emit(chunk_buffer.flush())
+
+
+class Receiver(QObject):
+    """Stand-in for the chat browser, which counts the signals and the time spent on them in the event loop."""
+
+    def __init__(self):
+        super().__init__()
+        self.emissions = 0
+        self.busy_seconds = 0.0
+        self.__text = []
+
+    def addText(self, text):
+        start = time.perf_counter()
+        self.emissions += 1
+        self.__text.append(text)
+        self.busy_seconds += time.perf_counter() - start
+
+    def getText(self):
+        return "".join(self.__text)
+
+
+def run(app, chunks, rate, use_buffer):
+    receiver = Receiver()
+    t = StreamThread(chunks, rate, use_buffer)
+    t.replyGenerated.connect(receiver.addText)
+    t.finished.connect(app.quit)
+    start = time.perf_counter()
+    t.start()
+    app.exec()
+    t.wait()
+    return receiver, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=int, default=250, help="The chunks (tokens) of the stream per second")
+    parser.add_argument("--seconds", type=float, default=3, help="The length of the stream")
+    args = parser.parse_args()
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    chunks = [f"token{i} " for i in range(int(args.rate * args.seconds))]
+    expected = "".join(chunks)
+
+    print(f"{len(chunks)} chunks at {args.rate} chunks/s")
+    print(f"{'':<8}{'emissions':>10}{'emissions/s':>14}{'UI ms':>8}")
+    for name, use_buffer in (("before", False), ("after", True)):
+        receiver, seconds = run(app, chunks, args.rate, use_buffer)
+        assert receiver.getText() == expected, "The chunks are not reassembled in order"
+        print(f"{name:<8}{receiver.emissions:>10}{receiver.emissions / seconds:>14.0f}{receiver.busy_seconds * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import pytest
+
+from pyqt_openai import sqlite
+from pyqt_openai.models import ChatMessageContainer
+from pyqt_openai.sqlite import SqliteDatabase
+
+
+@pytest.fixture
+def make_db(tmp_path, monkeypatch):
+    """Return the function which opens the database in the temporary directory (the blob store is also made there)."""
+    monkeypatch.setattr(sqlite, "get_config_directory", lambda: str(tmp_path))
+    dbs = []
+
+    def make(wal_mode=False, use_blob_store=False, archive_threads=False, filename="conv.db"):
+        db = SqliteDatabase(str(tmp_path / filename), wal_mode=wal_mode, use_blob_store=use_blob_store, archive_threads=archive_threads)
+        dbs.append(db)
+        return db
+
+    yield make
+    for db in dbs:
+        db.close()
+
+
+@pytest.fixture(params=[False, True], ids=["default", "wal"])
+def db(request, make_db):
+    """The database with the archive, with and without WAL mode."""
+    return make_db(wal_mode=request.param, archive_threads=True)
+
+
+@pytest.fixture
+def insert_messages():
+    """Return the function which inserts the messages to the thread and returns their ids."""
+
+    def insert(db, thread_id, count, **kwargs):
+        return [
+            db.insertMessage(
+                ChatMessageContainer(thread_id=thread_id, role="user" if i % 2 == 0 else "assistant", content=f"message {i}", **kwargs),
+            )
+            for i in range(count)
+        ]
+
+    return insert
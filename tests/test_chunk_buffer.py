@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import time
+
+from pyqt_openai import CHUNK_FLUSH_MAX_CHARS
+from pyqt_openai.util.chunk_buffer import ChunkBuffer
+
+
+def test_first_chunk_is_due():
+    buffer = ChunkBuffer(interval=60)
+    assert buffer.is_empty()
+    assert not buffer.is_due()
+
+    buffer.add("Hello")
+    assert not buffer.is_empty()
+    assert buffer.is_due()
+
+
+def test_empty_chunk_is_ignored():
+    buffer = ChunkBuffer(interval=60)
+    buffer.add("")
+    assert buffer.is_empty()
+    assert not buffer.is_due()
+
+
+def test_flush_joins_chunks_in_order():
+    buffer = ChunkBuffer(interval=60)
+    for chunk in ["```python\n", "print(1)", "\n```"]:
+        buffer.add(chunk)
+
+    assert buffer.flush() == "```python\nprint(1)\n```"
+    assert buffer.is_empty()
+    assert buffer.flush() == ""
+
+
+def test_chunks_wait_for_interval_after_flush():
+    buffer = ChunkBuffer(interval=0.05)
+    buffer.add("a")
+    buffer.flush()
+
+    buffer.add("b")
+    assert not buffer.is_due()
+    assert 0 < buffer.get_delay() <= 0.05
+
+    time.sleep(0.06)
+    assert buffer.get_delay() == 0.0
+    assert buffer.is_due()
+    assert buffer.flush() == "b"
+
+
+def test_max_size_is_due_before_interval():
+    buffer = ChunkBuffer(interval=60)
+    buffer.add("a")
+    buffer.flush()
+
+    buffer.add("x" * (CHUNK_FLUSH_MAX_CHARS - 1))
+    assert not buffer.is_due()
+    buffer.add("x")
+    assert buffer.get_delay() == 0.0
+    assert buffer.is_due()
+    assert len(buffer.flush()) == CHUNK_FLUSH_MAX_CHARS
+    # The size is counted again from the flush
+    buffer.add("y")
+    assert not buffer.is_due()
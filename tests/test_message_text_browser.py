@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+
+pytest.importorskip("qtpy")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from qtpy.QtWidgets import QApplication  # noqa: E402
+
+from pyqt_openai.chat_widget.center.messageTextBrowser import MessageTextBrowser  # noqa: E402
+
+REPLY = (
+    "Here is the code:\n\n"
+    "```python\n"
+    "def add(a, b):\n"
+    "    # *not* emphasis, <b>not</b> HTML\n"
+    "\n"
+    "    return a  +  b\t# tab\n"
+    "```\n\n"
+    "- item 1\n"
+    "- item 2\n\n"
+    "| a | b |\n|---|---|\n| 1 | 2 |\n"
+)
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def get_chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 4, 17])
+def test_streamed_markdown_is_kept_as_it_is(app, size):
+    browser = MessageTextBrowser()
+    chunks = get_chunks(REPLY, size)
+    browser.setText(chunks[0])
+    for chunk in chunks[1:]:
+        browser.addMarkdown(chunk)
+
+    assert browser.getSourceText() == REPLY
+    # What's shown is not the markdown itself
+    assert browser.toPlainText() != REPLY
+
+
+def test_streamed_plain_text_is_kept_as_it_is(app):
+    browser = MessageTextBrowser()
+    chunks = get_chunks(REPLY, 5)
+    browser.setText(chunks[0])
+    for chunk in chunks[1:]:
+        browser.addPlainText(chunk)
+
+    assert browser.getSourceText() == REPLY
+
+
+def test_set_markdown_replaces_streamed_text(app):
+    browser = MessageTextBrowser()
+    browser.setText("old")
+    browser.addMarkdown(" reply")
+
+    browser.setMarkdown(REPLY)
+    assert browser.getSourceText() == REPLY
+    browser.addMarkdown("more")
+    assert browser.getSourceText() == REPLY + "more"
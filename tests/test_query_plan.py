@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import pytest
+
+from pyqt_openai import (
+    MESSAGE_ARCHIVE_THREAD_ID_INDEX_NAME,
+    MESSAGE_FAVORITE_INDEX_NAME,
+    MESSAGE_THREAD_ID_INDEX_NAME,
+    MESSAGE_TOKEN_COUNT_INDEX_NAME,
+    THREAD_TABLE_NAME,
+    THREAD_UPDATE_DT_INDEX_NAME,
+)
+from pyqt_openai.models import ChatMessageContainer
+
+THREAD_COUNT = 200
+MESSAGE_COUNT = 20
+
+
+@pytest.fixture
+def seeded_db(db):
+    thread_ids = db.importThreads(
+        {
+            "name": f"thread {i}",
+            "insert_dt": "2020-01-01 00:00:00",
+            "update_dt": f"2020-01-01 00:{i // 60:02}:{i % 60:02}",
+            "messages": [{"role": "user", "content": f"message {j} of thread {i}"} for j in range(MESSAGE_COUNT)],
+        }
+        for i in range(THREAD_COUNT)
+    )
+    # A few favorite messages
+    for thread_id in thread_ids[:5]:
+        db.updateMessage(db.selectMessagesPage(thread_id, limit=1)[0].id, 1)
+    db.getCursor().execute("ANALYZE")
+    return db
+
+
+def get_query_plans(db, func):
+    """Run func and return the plans of the SELECT queries which it ran with the connection of this thread."""
+    conn = db.getCursor().connection
+    queries = []
+    conn.set_trace_callback(queries.append)
+    try:
+        func()
+    finally:
+        conn.set_trace_callback(None)
+    return [
+        row["detail"]
+        for query in queries
+        if query.lstrip().upper().startswith("SELECT")
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {query}")
+    ]
+
+
+def assert_uses_index(plan, *index_names):
+    for index_name in index_names:
+        assert any(index_name in detail for detail in plan), plan
+    for detail in plan:
+        assert "USE TEMP B-TREE" not in detail, plan
+        # Reading the whole list in order is the scan of the index, never the scan of the table
+        assert not detail.startswith("SCAN") or "INDEX" in detail, plan
+
+
+def test_messages_page_uses_thread_id_index(seeded_db):
+    thread_id = seeded_db.selectAllThread()[-1]["id"]
+    page = []
+    plan = get_query_plans(seeded_db, lambda: page.extend(seeded_db.selectMessagesPage(thread_id, limit=5)))
+    assert_uses_index(plan, MESSAGE_THREAD_ID_INDEX_NAME)
+    plan = get_query_plans(seeded_db, lambda: seeded_db.selectMessagesPage(thread_id, before_id=page[0].id, limit=5))
+    assert_uses_index(plan, MESSAGE_THREAD_ID_INDEX_NAME)
+
+
+def test_messages_page_of_archived_thread_uses_both_indexes(seeded_db):
+    thread_id = seeded_db.selectAllThread()[-1]["id"]
+    assert seeded_db.archiveOldThreads(30) > 0
+    seeded_db.insertMessage(ChatMessageContainer(thread_id=thread_id, role="user", content="new message"))
+    plan = get_query_plans(seeded_db, lambda: seeded_db.selectMessagesPage(thread_id, limit=5))
+    assert_uses_index(plan, MESSAGE_THREAD_ID_INDEX_NAME, MESSAGE_ARCHIVE_THREAD_ID_INDEX_NAME)
+
+
+def test_thread_list_order_uses_update_dt_index(seeded_db):
+    # The clause of QSqlTableModel sorted by update_dt
+    query = seeded_db.getThreadListQuery(order_by=f'ORDER BY "{THREAD_TABLE_NAME}"."update_dt" DESC')
+    plan = get_query_plans(seeded_db, lambda: seeded_db.getCursor().execute(query).fetchmany(50))
+    assert_uses_index(plan, THREAD_UPDATE_DT_INDEX_NAME)
+
+
+def test_favorite_selection_uses_favorite_index(seeded_db):
+    favorites = []
+    plan = get_query_plans(seeded_db, lambda: favorites.extend(seeded_db.selectFavorite()))
+    assert len(favorites) == 5
+    assert_uses_index(plan, MESSAGE_FAVORITE_INDEX_NAME)
+
+
+def test_counted_messages_are_not_scanned(seeded_db):
+    counts = []
+    plan = get_query_plans(seeded_db, lambda: counts.append(seeded_db.countMessageTokens()))
+    assert counts == [0]
+    assert_uses_index(plan, MESSAGE_TOKEN_COUNT_INDEX_NAME)
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+
+from pyqt_openai import (
+    IMAGE_BLOB_STORE_DIR_NAME,
+    MESSAGE_FTS_TABLE_NAME,
+    MESSAGE_TABLE_NAME,
+    THREAD_MESSAGE_UPDATED_TR_NAME,
+    TRIGGER_GUARD_TABLE_NAME,
+)
+from pyqt_openai.models import ChatMessageContainer, ImagePromptContainer
+from pyqt_openai.util.token_counter import count_message_tokens
+
+OLD_DATE = "2020-01-01 00:00:00"
+
+
+def get_old_thread(name="old", message_count=3):
+    return {
+        "name": name,
+        "insert_dt": OLD_DATE,
+        "update_dt": OLD_DATE,
+        "messages": [{"role": "user", "content": f"old message {i}"} for i in range(message_count)],
+    }
+
+
+def get_traced_statements(monkeypatch):
+    """Record the statements of every connection made from now on."""
+    statements = []
+    connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(sqlite3, "connect", traced_connect)
+    return statements
+
+
+def get_schema_version(db):
+    return db.getCursor().execute("PRAGMA schema_version").fetchone()[0]
+
+
+def test_suspended_triggers_keep_schema(db, insert_messages):
+    thread_id = db.insertThread("thread")
+    insert_messages(db, thread_id, 2)
+    schema_version = get_schema_version(db)
+
+    [imported_id] = db.importThreads([get_old_thread()])
+    db.insertMessage(ChatMessageContainer(thread_id=imported_id, role="user", content="quiet"), deactivate_trigger=True)
+    db.archiveOldThreads(30)
+
+    assert get_schema_version(db) == schema_version
+    assert db.selectThread(imported_id)["update_dt"] == OLD_DATE
+    assert db.getCursor().execute(f"SELECT count(*) FROM {TRIGGER_GUARD_TABLE_NAME}").fetchone()[0] == 0
+
+
+def test_delete_thread_after_import(db, insert_messages):
+    thread_id = db.insertThread("thread")
+    insert_messages(db, thread_id, 3)
+    # The connection of this thread reads before the other connection writes
+    assert len(db.selectCertainThreadMessages(thread_id)) == 3
+
+    [imported_id] = db.importThreads([get_old_thread()])
+    db.deleteThread(imported_id)
+    db.deleteThread(thread_id)
+
+    assert db.selectAllThread() == []
+    assert db.searchMessages("message") == []
+
+
+def test_archive_and_restore_keep_statistics(db):
+    [thread_id] = db.importThreads([get_old_thread()])
+    assert db.archiveOldThreads(30) == 1
+
+    thread = db.selectAllThread([thread_id])[0]
+    assert thread["message_count"] == 3
+    assert thread["update_dt"] == OLD_DATE
+
+    messages = db.selectCertainThreadMessages(thread_id)
+    assert [message.content for message in messages] == [f"old message {i}" for i in range(3)]
+
+    # Setting the favorite brings the thread back from the archive
+    db.updateMessage(messages[0].id, 1)
+    assert db.selectAllThread([thread_id])[0]["message_count"] == 3
+    assert db.getCursor().execute(
+        f"SELECT count(*) FROM {MESSAGE_TABLE_NAME} WHERE thread_id = ?", (thread_id,),
+    ).fetchone()[0] == 3
+
+
+def test_search_threads(db, insert_messages):
+    first_id = db.insertThread("first")
+    second_id = db.insertThread("second")
+    insert_messages(db, first_id, 3)
+    db.insertMessage(ChatMessageContainer(thread_id=second_id, role="user", content="nothing here"))
+
+    # Full-text index and the LIKE fallback for the text shorter than a trigram
+    assert db.searchThreads("message") == [first_id]
+    assert sorted(db.searchThreads("e")) == [first_id, second_id]
+    assert len(db.searchThreads("e", limit=1)) == 1
+    assert db.searchThreads("missing") == []
+
+
+def test_search_archived_thread(db, insert_messages):
+    deleted_thread = {**get_old_thread("deleted", 0), "messages": [{"role": "user", "content": "deleted message"}]}
+    archived_id, deleted_id = db.importThreads([get_old_thread(), deleted_thread])
+    thread_id = db.insertThread("thread")
+    insert_messages(db, thread_id, 2)
+    db.archiveOldThreads(30)
+
+    # Full-text index and the LIKE fallback for the text shorter than a trigram
+    assert db.searchThreads("old message 1") == [archived_id]
+    assert sorted(db.searchThreads("1")) == sorted([archived_id, thread_id])
+    [row] = db.searchMessages("old message 1")
+    assert row["thread_id"] == archived_id
+    assert "old message 1" in row["snippet"]
+    assert [row["thread_id"] for row in db.searchMessages("2")] == [archived_id]
+    [(found_id, messages)] = db.selectAllContentOfThread("old message 2")
+    assert found_id == archived_id
+    assert [message.content for message in messages] == ["old message 2"]
+
+    # Restoring the thread doesn't index its messages twice
+    db.updateMessage(row["message_id"], 1)
+    assert len(db.searchMessages("old message 1")) == 1
+
+    # The archived messages are removed from the index with their thread
+    assert db.searchThreads("deleted message") == [deleted_id]
+    db.deleteThread(deleted_id)
+    assert db.searchThreads("deleted message") == []
+    assert db.searchMessages("deleted message") == []
+    assert db.getCursor().execute(
+        f"SELECT count(*) FROM {MESSAGE_FTS_TABLE_NAME} WHERE {MESSAGE_FTS_TABLE_NAME} MATCH '\"deleted message\"'",
+    ).fetchone()[0] == 0
+
+
+def test_shared_blob_is_removed_with_the_last_image(make_db, tmp_path):
+    db = make_db(wal_mode=True, use_blob_store=True)
+    data = b"\x89PNG image data"
+    first_id = db.insertImage(ImagePromptContainer(prompt="first", data=data))
+    second_id = db.insertImage(ImagePromptContainer(prompt="second", data=data))
+    data_hash = db.selectCertainImage(first_id)["data_hash"]
+    assert db.selectCertainImage(second_id)["data_hash"] == data_hash
+
+    blob_path = tmp_path / IMAGE_BLOB_STORE_DIR_NAME / data_hash[:2] / data_hash
+
+    db.removeImage(first_id)
+    assert db.selectImageData(second_id) == data
+    db.removeImage(second_id)
+    assert not blob_path.exists()
+
+
+def test_migrate_image_data_to_blob_store(make_db):
+    make_db(use_blob_store=False).insertImage(ImagePromptContainer(prompt="image", data=b"\x89PNG image data"))
+    db = make_db(wal_mode=True, use_blob_store=True)
+
+    assert db.migrateImageDataToBlobStore() == 1
+    assert db.migrateImageDataToBlobStore() == 0
+    image = db.selectImage()[0]
+    assert image["data"] is None
+    assert image["data_hash"]
+    assert db.selectImageData(image["id"]) == b"\x89PNG image data"
+
+
+def test_generate_image_thumbnails(make_db):
+    db = make_db(wal_mode=True, use_blob_store=True)
+    ids = [db.insertImage(ImagePromptContainer(prompt=f"image {i}", data=f"image {i}".encode())) for i in range(3)]
+
+    assert db.generateImageThumbnails(lambda data, size: data[:size], sizes=(1, 3), batch_size=2) == 2
+    assert db.generateImageThumbnails(lambda data, size: data[:size], sizes=(1, 3), batch_size=2) == 1
+    assert db.generateImageThumbnails(lambda data, size: data[:size], sizes=(1, 3), batch_size=2) == 0
+    assert db.selectImageThumbnail(ids[2], 3) == b"ima"
+
+
+def test_thread_without_usage_has_zero_tokens(db):
+    thread_id = db.insertThread("thread")
+    # The user's message has no usage, so its total_tokens is ''
+    message_id = db.insertMessage(ChatMessageContainer(thread_id=thread_id, role="user", content="hello"))
+
+    thread = db.selectAllThread([thread_id])[0]
+    assert thread["message_count"] == 1
+    assert thread["total_tokens"] == 0
+
+    db.insertMessage(ChatMessageContainer(thread_id=thread_id, role="assistant", content="hi", total_tokens=12))
+    assert db.selectAllThread([thread_id])[0]["total_tokens"] == 12
+    db.getCursor().execute(f"DELETE FROM {MESSAGE_TABLE_NAME} WHERE id = ?", (message_id,))
+    assert db.selectAllThread([thread_id])[0]["total_tokens"] == 12
+
+
+def test_count_message_tokens(db):
+    [thread_id] = db.importThreads([get_old_thread(message_count=5)])
+    c = db.getCursor()
+    # As the messages saved before the token count is kept, without updating the thread
+    c.execute(f"INSERT INTO {TRIGGER_GUARD_TABLE_NAME} VALUES (?)", (THREAD_MESSAGE_UPDATED_TR_NAME,))
+    c.execute(f"UPDATE {MESSAGE_TABLE_NAME} SET token_count = NULL")
+    c.execute(f"DELETE FROM {TRIGGER_GUARD_TABLE_NAME}")
+    c.connection.commit()
+
+    counts = []
+    while count := db.countMessageTokens(batch_size=2):
+        counts.append(count)
+
+    assert counts == [2, 2, 1]
+    assert [message.token_count for message in db.selectCertainThreadMessages(thread_id)] == [
+        count_message_tokens(f"old message {i}") for i in range(5)
+    ]
+    assert db.selectThread(thread_id)["update_dt"] == OLD_DATE
+
+
+def test_messages_of_archived_thread(db):
+    [thread_id] = db.importThreads([get_old_thread(message_count=10)])
+    assert db.archiveOldThreads(30) == 1
+
+    page = db.selectMessagesPage(thread_id, limit=4)
+    assert [message.content for message in page] == [f"old message {i}" for i in range(6, 10)]
+    page = db.selectMessagesPage(thread_id, before_id=page[0].id, limit=4)
+    assert [message.content for message in page] == [f"old message {i}" for i in range(2, 6)]
+
+    assert len(db.selectContextMessages(thread_id, token_budget=10**6)) == 10
+    assert [message.content for message in db.selectCertainThreadMessages(thread_id, content_to_select="MESSAGE 3")] == ["old message 3"]
+
+
+def test_new_message_of_archived_thread(db):
+    [thread_id] = db.importThreads([get_old_thread(message_count=5)])
+    db.archiveOldThreads(30)
+    # The archived messages have the latest ids, which the message table alone would give again
+    new_id = db.insertMessage(ChatMessageContainer(thread_id=thread_id, role="user", content="new message"))
+
+    messages = db.selectCertainThreadMessages(thread_id)
+    assert messages[-1].id == new_id
+    assert len({message.id for message in messages}) == 6
+    assert [message.content for message in db.selectMessagesPage(thread_id, limit=2)] == ["old message 4", "new message"]
+
+    db.updateMessage(messages[0].id, 1)
+    assert len(db.selectCertainThreadMessages(thread_id)) == 6
+
+
+def test_open_up_to_date_database(make_db, monkeypatch):
+    db = make_db()
+    db.importThreads(get_old_thread(f"thread {i}", message_count=20) for i in range(500))
+    db.close()
+
+    statements = get_traced_statements(monkeypatch)
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        make_db().close()
+        timings.append(time.perf_counter() - start)
+    print(f"Opening the up-to-date database took {min(timings) * 1000:.1f}ms")
+
+    # No migration runs, only the schema version is read
+    assert "PRAGMA user_version" in statements
+    assert not [statement for statement in statements if statement.lstrip().upper().startswith(("CREATE", "ALTER", "DROP", "INSERT", "UPDATE", "DELETE"))]
+    assert min(timings) < 0.2